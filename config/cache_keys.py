@@ -0,0 +1,11 @@
+from django.db import connection
+
+
+def database_key(key, key_prefix, version):
+    """Cle de cache prefixee par la base courante.
+
+    Le cache est partage par tous les processus du meme hote : une copie de
+    la base (bench_startup, SQLITE_PATH) ou la base de test ne doit pas lire
+    les versions et compteurs de la base de production.
+    """
+    return f"{connection.settings_dict['NAME']}:{key_prefix}:{version}:{key}"
@@ -4,10 +4,13 @@ Django settings for config project.
 
 import os
 import importlib.util
+import tempfile
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 HAS_WHITENOISE = importlib.util.find_spec("whitenoise") is not None
+HAS_PROMETHEUS = importlib.util.find_spec("prometheus_client") is not None
+HAS_REDIS = importlib.util.find_spec("redis") is not None
 
 
 def env_bool(name: str, default: bool = False) -> bool:
@@ -43,11 +46,15 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 if HAS_WHITENOISE:
     MIDDLEWARE.insert(1, "whitenoise.middleware.WhiteNoiseMiddleware")
+if HAS_PROMETHEUS:
+    # Apres WhiteNoise : les fichiers statiques ne sont pas mesures.
+    MIDDLEWARE.insert(2 if HAS_WHITENOISE else 1, "core.metrics.MetricsMiddleware")
 
 ROOT_URLCONF = "config.urls"
 
@@ -55,8 +62,19 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [BASE_DIR / "templates"],
-        "APP_DIRS": True,
         "OPTIONS": {
+            # Templates compiles une fois par processus (et, sous gunicorn
+            # --preload, une fois dans le master : voir core/warmup.py).
+            # Le rechargement en DEBUG vide ce cache quand un fichier change.
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
+            ],
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
@@ -71,11 +89,43 @@ WSGI_APPLICATION = "config.wsgi.application"
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        # SQLITE_PATH : autre fichier (copie temporaire de bench_startup).
+        "NAME": os.getenv("SQLITE_PATH") or BASE_DIR / "db.sqlite3",
+        # SQLite n'a qu'un verrou d'ecriture : une ecriture l'attend jusqu'a
+        # 20 s au lieu d'echouer en "database is locked". Seules les
+        # transactions qui lisent avant d'ecrire le prennent des le BEGIN
+        # (core/transactions.py) ; les autres restent DEFERRED.
+        "OPTIONS": {
+            "timeout": 20,
+        },
     }
 }
 
 
+# Cache partage par tous les workers gunicorn : version des donnees et du
+# catalogue (core/data_version.py), compteurs et resumes du tableau de bord.
+# Avec REDIS_URL (et le paquet redis) : Redis ; sinon fichiers sur disque,
+# partages par les processus d'un meme hote. Les cles sont prefixees par la
+# base (config/cache_keys.py).
+CACHE_DIR = Path(os.getenv("CACHE_DIR", Path(tempfile.gettempdir()) / "lab-stock-cache"))
+REDIS_URL = os.getenv("REDIS_URL", "")
+if REDIS_URL and HAS_REDIS:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+            "KEY_FUNCTION": "config.cache_keys.database_key",
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": CACHE_DIR,
+            "KEY_FUNCTION": "config.cache_keys.database_key",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
 
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -97,6 +147,58 @@ if HAS_WHITENOISE:
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Suggestions de commande (delai fournisseur et fenetre de consommation, en jours)
+REORDER_LEAD_TIME_DAYS = int(os.getenv("REORDER_LEAD_TIME_DAYS", "14"))
+REORDER_WINDOW_DAYS = int(os.getenv("REORDER_WINDOW_DAYS", "30"))
+
+# Profilage des requetes (en-tete X-Profile: 1 ou ?profile=1 pour le staff,
+# ou echantillonnage d'un pourcentage des requetes) ; voir profile_report.
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", "0"))
+PROFILING_DIR = Path(os.getenv("PROFILING_DIR", BASE_DIR / "profiles"))
+PROFILING_MAX_FILES_PER_VIEW = int(os.getenv("PROFILING_MAX_FILES_PER_VIEW", "50"))
+PROFILING_MAX_MB = int(os.getenv("PROFILING_MAX_MB", "200"))
+
+# Jeton (Authorization: Bearer ...) du scraper Prometheus pour /metrics/ ;
+# sans jeton, l'endpoint est reserve au staff (ou ouvert en DEBUG).
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Jeton (Authorization: Bearer ...) de l'API JSON /api/ ; sans jeton, l'API
+# est ouverte comme les pages HTML. Les utilisateurs connectes y ont acces.
+API_TOKEN = os.getenv("API_TOKEN", "")
+
+# Digest des alertes (commande alert_digest) : un e-mail par famille aux
+# destinataires ci-dessous. Sans EMAIL_HOST, les e-mails sont ecrits dans
+# EMAIL_FILE_PATH (un fichier par envoi) au lieu de partir en SMTP.
+ALERT_DIGEST_RECIPIENTS = [
+    address.strip()
+    for address in os.getenv("ALERT_DIGEST_RECIPIENTS", "").split(",")
+    if address.strip()
+]
+EMAIL_HOST = os.getenv("EMAIL_HOST", "")
+EMAIL_PORT = int(os.getenv("EMAIL_PORT", "587"))
+EMAIL_HOST_USER = os.getenv("EMAIL_HOST_USER", "")
+EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD", "")
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "true").lower() == "true"
+EMAIL_BACKEND = (
+    "django.core.mail.backends.smtp.EmailBackend"
+    if EMAIL_HOST
+    else "django.core.mail.backends.filebased.EmailBackend"
+)
+EMAIL_FILE_PATH = Path(os.getenv("EMAIL_FILE_PATH", BASE_DIR / "sent_emails"))
+DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "lab-stock@localhost")
+EMAIL_SUBJECT_PREFIX = "[Lab Stock] "
+
+# Les erreurs 500 (ex. "database is locked") partent sur la sortie d'erreur,
+# meme sans DEBUG : logs de l'hebergeur et compteur de bench_stations.
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "django.request": {"handlers": ["console"], "level": "ERROR", "propagate": False},
+    },
+}
+
 if not DEBUG:
     SECURE_PROXY_SSL_HEADER = ("HTTP_X_FORWARDED_PROTO", "https")
     SESSION_COOKIE_SECURE = True
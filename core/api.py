@@ -0,0 +1,232 @@
+import base64
+import binascii
+from datetime import date, datetime, time
+
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Famille, Lot, Produit, Sort
+from .stock_status import with_stock_status
+
+
+# API JSON en lecture seule pour les integrations (LIMS, tableurs, scanner
+# mobile), a la place du scraping des pages HTML.
+#
+# Pagination par curseur sur l'id (cle primaire, pas d'OFFSET) : une page est
+# une seule requete values_list() ... LIMIT n + 1, quels que soient la taille
+# de page et les champs demandes (les champs lies sont des jointures, le stock
+# une sous-requete). ?updated_since= filtre sur modifie_le (cree_le pour les
+# sorties, qui ne sont jamais modifiees) ; les suppressions et archivages ne
+# sont pas signales.
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+def _produits_expiring(queryset, after, before):
+    lots = Lot.objects.filter(produit=OuterRef("pk"), quantite__gt=0)
+    if after:
+        lots = lots.filter(date_fin__gte=after)
+    if before:
+        lots = lots.filter(date_fin__lte=before)
+    return queryset.filter(Exists(lots))
+
+
+def _lots_expiring(queryset, after, before):
+    if after:
+        queryset = queryset.filter(date_fin__gte=after)
+    if before:
+        queryset = queryset.filter(date_fin__lte=before)
+    return queryset
+
+
+# Par ressource : champ JSON -> chemin ORM, champs par defaut, et chemins des
+# filtres (None : filtre refuse).
+RESOURCES = {
+    "produits": {
+        "queryset": lambda: Produit.objects.all(),
+        "fields": {
+            "id": "id",
+            "reference": "reference",
+            "nom": "nom",
+            "barcode": "barcode",
+            "famille": "famille_id",
+            "famille_nom": "famille__nom",
+            "nbr_days_alert": "nbr_days_alert",
+            "nbr_qnt_alert": "nbr_qnt_alert",
+            "stock": "stock_total",
+            "modifie_le": "modifie_le",
+        },
+        "default": ("id", "reference", "nom", "barcode", "famille", "nbr_days_alert", "nbr_qnt_alert", "modifie_le"),
+        "famille": "famille_id",
+        "site": None,
+        "expiry": _produits_expiring,
+        "updated": "modifie_le",
+    },
+    "lots": {
+        "queryset": lambda: Lot.objects.all(),
+        "fields": {
+            "id": "id",
+            "produit": "produit_id",
+            "produit_reference": "produit__reference",
+            "site": "site_id",
+            "site_nom": "site__nom",
+            "quantite": "quantite",
+            "quantite_initiale": "quantite_initiale",
+            "date_entree": "date_entree",
+            "date_fin": "date_fin",
+            "modifie_le": "modifie_le",
+        },
+        "default": ("id", "produit", "site", "quantite", "quantite_initiale", "date_entree", "date_fin", "modifie_le"),
+        "famille": "produit__famille_id",
+        "site": "site_id",
+        "expiry": _lots_expiring,
+        "updated": "modifie_le",
+    },
+    "sorties": {
+        "queryset": lambda: Sort.objects.all(),
+        "fields": {
+            "id": "id",
+            "produit": "produit_id",
+            "produit_reference": "produit__reference",
+            "site": "site_id",
+            "site_nom": "site__nom",
+            "quantite": "quantite",
+            "date_sortie": "date_sortie",
+            "cree_le": "cree_le",
+        },
+        "default": ("id", "produit", "site", "quantite", "date_sortie", "cree_le"),
+        "famille": "produit__famille_id",
+        "site": "site_id",
+        "expiry": None,
+        "updated": "cree_le",
+    },
+    "familles": {
+        "queryset": lambda: Famille.objects.all(),
+        "fields": {"id": "id", "nom": "nom", "modifie_le": "modifie_le"},
+        "default": ("id", "nom", "modifie_le"),
+        "famille": None,
+        "site": None,
+        "expiry": None,
+        "updated": "modifie_le",
+    },
+}
+
+
+# Parametres de requete de chaque filtre (tous acceptent aussi cursor, limit
+# et fields).
+FILTER_PARAMS = {
+    "famille": ("famille",),
+    "site": ("site",),
+    "expiry": ("expire_after", "expire_before"),
+    "updated": ("updated_since",),
+}
+
+
+def resource_filters(spec):
+    return [param for key, params in FILTER_PARAMS.items() if spec[key] is not None for param in params]
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        return int(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Parametre cursor invalide.")
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Parametre {name} invalide.")
+
+
+def _date_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Parametre {name} invalide (AAAA-MM-JJ).")
+
+
+def _datetime_param(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value) or datetime.combine(date.fromisoformat(value), time.min)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValueError(f"Parametre {name} invalide (date ou date-heure ISO 8601).")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, timezone.get_current_timezone())
+    return moment
+
+
+def _selected_fields(spec, params):
+    requested = params.get("fields")
+    if not requested:
+        return list(spec["default"])
+    names = list(dict.fromkeys(name.strip() for name in requested.split(",") if name.strip()))
+    unknown = [name for name in names if name not in spec["fields"]]
+    if unknown or not names:
+        raise ValueError(
+            f"Champ(s) inconnu(s) : {', '.join(unknown) or '-'}. "
+            f"Champs disponibles : {', '.join(spec['fields'])}."
+        )
+    return names
+
+
+def _filter_path(spec, name):
+    if spec[name] is None:
+        raise ValueError(f"Filtre {name} non disponible pour cette ressource.")
+    return spec[name]
+
+
+def api_page(resource, params):
+    """Une page de la ressource : (lignes, curseur suivant ou None).
+
+    Leve ValueError (message pour l'appelant) si un parametre est invalide.
+    """
+    spec = RESOURCES[resource]
+    limit = _int_param(params, "limit")
+    limit = DEFAULT_LIMIT if limit is None else limit
+    if not 1 <= limit <= MAX_LIMIT:
+        raise ValueError(f"Parametre limit invalide (1 a {MAX_LIMIT}).")
+    names = _selected_fields(spec, params)
+
+    queryset = spec["queryset"]()
+    if "stock" in names:
+        queryset = with_stock_status(queryset, days_left=False)
+    famille_id = _int_param(params, "famille")
+    if famille_id is not None:
+        queryset = queryset.filter(**{_filter_path(spec, "famille"): famille_id})
+    site_id = _int_param(params, "site")
+    if site_id is not None:
+        queryset = queryset.filter(**{_filter_path(spec, "site"): site_id})
+    after, before = _date_param(params, "expire_after"), _date_param(params, "expire_before")
+    if after or before:
+        queryset = _filter_path(spec, "expiry")(queryset, after, before)
+    since = _datetime_param(params, "updated_since")
+    if since is not None:
+        queryset = queryset.filter(**{f"{spec['updated']}__gte": since})
+    if params.get("cursor"):
+        queryset = queryset.filter(id__gt=decode_cursor(params["cursor"]))
+
+    # "id" toujours lu (curseur), meme s'il n'est pas demande.
+    paths = ["id"] + [spec["fields"][name] for name in names]
+    rows = list(queryset.order_by("id").values_list(*paths)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return [dict(zip(names, row[1:])) for row in rows[:limit]], next_cursor
@@ -0,0 +1,126 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .bulk_delete import purge
+from .data_version import bump_data_version
+from .models import Lot, LotArchive
+from .snapshots import record_lot_removal
+from .transactions import write_atomic
+
+
+DEFAULT_RETENTION_DAYS = 90
+DEFAULT_CHUNK_SIZE = 1000
+
+LOT_FIELDS = ("id", "produit_id", "site_id", "quantite", "quantite_initiale", "date_entree", "date_fin")
+
+
+def archivable_lots(retention_days=DEFAULT_RETENTION_DAYS, today=None):
+    """Lots epuises, ou expires depuis plus de `retention_days` jours."""
+    today = today or timezone.now().date()
+    cutoff = today - timedelta(days=retention_days)
+    return Lot.objects.filter(Q(quantite=0) | Q(date_fin__lt=cutoff))
+
+
+def archive_lots(retention_days=DEFAULT_RETENTION_DAYS, chunk_size=DEFAULT_CHUNK_SIZE,
+                 dry_run=False, on_chunk=None):
+    """Deplace les lots morts vers LotArchive, un chunk par transaction.
+
+    Chaque transaction ne verrouille que `chunk_size` lignes, les sorties
+    FEFO ne sont donc jamais bloquees longtemps. Une seule montee de version
+    de donnees est faite a la fin.
+    """
+    counts = {"epuise": 0, "expire": 0}
+    qs = archivable_lots(retention_days)
+
+    if dry_run:
+        counts["epuise"] = qs.filter(quantite=0).count()
+        counts["expire"] = qs.exclude(quantite=0).count()
+        return counts
+
+    last_id = 0
+    while True:
+        with write_atomic():
+            rows = list(
+                qs.select_for_update()
+                .filter(id__gt=last_id)
+                .order_by("id")
+                .values(*LOT_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                break
+
+            archives = []
+            for row in rows:
+                motif = LotArchive.MOTIF_EPUISE if row["quantite"] == 0 else LotArchive.MOTIF_EXPIRE
+                counts[motif] += 1
+                archives.append(
+                    LotArchive(
+                        lot_id=row["id"],
+                        produit_id=row["produit_id"],
+                        site_id=row["site_id"],
+                        quantite=row["quantite"],
+                        quantite_initiale=row["quantite_initiale"],
+                        date_entree=row["date_entree"],
+                        date_fin=row["date_fin"],
+                        motif=motif,
+                    )
+                )
+            LotArchive.objects.bulk_create(archives, ignore_conflicts=True)
+            chunk = Lot.objects.filter(id__in=[row["id"] for row in rows])
+            record_lot_removal(chunk, archived=True)
+            chunk.delete()
+            last_id = rows[-1]["id"]
+
+        if on_chunk:
+            on_chunk(counts)
+
+    if counts["epuise"] or counts["expire"]:
+        bump_data_version()
+    return counts
+
+
+def purge_expired_lots(lot_ids=None, famille_id=None, before=None, archive=True, today=None):
+    """Retire d'un coup les lots expires choisis (selection, famille ou date).
+
+    Seuls les lots deja expires (date_fin < aujourd'hui) sont touches, quel
+    que soit le filtre. Retourne (nombre de lots, quantite perdue).
+    """
+    today = today or timezone.now().date()
+    cutoff = min(before, today) if before else today
+    qs = Lot.objects.filter(date_fin__lt=cutoff)
+    if lot_ids is not None:
+        qs = qs.filter(id__in=lot_ids)
+    if famille_id:
+        qs = qs.filter(produit__famille_id=famille_id)
+
+    with write_atomic():
+        totals = qs.aggregate(count=Count("id"), quantite=Sum("quantite"))
+        if not totals["count"]:
+            return 0, 0
+
+        if archive:
+            LotArchive.objects.bulk_create(
+                (
+                    LotArchive(
+                        lot_id=row["id"],
+                        produit_id=row["produit_id"],
+                        site_id=row["site_id"],
+                        quantite=row["quantite"],
+                        quantite_initiale=row["quantite_initiale"],
+                        date_entree=row["date_entree"],
+                        date_fin=row["date_fin"],
+                        motif=LotArchive.MOTIF_EXPIRE,
+                    )
+                    for row in qs.values(*LOT_FIELDS).iterator(chunk_size=DEFAULT_CHUNK_SIZE)
+                ),
+                batch_size=DEFAULT_CHUNK_SIZE,
+                ignore_conflicts=True,
+            )
+        record_lot_removal(qs, archived=archive, today=today)
+        counts = purge(Lot, {"pk__in": qs.values("pk")})
+
+    bump_data_version()
+    return counts.get("core.Lot", 0), totals["quantite"] or 0
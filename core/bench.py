@@ -0,0 +1,183 @@
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from .models import Famille, Lot, Produit, default_site_id
+
+
+# Outils partages par les commandes bench_* : jeu de donnees synthetique
+# (insere en bulk, annule en fin de mesure), calcul des percentiles et
+# lancement d'un serveur gunicorn local.
+
+SERVERS = {
+    # Commande de start.sh avant le passage a ASGI.
+    "wsgi": ["config.wsgi:application"],
+    "asgi": ["config.asgi:application", "-k", "uvicorn_worker.UvicornWorker"],
+}
+
+
+class Rollback(Exception):
+    """Levee en fin de benchmark pour annuler le jeu de donnees synthetique."""
+
+
+def seed_synthetic(produits=1000, lots=10000, familles=10, batch_size=5000, prefix="BENCH", site_ids=None):
+    today = timezone.now().date()
+    site_ids = site_ids or [default_site_id()]
+    fams = Famille.objects.bulk_create(
+        [Famille(nom=f"{prefix}-FAM-{i:03d}") for i in range(familles)]
+    )
+    prods = []
+    for start in range(0, produits, batch_size):
+        prods.extend(
+            Produit.objects.bulk_create(
+                [
+                    Produit(
+                        reference=f"{prefix}-REF-{i:07d}",
+                        barcode=f"{prefix}{i:010d}",
+                        nom=f"{prefix} produit {i}",
+                        famille=fams[i % familles],
+                        nbr_days_alert=random.randint(7, 45),
+                        nbr_qnt_alert=random.randint(1, 20),
+                    )
+                    for i in range(start, min(start + batch_size, produits))
+                ]
+            )
+        )
+
+    for start in range(0, lots, batch_size):
+        batch = []
+        for _ in range(start, min(start + batch_size, lots)):
+            date_entree = today - timedelta(days=random.randint(0, 365))
+            quantite = random.randint(0, 120)
+            batch.append(
+                Lot(
+                    produit=random.choice(prods),
+                    site_id=random.choice(site_ids),
+                    quantite=quantite,
+                    quantite_initiale=quantite,
+                    date_entree=date_entree,
+                    date_fin=date_entree + timedelta(days=random.randint(10, 540)),
+                )
+            )
+        Lot.objects.bulk_create(batch)
+    return prods
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * pct / 100.0
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def summarize(samples_ms):
+    return {
+        "count": len(samples_ms),
+        "mean": sum(samples_ms) / len(samples_ms) if samples_ms else 0.0,
+        "p50": percentile(samples_ms, 50),
+        "p95": percentile(samples_ms, 95),
+        "p99": percentile(samples_ms, 99),
+        "max": max(samples_ms) if samples_ms else 0.0,
+    }
+
+
+def format_summary(label, summary):
+    return (
+        f"{label}: n={summary['count']} mean={summary['mean']:.2f}ms "
+        f"p50={summary['p50']:.2f}ms p95={summary['p95']:.2f}ms "
+        f"p99={summary['p99']:.2f}ms max={summary['max']:.2f}ms"
+    )
+
+
+def time_call(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000.0, result
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def sqlite_copy():
+    """Copie temporaire de la base SQLite, utilisee par ce processus le temps du bloc.
+
+    Renvoie le chemin de la copie, a passer aux serveurs lances (SQLITE_PATH) :
+    le jeu de donnees synthetique n'est jamais ecrit dans la vraie base.
+    """
+    source = connection.settings_dict["NAME"]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.sqlite3")
+        src, dst = sqlite3.connect(source), sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+        connection.close()
+        connection.settings_dict["NAME"] = path
+        try:
+            yield path
+        finally:
+            connection.close()
+            connection.settings_dict["NAME"] = source
+
+
+def start_server(kind, port, workers=2, threads=1, log=None, extra_args=(), env=None):
+    """Lance gunicorn (WSGI ou ASGI) sur le projet, renvoie (process, commande).
+
+    ``log`` recoit la sortie d'erreur du serveur (tracebacks compris) ;
+    ``extra_args`` s'ajoute a la ligne de commande (ex. ["--preload"]) ;
+    ``env`` complete l'environnement du serveur (ex. SQLITE_PATH).
+    """
+    command = [
+        sys.executable, "-m", "gunicorn", *SERVERS[kind],
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(max(1, workers)),
+        "--log-level", "warning",
+    ]
+    if kind == "wsgi" and threads > 1:
+        command += ["--threads", str(threads)]
+    command += list(extra_args)
+    process = subprocess.Popen(command, cwd=settings.BASE_DIR, env={**os.environ, **(env or {})}, stderr=log)
+    return process, " ".join(command[2:])
+
+
+def wait_ready(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup (is gunicorn/uvicorn installed?).")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server not ready on port {port} after {timeout}s.")
+
+
+def stop_server(process, timeout=10):
+    # Les connexions SSE ouvertes retardent l'arret gracieux de gunicorn.
+    process.terminate()
+    try:
+        process.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
@@ -0,0 +1,55 @@
+from django.db import models, router, transaction
+
+from .models import Famille, Produit
+
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def purge(model, filters, chunk_size=DEFAULT_CHUNK_SIZE, counts=None, on_progress=None):
+    """Supprime les lignes de `model` correspondant a `filters`, enfants d'abord.
+
+    Contrairement a QuerySet.delete(), rien n'est charge en memoire : on lit
+    seulement des paquets de cles primaires, on purge recursivement les
+    tables qui dependent en CASCADE, puis on fait un DELETE brut du paquet
+    dans une transaction courte. Les FK en SET_NULL sont mises a NULL.
+    """
+    counts = {} if counts is None else counts
+    qs = model._default_manager.filter(**filters)
+    using = router.db_for_write(model)
+    relations = [
+        rel for rel in model._meta.related_objects
+        if rel.on_delete in (models.CASCADE, models.SET_NULL)
+    ]
+
+    while True:
+        pks = list(qs.order_by("pk").values_list("pk", flat=True)[:chunk_size])
+        if not pks:
+            break
+
+        for rel in relations:
+            child_filters = {f"{rel.field.name}__in": pks}
+            if rel.on_delete is models.CASCADE:
+                purge(rel.related_model, child_filters, chunk_size, counts, on_progress)
+            else:
+                rel.related_model._default_manager.filter(**child_filters).update(**{rel.field.name: None})
+
+        with transaction.atomic(using=using):
+            deleted = model._default_manager.filter(pk__in=pks)._raw_delete(using)
+
+        label = model._meta.label
+        counts[label] = counts.get(label, 0) + deleted
+        if on_progress:
+            on_progress(label, counts[label])
+    return counts
+
+
+def delete_produits(produit_ids, chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None):
+    """Supprime des produits et tout ce qui en depend (lots, sorties, cumuls...)."""
+    return purge(Produit, {"pk__in": list(produit_ids)}, chunk_size, {}, on_progress)
+
+
+def delete_famille(famille_id, chunk_size=DEFAULT_CHUNK_SIZE, on_progress=None):
+    """Supprime une famille avec tous ses produits, par paquets."""
+    counts = purge(Produit, {"famille_id": famille_id}, chunk_size, {}, on_progress)
+    return purge(Famille, {"pk": famille_id}, chunk_size, counts, on_progress)
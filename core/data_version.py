@@ -0,0 +1,59 @@
+import time
+
+from django.core.cache import cache
+
+from .metrics import record_bump
+
+
+DATA_VERSION_CACHE_KEY = "core_data_version"
+# Version du catalogue (codes et noms des produits) : ne change qu'a la
+# creation, au renommage ou a la suppression d'un produit, pas a chaque sortie.
+CATALOG_VERSION_CACHE_KEY = "core_catalog_version"
+
+
+def _initial_version():
+    # Cle absente (cache vide, purge ou entree evincee) : on repart d'une
+    # valeur horodatee, superieure aux versions deja distribuees, pour ne
+    # jamais relire un compteur calcule sous une ancienne version.
+    return time.time_ns() // 1000
+
+
+def _get_version(key):
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _initial_version(), None)
+        value = cache.get(key)
+    return int(value)
+
+
+def _bump_version(key):
+    # incr est atomique sous Redis : deux workers qui ecrivent en meme temps
+    # obtiennent deux versions distinctes.
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_version(), None)
+
+
+def get_data_version():
+    return _get_version(DATA_VERSION_CACHE_KEY)
+
+
+async def aget_data_version():
+    value = await cache.aget(DATA_VERSION_CACHE_KEY)
+    if value is None:
+        await cache.aadd(DATA_VERSION_CACHE_KEY, _initial_version(), None)
+        value = await cache.aget(DATA_VERSION_CACHE_KEY)
+    return int(value)
+
+
+def get_catalog_version():
+    return _get_version(CATALOG_VERSION_CACHE_KEY)
+
+
+def bump_data_version(catalog=False):
+    """Invalide les caches derives des donnees ; `catalog=True` aussi l'index des codes."""
+    _bump_version(DATA_VERSION_CACHE_KEY)
+    if catalog:
+        _bump_version(CATALOG_VERSION_CACHE_KEY)
+    record_bump()
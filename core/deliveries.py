@@ -0,0 +1,111 @@
+import re
+from datetime import date, datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .data_version import bump_data_version
+from .expiry import refresh_expiry
+from .models import Lot, default_site_id
+from .resolver import resolve_codes
+
+
+MAX_DELIVERY_LINES = 5000
+_SEPARATORS = re.compile(r"[;\t,]")
+
+
+def parse_date(value):
+    value = str(value or "").strip()
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(value)
+
+
+def parse_delivery_text(text):
+    """Une ligne par lot : code;quantite;date_fin[;date_entree]."""
+    lines = []
+    for number, raw in enumerate((text or "").splitlines(), start=1):
+        raw = raw.strip()
+        if not raw or raw.startswith("#"):
+            continue
+        parts = [part.strip() for part in _SEPARATORS.split(raw)]
+        lines.append(
+            {
+                "ligne": number,
+                "code": parts[0] if len(parts) > 0 else "",
+                "quantite": parts[1] if len(parts) > 1 else "",
+                "date_fin": parts[2] if len(parts) > 2 else "",
+                "date_entree": parts[3] if len(parts) > 3 else "",
+            }
+        )
+    return lines
+
+
+def build_delivery(lines, default_date_entree=None, site_id=None):
+    """Valide toutes les lignes et prepare les Lot (non sauvegardes) du site.
+
+    Retourne (lots, erreurs). Les produits sont resolus en une seule passe.
+    """
+    default_date_entree = default_date_entree or timezone.now().date()
+    site_id = site_id or default_site_id()
+    errors = []
+    if not lines:
+        return [], ["Aucune ligne de livraison."]
+    if len(lines) > MAX_DELIVERY_LINES:
+        return [], [f"Livraison limitee a {MAX_DELIVERY_LINES} lignes."]
+
+    produits = resolve_codes(str(line.get("code") or "") for line in lines)
+    lots = []
+    for position, line in enumerate(lines, start=1):
+        number = line.get("ligne", position)
+        code = str(line.get("code") or "").strip()
+        ref = produits.get(code.lower())
+        if ref is None:
+            errors.append(f"Ligne {number}: produit '{code}' introuvable.")
+            continue
+
+        try:
+            quantite = int(line.get("quantite"))
+            if quantite <= 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f"Ligne {number}: quantite invalide '{line.get('quantite')}'.")
+            continue
+
+        try:
+            date_fin = line["date_fin"] if isinstance(line.get("date_fin"), date) else parse_date(line.get("date_fin"))
+        except (KeyError, ValueError):
+            errors.append(f"Ligne {number}: date de peremption invalide '{line.get('date_fin')}'.")
+            continue
+
+        date_entree = default_date_entree
+        if line.get("date_entree"):
+            try:
+                date_entree = parse_date(line["date_entree"])
+            except ValueError:
+                errors.append(f"Ligne {number}: date d'entree invalide '{line['date_entree']}'.")
+                continue
+
+        lots.append(
+            Lot(
+                produit_id=ref.id,
+                site_id=site_id,
+                quantite=quantite,
+                quantite_initiale=quantite,
+                date_entree=date_entree,
+                date_fin=date_fin,
+            )
+        )
+    return lots, errors
+
+
+def create_delivery(lots):
+    """Enregistre tous les lots en une transaction, une seule montee de version."""
+    with transaction.atomic():
+        created = Lot.objects.bulk_create(lots, batch_size=1000)
+        refresh_expiry(lot_ids=[lot.id for lot in created])
+    bump_data_version()
+    return len(created)
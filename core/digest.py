@@ -0,0 +1,219 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .expiry import ALERT_BUCKETS, refresh_day
+from .models import AlerteDigest, AlerteEtat, AlerteOutbox, Lot, LotExpiration, Produit, StockCorrection
+from .stock_status import stock_state, with_stock_status
+from .transactions import write_atomic
+
+
+# Digest des alertes stock / peremption, hors requete (commande alert_digest).
+#
+# Chaque passage n'ecrit dans AlerteOutbox que les alertes nouvelles ou dont
+# le niveau a change depuis le dernier niveau notifie (AlerteEtat) :
+# - peremption : anti-jointure SQL entre les lots des buckets d'alerte de
+#   LotExpiration (index expiration_bucket_idx) et AlerteEtat ; seuls les
+#   lots changes sortent de la base ;
+# - stock : seuls les produits modifies depuis le debut du passage precedent
+#   sont recalcules : produit (seuils, famille), lot (entree, sortie,
+#   modification) ou correction datee (purge, archive, inventaire).
+#   Le point de depart recule de WATERMARK_OVERLAP : une transaction ouverte
+#   avant le passage precedent et validee apres n'est pas perdue.
+#
+# L'envoi regroupe les lignes non envoyees par famille, un e-mail chacune.
+
+EXPIRATION_LABELS = {
+    LotExpiration.BUCKET_EXPIRE: ("danger", "Expire"),
+    LotExpiration.BUCKET_AUJOURDHUI: ("danger", "Expire aujourd'hui"),
+    LotExpiration.BUCKET_PROCHE: ("near", "Proche expiration"),
+}
+
+IN_CHUNK = 500
+
+WATERMARK_OVERLAP = timedelta(minutes=5)
+
+
+def _chunks(values, size=IN_CHUNK):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _touched_products(last):
+    """Produits dont le stock ou le seuil a pu changer depuis le passage `last`."""
+    since = (last.demarre_le or last.lance_le) - WATERMARK_OVERLAP
+    touched = set(Produit.objects.filter(modifie_le__gte=since).values_list("id", flat=True))
+    touched.update(Lot.objects.filter(modifie_le__gte=since).values_list("produit_id", flat=True).distinct())
+    touched.update(
+        StockCorrection.objects.filter(cree_le__gte=since).values_list("produit_id", flat=True).distinct()
+    )
+    return touched
+
+
+def _alerting_lots():
+    return LotExpiration.objects.filter(bucket__in=ALERT_BUCKETS, lot__quantite__gt=0)
+
+
+def _expiration_changes():
+    """Lots en alerte dont le bucket differe du dernier notifie (ou jamais notifies)."""
+    known = AlerteEtat.objects.filter(
+        type=AlerteOutbox.TYPE_EXPIRATION, lot_id=OuterRef("lot_id"), niveau=OuterRef("bucket"),
+    )
+    rows = (
+        _alerting_lots()
+        .exclude(Exists(known))
+        .values_list(
+            "lot_id", "produit_id", "produit__famille_id", "lot__site_id",
+            "bucket", "days_left", "date_fin", "lot__quantite",
+        )
+        .iterator(chunk_size=2000)
+    )
+    for lot_id, produit_id, famille_id, site_id, bucket, days_left, date_fin, quantite in rows:
+        level, label = EXPIRATION_LABELS[bucket]
+        yield bucket, AlerteOutbox(
+            type=AlerteOutbox.TYPE_EXPIRATION,
+            niveau=level,
+            libelle=label,
+            produit_id=produit_id,
+            famille_id=famille_id,
+            site_id=site_id,
+            lot_id=lot_id,
+            quantite=quantite,
+            date_fin=date_fin,
+            days_left=days_left,
+        )
+
+
+def _expiration_resolved():
+    """Etats de lots qui ne sont plus en alerte (consommes, archives, seuil change)."""
+    alerting = _alerting_lots().filter(lot_id=OuterRef("lot_id"))
+    return AlerteEtat.objects.filter(type=AlerteOutbox.TYPE_EXPIRATION).exclude(Exists(alerting))
+
+
+def _stock_levels(produit_ids):
+    produits = with_stock_status(Produit.objects.all(), days_left=False)
+    fields = ("id", "famille_id", "stock_total", "nbr_qnt_alert")
+    if produit_ids is None:
+        yield from produits.values_list(*fields).iterator(chunk_size=2000)
+        return
+    for chunk in _chunks(produit_ids):
+        yield from produits.filter(id__in=chunk).values_list(*fields)
+
+
+def _stock_changes(produit_ids):
+    """(alertes nouvelles ou changees, {produit: niveau}, produits revenus a "ok")."""
+    states = AlerteEtat.objects.filter(type=AlerteOutbox.TYPE_STOCK)
+    if produit_ids is None:
+        known = dict(states.values_list("produit_id", "niveau"))
+    else:
+        known = {}
+        for chunk in _chunks(produit_ids):
+            known.update(states.filter(produit_id__in=chunk).values_list("produit_id", "niveau"))
+
+    rows, changed, resolved = [], {}, []
+    for produit_id, famille_id, stock_total, nbr_qnt_alert in _stock_levels(produit_ids):
+        level, label = stock_state(stock_total, nbr_qnt_alert)
+        if level == "ok":
+            if produit_id in known:
+                resolved.append(produit_id)
+        elif known.get(produit_id) != level:
+            changed[produit_id] = level
+            rows.append(
+                AlerteOutbox(
+                    type=AlerteOutbox.TYPE_STOCK,
+                    niveau=level,
+                    libelle=label,
+                    produit_id=produit_id,
+                    famille_id=famille_id,
+                    quantite=stock_total,
+                )
+            )
+    return rows, changed, resolved
+
+
+def collect_alerts(full=False, dry_run=False, today=None):
+    """Ecrit dans l'outbox les alertes nouvelles ou changees ; retourne (passage, lignes).
+
+    Le premier passage, ou full=True, recalcule le stock de tous les produits.
+    """
+    today = today or timezone.now().date()
+    refresh_day(today)
+
+    with write_atomic():
+        last = AlerteDigest.objects.order_by("-id").first()
+        full = full or last is None
+        digest = AlerteDigest(complet=full, demarre_le=timezone.now())
+
+        expirations = list(_expiration_changes())
+        outbox = [row for _, row in expirations]
+        stock_rows, stock_changed, stock_resolved = _stock_changes(None if full else _touched_products(last))
+        outbox.extend(stock_rows)
+        if dry_run:
+            return digest, outbox
+
+        _expiration_resolved().delete()
+        for chunk in _chunks(row.lot_id for _, row in expirations):
+            AlerteEtat.objects.filter(type=AlerteOutbox.TYPE_EXPIRATION, lot_id__in=chunk).delete()
+        for chunk in _chunks(list(stock_changed) + stock_resolved):
+            AlerteEtat.objects.filter(type=AlerteOutbox.TYPE_STOCK, produit_id__in=chunk).delete()
+        AlerteEtat.objects.bulk_create(
+            [
+                AlerteEtat(
+                    type=AlerteOutbox.TYPE_EXPIRATION, produit_id=row.produit_id, lot_id=row.lot_id, niveau=bucket,
+                )
+                for bucket, row in expirations
+            ]
+            + [
+                AlerteEtat(type=AlerteOutbox.TYPE_STOCK, produit_id=produit_id, niveau=level)
+                for produit_id, level in stock_changed.items()
+            ],
+            batch_size=1000,
+        )
+        AlerteOutbox.objects.bulk_create(outbox, batch_size=1000)
+        digest.nouvelles = len(outbox)
+        digest.save()
+    return digest, outbox
+
+
+def deliver_outbox(recipients=None, connection=None):
+    """Envoie les lignes non envoyees, un e-mail par famille ; retourne (e-mails, lignes)."""
+    recipients = recipients if recipients is not None else settings.ALERT_DIGEST_RECIPIENTS
+    if not recipients:
+        return 0, 0
+
+    pending = list(
+        AlerteOutbox.objects
+        .filter(envoye_le__isnull=True)
+        .select_related("produit", "famille", "site")
+        .order_by("famille__nom", "type", "date_fin", "produit__reference")
+    )
+    by_famille = defaultdict(list)
+    for row in pending:
+        by_famille[row.famille.nom if row.famille else "-"].append(row)
+
+    if not by_famille:
+        return 0, 0
+
+    # Une famille n'est marquee envoyee qu'une fois son e-mail parti.
+    emails = rows_sent = 0
+    connection = connection or get_connection()
+    with connection:
+        for famille, rows in by_famille.items():
+            message = EmailMessage(
+                subject=f"{settings.EMAIL_SUBJECT_PREFIX}Alertes {famille} ({len(rows)})",
+                body=render_to_string("alert_digest_email.txt", {"famille": famille, "alertes": rows}),
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=recipients,
+                connection=connection,
+            )
+            if message.send():
+                AlerteOutbox.objects.filter(id__in=[row.id for row in rows]).update(envoye_le=timezone.now())
+                emails += 1
+                rows_sent += len(rows)
+    return emails, rows_sent
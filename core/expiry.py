@@ -0,0 +1,208 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Case, CharField, F, IntegerField, Min, OuterRef, Subquery, Value, When
+from django.db.models.lookups import Exact, LessThan, LessThanOrEqual
+from django.utils import timezone
+
+from .models import Lot, LotExpiration, LotExpirationRefresh
+from .transactions import write_atomic
+
+
+BATCH_SIZE = 5000
+
+ALERT_BUCKETS = (
+    LotExpiration.BUCKET_EXPIRE,
+    LotExpiration.BUCKET_AUJOURDHUI,
+    LotExpiration.BUCKET_PROCHE,
+)
+
+# Table LotExpiration : statut de peremption de chaque lot pour un jour donne.
+# Elle est recalculee en entier au changement de jour, hors requete (commande
+# refresh_expiry --watch, alert_digest), et lot par lot quand un lot est cree
+# ou qu'un seuil nbr_days_alert change. Les vues la lisent au lieu de
+# recalculer days_left pour chaque lot a chaque requete.
+#
+# Tant que le recalcul du jour n'est pas passe, les vues ne reconstruisent
+# pas la table : expiry_columns() reclasse les lignes en SQL (days_left
+# decale des jours ecoules depuis leur calcul, puis les regles de classify).
+
+# Plus ancien jour de calcul vu dans la table, par processus. Une table a
+# jour le reste jusqu'au lendemain (toute ecriture porte le jour courant).
+_state = {"today": None, "oldest": None}
+
+
+def classify(date_fin, nbr_days_alert, today):
+    """(bucket, days_left) d'un lot pour `today`."""
+    days_left = (date_fin - today).days
+    if days_left < 0:
+        return LotExpiration.BUCKET_EXPIRE, days_left
+    if days_left == 0:
+        return LotExpiration.BUCKET_AUJOURDHUI, days_left
+    if days_left <= nbr_days_alert:
+        return LotExpiration.BUCKET_PROCHE, days_left
+    return LotExpiration.BUCKET_OK, days_left
+
+
+def _expiration_rows(lots_qs, today):
+    rows = (
+        lots_qs
+        .order_by()
+        .values_list("id", "produit_id", "date_fin", "produit__nbr_days_alert")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    for lot_id, produit_id, date_fin, nbr_days_alert in rows:
+        bucket, days_left = classify(date_fin, nbr_days_alert, today)
+        yield LotExpiration(
+            lot_id=lot_id,
+            produit_id=produit_id,
+            date_fin=date_fin,
+            days_left=days_left,
+            bucket=bucket,
+            jour=today,
+        )
+
+
+def refresh_expiry(lot_ids=None, produit_ids=None, today=None):
+    """Recalcule la table pour tous les lots, ou seulement ceux indiques."""
+    today = today or timezone.now().date()
+    lots_qs = Lot.objects.all()
+    expirations = LotExpiration.objects.all()
+    if lot_ids is not None:
+        lots_qs = lots_qs.filter(id__in=lot_ids)
+        expirations = expirations.filter(lot_id__in=lot_ids)
+    if produit_ids is not None:
+        lots_qs = lots_qs.filter(produit_id__in=produit_ids)
+        expirations = expirations.filter(produit_id__in=produit_ids)
+
+    created = 0
+    with transaction.atomic():
+        expirations._raw_delete(expirations.db)
+        batch = []
+        for row in _expiration_rows(lots_qs, today):
+            batch.append(row)
+            if len(batch) >= BATCH_SIZE:
+                LotExpiration.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        if batch:
+            LotExpiration.objects.bulk_create(batch)
+            created += len(batch)
+    return created
+
+
+def refresh_day(today=None, force=False):
+    """Recalcul complet du jour, un seul processus a la fois.
+
+    Retourne le nombre de lots classes, ou None si le jour etait deja calcule
+    (par un autre processus) et que `force` est faux.
+    """
+    today = today or timezone.now().date()
+    with write_atomic():
+        marker, _ = LotExpirationRefresh.objects.select_for_update().get_or_create(pk=1)
+        if marker.jour == today and not force:
+            return None
+        created = refresh_expiry(today=today)
+        marker.jour = today
+        marker.calcule_le = timezone.now()
+        marker.save(update_fields=["jour", "calcule_le"])
+    _state["today"], _state["oldest"] = today, None
+    return created
+
+
+def _remember(today, oldest):
+    stale_since = oldest if oldest is not None and oldest < today else None
+    _state["today"], _state["oldest"] = today, stale_since
+    return stale_since
+
+
+def expiry_state(today=None):
+    """Plus ancien jour de calcul encore dans la table, ou None si elle est a jour."""
+    today = today or timezone.now().date()
+    if _state["today"] == today and _state["oldest"] is None:
+        return None
+    return _remember(today, LotExpiration.objects.aggregate(oldest=Min("jour"))["oldest"])
+
+
+async def aexpiry_state(today=None):
+    today = today or timezone.now().date()
+    if _state["today"] == today and _state["oldest"] is None:
+        return None
+    return _remember(today, (await LotExpiration.objects.aaggregate(oldest=Min("jour")))["oldest"])
+
+
+def expiry_columns(nbr_days_alert, today=None):
+    """(bucket, days_left) du jour, en expressions pour une requete sur LotExpiration.
+
+    Table a jour : les colonnes. Sinon la classification est refaite en SQL
+    pour `today`. L'etat vient du dernier expiry_state() du jour (les vues
+    async l'attendent avant de construire leurs requetes), sinon il est lu.
+    """
+    today = today or timezone.now().date()
+    oldest = _state["oldest"] if _state["today"] == today else expiry_state(today)
+    if oldest is None:
+        return F("bucket"), F("days_left")
+    elapsed = (today - oldest).days
+    days_left = Case(
+        *[
+            When(jour=oldest + timedelta(days=offset), then=F("days_left") - (elapsed - offset))
+            for offset in range(elapsed)
+        ],
+        default=F("days_left"),
+        output_field=IntegerField(),
+    )
+    bucket = Case(
+        When(LessThan(days_left, 0), then=Value(LotExpiration.BUCKET_EXPIRE)),
+        When(Exact(days_left, 0), then=Value(LotExpiration.BUCKET_AUJOURDHUI)),
+        When(LessThanOrEqual(days_left, nbr_days_alert), then=Value(LotExpiration.BUCKET_PROCHE)),
+        default=Value(LotExpiration.BUCKET_OK),
+        output_field=CharField(),
+    )
+    return bucket, days_left
+
+
+def current_expirations(today=None):
+    """LotExpiration annotee de bucket_jour et days_left_jour (valables pour `today`)."""
+    bucket, days_left = expiry_columns(F("produit__nbr_days_alert"), today)
+    return LotExpiration.objects.annotate(bucket_jour=bucket, days_left_jour=days_left)
+
+
+def check_expiry(today=None):
+    """Compare la table au calcul direct : lots manquants, perimes ou faux."""
+    today = today or timezone.now().date()
+    stored = {
+        lot_id: (bucket, days_left, jour)
+        for lot_id, bucket, days_left, jour in (
+            LotExpiration.objects
+            .values_list("lot_id", "bucket", "days_left", "jour")
+            .iterator(chunk_size=BATCH_SIZE)
+        )
+    }
+    report = {"total": 0, "missing": [], "stale": [], "mismatch": []}
+    for row in _expiration_rows(Lot.objects.all(), today):
+        report["total"] += 1
+        current = stored.get(row.lot_id)
+        if current is None:
+            report["missing"].append(row.lot_id)
+        elif current[2] != today:
+            report["stale"].append(row.lot_id)
+        elif current[:2] != (row.bucket, row.days_left):
+            report["mismatch"].append(row.lot_id)
+    return report
+
+
+def with_next_expiry(produits_qs, days_left=True, site_id=None):
+    """Annote le statut du premier lot non vide (FEFO) de chaque produit, sur un site ou tous."""
+    bucket, lot_days_left = expiry_columns(OuterRef("nbr_days_alert"))
+    next_lot = (
+        LotExpiration.objects
+        .filter(produit=OuterRef("pk"), lot__quantite__gt=0)
+        .annotate(bucket_jour=bucket, days_left_jour=lot_days_left)
+        .order_by("date_fin", "lot_id")
+    )
+    if site_id is not None:
+        next_lot = next_lot.filter(lot__site_id=site_id)
+    produits_qs = produits_qs.annotate(next_bucket=Subquery(next_lot.values("bucket_jour")[:1]))
+    if days_left:
+        produits_qs = produits_qs.annotate(next_days_left=Subquery(next_lot.values("days_left_jour")[:1]))
+    return produits_qs
@@ -0,0 +1,69 @@
+import time
+
+from .data_version import bump_data_version
+from .metrics import observe_fefo
+from .models import Lot, Sort, SortieLot
+from .rollup import record_consumption
+from .transactions import write_atomic
+
+
+# Allocation FEFO d'une sortie, limitee aux lots d'un site.
+#
+# Le select_for_update ne verrouille que les lots du produit sur ce site
+# (index lot_site_fefo_idx) : deux sorties du meme produit sur deux sites ne
+# se bloquent pas sous PostgreSQL. SQLite n'a qu'un verrou d'ecriture par
+# base : la sortie le prend des le BEGIN (write_atomic), les sorties y
+# restent serialisees, quel que soit le site.
+
+
+def available_lots(produit_id, site_id, today):
+    return Lot.objects.filter(
+        site_id=site_id, produit_id=produit_id, quantite__gt=0, date_fin__gte=today,
+    )
+
+
+def allocate_exit(produit, quantite, site_id, today):
+    """Sortie de `quantite` sur le site, lots les plus proches de la peremption d'abord.
+
+    Retourne la Sort creee, ou None si le stock du site est insuffisant
+    (rien n'est alors ecrit).
+    """
+    start = time.perf_counter()
+    with write_atomic():
+        lots = list(
+            available_lots(produit.id, site_id, today)
+            .select_for_update()
+            .order_by("date_fin", "id")
+        )
+        if sum(lot.quantite for lot in lots) < quantite:
+            return None
+
+        sortie = Sort.objects.create(
+            produit=produit, famille_id=produit.famille_id, site_id=site_id, quantite=quantite,
+        )
+
+        allocations = []
+        reste = quantite
+        for lot in lots:
+            if reste == 0:
+                break
+            preleve = min(lot.quantite, reste)
+            lot.quantite -= preleve
+            lot.save(update_fields=["quantite", "modifie_le"])
+            allocations.append(
+                SortieLot(
+                    sortie=sortie,
+                    lot_id=lot.id,
+                    produit=produit,
+                    date_fin=lot.date_fin,
+                    date_sortie=sortie.date_sortie,
+                    quantite=preleve,
+                )
+            )
+            reste -= preleve
+        SortieLot.objects.bulk_create(allocations)
+
+        record_consumption(produit, quantite, sortie.date_sortie)
+        bump_data_version()
+    observe_fefo(time.perf_counter() - start, len(allocations))
+    return sortie
@@ -0,0 +1,192 @@
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .models import ConsommationJournaliere, Lot, Prevision, PrevisionLot, Produit, Sort
+
+
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_MA_DAYS = 28
+DEFAULT_ALPHA = 0.3
+BATCH_SIZE = 5000
+
+
+def load_consumption_matrix(product_ids, today, window_days, source="rollup"):
+    """Matrice (produits x jours) des quantites consommees sur la fenetre.
+
+    `product_ids` doit etre trie. La colonne 0 est le jour le plus ancien,
+    la derniere colonne est hier.
+    """
+    start = today - timedelta(days=window_days)
+
+    if source == "sort":
+        rows = (
+            Sort.objects
+            .filter(date_sortie__gte=start, date_sortie__lt=today)
+            .values_list("produit_id", "date_sortie")
+            .annotate(total=Sum("quantite"))
+            .order_by()
+        )
+    else:
+        rows = (
+            ConsommationJournaliere.objects
+            .filter(jour__gte=start, jour__lt=today)
+            .values_list("produit_id", "jour", "quantite")
+        )
+
+    matrix = np.zeros((len(product_ids), window_days), dtype=np.float64)
+    rows = list(rows.iterator(chunk_size=BATCH_SIZE))
+    if not rows:
+        return matrix
+
+    pids, jours, quantities = zip(*rows)
+    row_idx = np.searchsorted(product_ids, np.array(pids, dtype=np.int64))
+    col_idx = (np.array(jours, dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+    np.add.at(matrix, (row_idx, col_idx), np.array(quantities, dtype=np.float64))
+    return matrix
+
+
+def consumption_rates(matrix, ma_days=DEFAULT_MA_DAYS, alpha=DEFAULT_ALPHA):
+    """Moyenne mobile et lissage exponentiel pour tous les produits a la fois."""
+    window_days = matrix.shape[1]
+    ma_days = max(1, min(ma_days, window_days))
+    moving_average = matrix[:, -ma_days:].mean(axis=1)
+
+    # s_T = sum alpha*(1-alpha)^(T-t) x_t, initialise sur la moyenne globale.
+    powers = np.arange(window_days - 1, -1, -1, dtype=np.float64)
+    weights = alpha * (1.0 - alpha) ** powers
+    initial = matrix.mean(axis=1) * (1.0 - alpha) ** window_days
+    smoothed = matrix @ weights + initial
+    return moving_average, smoothed
+
+
+def project_fefo(lot_product_idx, lot_qty, lot_days, rates, n_products):
+    """Simule la consommation FEFO au taux `rates` pour chaque produit.
+
+    Les lots doivent etre tries par (produit, date_fin). La boucle porte sur
+    le rang du lot dans son produit ; chaque iteration traite le k-ieme lot
+    de tous les produits en une operation vectorielle.
+
+    Retourne (jours avant rupture par produit, quantite perimee par lot).
+    """
+    elapsed = np.zeros(n_products, dtype=np.float64)
+    waste = np.zeros(len(lot_qty), dtype=np.float64)
+    if len(lot_qty) == 0:
+        return elapsed, waste
+
+    boundaries = np.r_[True, lot_product_idx[1:] != lot_product_idx[:-1]]
+    group_start = np.maximum.accumulate(np.where(boundaries, np.arange(len(lot_qty)), 0))
+    rank = np.arange(len(lot_qty)) - group_start
+    order = np.argsort(rank, kind="stable")
+    splits = np.cumsum(np.bincount(rank))[:-1]
+
+    for sel in np.split(order, splits):
+        prods = lot_product_idx[sel]
+        rate = rates[prods]
+        consuming = rate > 0
+        # Temps restant avant peremption quand on commence ce lot.
+        available = np.maximum(lot_days[sel] - elapsed[prods], 0.0)
+        needed = np.divide(lot_qty[sel], rate, out=np.full(len(sel), np.inf), where=consuming)
+        duration = np.where(consuming, np.minimum(needed, available), 0.0)
+        consumed = np.minimum(duration * rate, lot_qty[sel])
+        waste[sel] = lot_qty[sel] - consumed
+        elapsed[prods] += duration
+    return elapsed, waste
+
+
+def compute_previsions(window_days=DEFAULT_WINDOW_DAYS, ma_days=DEFAULT_MA_DAYS,
+                       alpha=DEFAULT_ALPHA, source="rollup", today=None):
+    today = today or timezone.now().date()
+    product_ids = np.fromiter(
+        Produit.objects.order_by("id").values_list("id", flat=True).iterator(chunk_size=BATCH_SIZE),
+        dtype=np.int64,
+    )
+    n_products = len(product_ids)
+
+    matrix = load_consumption_matrix(product_ids, today, window_days, source=source)
+    moving_average, smoothed = consumption_rates(matrix, ma_days=ma_days, alpha=alpha)
+
+    lot_rows = list(
+        Lot.objects
+        .filter(quantite__gt=0, date_fin__gte=today)
+        .order_by("produit_id", "date_fin", "id")
+        .values_list("id", "produit_id", "quantite", "date_fin")
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    lot_ids, lot_pids, lot_qty, lot_dates = list(zip(*lot_rows)) or [(), (), (), ()]
+    lot_ids = np.array(lot_ids, dtype=np.int64)
+    lot_product_idx = np.searchsorted(product_ids, np.array(lot_pids, dtype=np.int64))
+    lot_qty = np.array(lot_qty, dtype=np.float64)
+    # Un lot reste utilisable jusqu'a la fin de son jour de peremption.
+    lot_days = (
+        np.array(lot_dates, dtype="datetime64[D]") - np.datetime64(today, "D")
+    ).astype(np.float64) + 1.0
+
+    days_to_stockout, lot_waste = project_fefo(lot_product_idx, lot_qty, lot_days, smoothed, n_products)
+    stock = np.bincount(lot_product_idx, weights=lot_qty, minlength=n_products)
+    waste = np.bincount(lot_product_idx, weights=lot_waste, minlength=n_products)
+
+    return {
+        "today": today,
+        "product_ids": product_ids,
+        "moving_average": moving_average,
+        "smoothed": smoothed,
+        "stock": stock,
+        "days_to_stockout": days_to_stockout,
+        "waste": waste,
+        "lot_ids": lot_ids,
+        "lot_product_ids": product_ids[lot_product_idx],
+        "lot_dates": lot_dates,
+        "lot_waste": lot_waste,
+    }
+
+
+def refresh_previsions(**options):
+    """Recalcule toutes les previsions et remplace les tables en une transaction."""
+    result = compute_previsions(**options)
+    today = result["today"]
+    now = timezone.now()
+    has_rate = result["smoothed"] > 1e-9
+
+    previsions = [
+        Prevision(
+            produit_id=int(pid),
+            taux_moyen=float(ma),
+            taux_lisse=float(ema),
+            stock_disponible=int(stock),
+            date_rupture=(today + timedelta(days=int(days))) if rated else None,
+            quantite_perimee=int(round(waste)),
+            calculee_le=now,
+        )
+        for pid, ma, ema, stock, days, rated, waste in zip(
+            result["product_ids"],
+            result["moving_average"],
+            result["smoothed"],
+            result["stock"],
+            result["days_to_stockout"],
+            has_rate,
+            result["waste"],
+        )
+    ]
+    lots_waste = [
+        PrevisionLot(
+            lot_id=int(lot_id),
+            produit_id=int(pid),
+            date_fin=date_fin,
+            quantite_perimee=int(round(waste)),
+        )
+        for lot_id, pid, date_fin, waste in zip(
+            result["lot_ids"], result["lot_product_ids"], result["lot_dates"], result["lot_waste"]
+        )
+        if waste >= 0.5
+    ]
+
+    with transaction.atomic():
+        PrevisionLot.objects.all().delete()
+        Prevision.objects.all().delete()
+        Prevision.objects.bulk_create(previsions, batch_size=BATCH_SIZE)
+        PrevisionLot.objects.bulk_create(lots_waste, batch_size=BATCH_SIZE)
+    return len(previsions), len(lots_waste)
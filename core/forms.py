@@ -1,5 +1,6 @@
 from django import forms
-from .models import Produit, Famille, Lot
+from django.db.models import Q
+from .models import Produit, Famille, Lot, Site
 
 from django.utils import timezone
 
@@ -11,12 +12,14 @@ class LotForm(forms.ModelForm):
         model = Lot
         fields = [
             "produit",
+            "site",
             "date_entree",
             "date_fin",
             "quantite",
         ]
         widgets = {
             "produit": forms.Select(attrs={"class": "form-select"}),
+            "site": forms.Select(attrs={"class": "form-select"}),
             "date_entree": forms.DateInput(
                 attrs={"class": "form-control", "type": "date"},
             ),
@@ -75,6 +78,30 @@ class FamilleForm(forms.ModelForm):
         return self.cleaned_data["nom"].strip()
 
 
+class SiteForm(forms.ModelForm):
+    class Meta:
+        model = Site
+        fields = [
+            "nom",
+        ]
+        widgets = {
+            "nom": forms.TextInput(attrs={"class": "form-control", "placeholder": "Nom du site"}),
+        }
+
+    def clean_nom(self):
+        return self.cleaned_data["nom"].strip()
+
+
+def site_field():
+    # Optionnel : sans site, la vue prend celui de la station (session) ou le site par defaut.
+    return forms.ModelChoiceField(
+        queryset=Site.objects.order_by("nom"),
+        required=False,
+        empty_label=None,
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+
+
 class MovementForm(forms.Form):
     code = forms.CharField(
         label="Reference / code-barres",
@@ -98,6 +125,87 @@ class MovementForm(forms.Form):
             }
         ),
     )
+    site = site_field()
 
     def clean_code(self):
         return self.cleaned_data["code"].strip()
+
+
+class BulkThresholdForm(forms.Form):
+    famille = forms.ModelChoiceField(
+        queryset=Famille.objects.all().order_by("nom"),
+        required=False,
+        empty_label="Toutes les familles",
+        widget=forms.Select(attrs={"class": "form-select"}),
+    )
+    q = forms.CharField(
+        label="Nom / reference / code-barres",
+        required=False,
+        max_length=100,
+        widget=forms.TextInput(attrs={"class": "form-control", "placeholder": "Filtre optionnel"}),
+    )
+    nbr_qnt_alert = forms.IntegerField(
+        label="Nouveau seuil stock",
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={"class": "form-control", "min": 0}),
+    )
+    nbr_days_alert = forms.IntegerField(
+        label="Nouveaux jours alerte",
+        required=False,
+        min_value=0,
+        widget=forms.NumberInput(attrs={"class": "form-control", "min": 0}),
+    )
+
+    def clean_q(self):
+        return self.cleaned_data["q"].strip()
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get("nbr_qnt_alert") is None and cleaned.get("nbr_days_alert") is None:
+            raise forms.ValidationError("Indiquez au moins un seuil a modifier.")
+        return cleaned
+
+    def target_queryset(self):
+        qs = Produit.objects.all()
+        famille = self.cleaned_data.get("famille")
+        query = self.cleaned_data.get("q")
+        if famille:
+            qs = qs.filter(famille=famille)
+        if query:
+            qs = qs.filter(
+                Q(nom__icontains=query)
+                | Q(reference__icontains=query)
+                | Q(barcode__icontains=query)
+            )
+        return qs
+
+    def changes(self):
+        return {
+            field: self.cleaned_data[field]
+            for field in ("nbr_qnt_alert", "nbr_days_alert")
+            if self.cleaned_data.get(field) is not None
+        }
+
+
+class DeliveryForm(forms.Form):
+    site = site_field()
+    date_entree = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}),
+    )
+    lignes = forms.CharField(
+        widget=forms.Textarea(
+            attrs={
+                "class": "form-control font-monospace",
+                "rows": 14,
+                "placeholder": "code;quantite;date_peremption[;date_entree]\n1200088112;20;2027-03-31",
+            }
+        ),
+    )
+
+    def clean_date_entree(self):
+        date_entree = self.cleaned_data.get("date_entree")
+        if not date_entree:
+            return timezone.now().date()
+        return date_entree
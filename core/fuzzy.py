@@ -0,0 +1,131 @@
+import threading
+from collections import defaultdict
+
+import numpy as np
+
+from .metrics import record_cache
+from .resolver import get_code_index
+
+
+# Suggestions pour un code mal lu ou mal saisi.
+#
+# Index en memoire des trigrammes de chaque code (reference et code-barres,
+# en minuscules, encadres par ^ et $) vers les positions des codes. Une
+# recherche compte les trigrammes partages avec np.bincount, garde les
+# meilleurs candidats puis les classe par distance d'edition (transpositions
+# comprises). L'index suit l'index des codes du resolver, reconstruit a
+# chaque version du catalogue (creation, renommage, suppression de
+# produits), pas a chaque sortie de stock.
+
+DEFAULT_SUGGESTIONS = 5
+MAX_SUGGESTIONS = 20
+CANDIDATES = 30
+# Trigrammes presents dans plus de 20 % des codes (ex. "prd") : ignores
+# tant que la recherche dispose d'autres trigrammes.
+COMMON_GRAM_RATIO = 0.2
+MAX_DISTANCE_RATIO = 0.4
+
+_lock = threading.Lock()
+_state = {"codes": None, "index": None}
+
+
+def _grams(code):
+    padded = f"^{code}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def edit_distance(a, b):
+    """Distance de Levenshtein avec transposition de deux caracteres voisins."""
+    if a == b:
+        return 0
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        left = i
+        for j, cb in enumerate(b, 1):
+            value = previous[j - 1] if ca == cb else previous[j - 1] + 1
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if left + 1 < value:
+                value = left + 1
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb and previous2[j - 2] + 1 < value:
+                value = previous2[j - 2] + 1
+            current.append(value)
+            left = value
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class FuzzyIndex:
+    def __init__(self, keys):
+        self.keys = keys
+        postings = defaultdict(list)
+        for position, key in enumerate(keys):
+            for gram in _grams(key):
+                postings[gram].append(position)
+        self.postings = {gram: np.array(positions, dtype=np.uint32) for gram, positions in postings.items()}
+        self.common = max(1, int(len(keys) * COMMON_GRAM_RATIO))
+
+    def candidates(self, code):
+        lists = [self.postings[gram] for gram in _grams(code) if gram in self.postings]
+        rare = [positions for positions in lists if len(positions) <= self.common]
+        if len(rare) >= 2:
+            lists = rare
+        if not lists:
+            return []
+        # Une position n'apparait qu'une fois par liste : l'increment indexe suffit.
+        # uint16 : un code de plus de 254 caracteres partage plus de 255 trigrammes.
+        counts = np.zeros(len(self.keys), dtype=np.uint16)
+        for positions in lists:
+            counts[positions] += 1
+        found = np.flatnonzero(counts)
+        if len(found) > CANDIDATES:
+            found = found[np.argpartition(counts[found], -CANDIDATES)[-CANDIDATES:]]
+        return [self.keys[position] for position in found]
+
+
+def get_fuzzy_index():
+    codes = get_code_index()
+    rebuilt = False
+    if _state["codes"] is not codes:
+        with _lock:
+            if _state["codes"] is not codes:
+                _state["index"] = FuzzyIndex(list(codes))
+                _state["codes"] = codes
+                rebuilt = True
+    record_cache("fuzzy_index", not rebuilt)
+    return codes, _state["index"]
+
+
+def suggest_codes(code, limit=DEFAULT_SUGGESTIONS):
+    """Produits les plus proches du code : liste de dicts tries par distance."""
+    code = (code or "").strip().lower()
+    if not code:
+        return []
+    codes, index = get_fuzzy_index()
+    max_distance = max(1, int(len(code) * MAX_DISTANCE_RATIO))
+
+    best = {}
+    for key in index.candidates(code):
+        ref = codes.get(key)
+        if ref is None or abs(len(key) - len(code)) > max_distance:
+            continue
+        distance = edit_distance(code, key)
+        if distance > max_distance:
+            continue
+        if ref.id not in best or distance < best[ref.id][0]:
+            best[ref.id] = (distance, key, ref)
+
+    ranked = sorted(best.values(), key=lambda item: (item[0], item[2].reference))[:limit]
+    return [
+        {
+            "id": ref.id,
+            "nom": ref.nom or "",
+            "reference": ref.reference,
+            "barcode": ref.barcode,
+            "champ": "barcode" if key == ref.barcode.lower() else "reference",
+            "distance": distance,
+        }
+        for distance, key, ref in ranked
+    ]
@@ -0,0 +1,105 @@
+from bisect import bisect_right
+from datetime import date, timedelta
+
+from django.core.cache import cache
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .data_version import get_data_version
+from .metrics import record_cache
+from .models import Famille, Lot
+
+
+GRANULARITIES = ("week", "month")
+DEFAULT_PERIODS = {"week": 12, "month": 6}
+MAX_PERIODS = 60
+CACHE_TIMEOUT = 24 * 3600
+
+# Histogramme du stock qui expire par semaine / mois a venir, agrege en SQL
+# sur les lots non vides. On groupe par (date_fin, famille) sans fonction de
+# troncature (lecture de l'index lot_horizon_idx seul), puis les quelques
+# centaines de groupes sont ranges par periode en Python. Le resultat ne
+# change qu'avec les donnees ou la date : la cle de cache contient les deux.
+
+
+def _period_starts(granularity, periods, today):
+    if granularity == "week":
+        first = today - timedelta(days=today.weekday())
+        return [first + timedelta(weeks=i) for i in range(periods + 1)]
+    starts = []
+    year, month = today.year, today.month
+    for _ in range(periods + 1):
+        starts.append(date(year, month, 1))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return starts
+
+
+def expiry_horizon(granularity="week", periods=None, famille_id=None, by_famille=False, today=None):
+    """Quantites et nombre de lots expirant par periode, au total ou par famille.
+
+    La ventilation par famille ajoute une jointure sur Produit : elle n'est
+    calculee que sur demande (by_famille).
+    """
+    today = today or timezone.now().date()
+    periods = min(MAX_PERIODS, max(1, periods or DEFAULT_PERIODS[granularity]))
+    starts = _period_starts(granularity, periods, today)
+
+    lots_qs = Lot.objects.filter(quantite__gt=0)
+    if famille_id:
+        lots_qs = lots_qs.filter(produit__famille_id=famille_id)
+
+    expired = lots_qs.filter(date_fin__lt=today).aggregate(quantite=Sum("quantite"), nb_lots=Count("id"))
+    group = ("date_fin", "produit__famille_id") if by_famille else ("date_fin",)
+    rows = (
+        lots_qs
+        .filter(date_fin__gte=today, date_fin__lt=starts[-1])
+        .values_list(*group)
+        .annotate(quantite=Sum("quantite"), nb_lots=Count("id"))
+        .order_by()
+    )
+
+    buckets = {start: {"quantite": 0, "nb_lots": 0, "familles": {}} for start in starts[:-1]}
+    famille_totals = {}
+    for *key, quantite, nb_lots in rows:
+        bucket = buckets[starts[bisect_right(starts, key[0]) - 1]]
+        bucket["quantite"] += quantite
+        bucket["nb_lots"] += nb_lots
+        if by_famille:
+            fam_id = key[1]
+            bucket["familles"][fam_id] = bucket["familles"].get(fam_id, 0) + quantite
+            famille_totals[fam_id] = famille_totals.get(fam_id, 0) + quantite
+
+    noms = dict(Famille.objects.filter(id__in=famille_totals).values_list("id", "nom"))
+    return {
+        "date": today.isoformat(),
+        "granularity": granularity,
+        "expire": {"quantite": expired["quantite"] or 0, "nb_lots": expired["nb_lots"]},
+        "periodes": [
+            {
+                "debut": start.isoformat(),
+                "fin": (end - timedelta(days=1)).isoformat(),
+                "quantite": buckets[start]["quantite"],
+                "nb_lots": buckets[start]["nb_lots"],
+                "familles": {str(k): v for k, v in buckets[start]["familles"].items()},
+            }
+            for start, end in zip(starts, starts[1:])
+        ],
+        "familles": [
+            {"id": fam_id, "nom": noms.get(fam_id, "-"), "quantite": total}
+            for fam_id, total in sorted(famille_totals.items(), key=lambda item: -item[1])
+        ],
+    }
+
+
+def cached_expiry_horizon(granularity="week", periods=None, famille_id=None, by_famille=False):
+    today = timezone.now().date()
+    key = (
+        f"expiry_horizon:{get_data_version()}:{today}:{granularity}:"
+        f"{periods or ''}:{famille_id or ''}:{int(by_famille)}"
+    )
+    result = cache.get(key)
+    record_cache("expiry_horizon", result is not None)
+    if result is None:
+        result = expiry_horizon(granularity, periods, famille_id, by_famille, today=today)
+        cache.set(key, result, CACHE_TIMEOUT)
+    return result
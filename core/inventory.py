@@ -0,0 +1,306 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Case, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .data_version import bump_data_version
+from .models import InventaireAjustement, InventaireComptage, InventaireSession, Lot, StockCorrection
+from .resolver import resolve_codes
+from .snapshots import record_corrections
+from .transactions import write_atomic
+
+
+BATCH_SIZE = 2000
+
+
+def parse_count_text(text):
+    """Une ligne par comptage : code;quantite[;lot_id]."""
+    lines = []
+    for number, raw in enumerate((text or "").splitlines(), start=1):
+        raw = raw.strip()
+        if not raw or raw.startswith("#"):
+            continue
+        parts = [part.strip() for part in raw.replace("\t", ";").replace(",", ";").split(";")]
+        lines.append(
+            {
+                "ligne": number,
+                "code": parts[0],
+                "quantite": parts[1] if len(parts) > 1 else "1",
+                "lot_id": parts[2] if len(parts) > 2 else "",
+            }
+        )
+    return lines
+
+
+def add_counts(session, lines, cumulative=False):
+    """Enregistre des comptages pour la session.
+
+    Par defaut un nouveau comptage remplace le precedent pour la meme cle
+    (produit ou lot) ; `cumulative=True` additionne (mode scan).
+    Retourne (nombre de cles enregistrees, erreurs).
+    """
+    errors = []
+    produits = resolve_codes(line["code"] for line in lines)
+    lot_ids = {int(line["lot_id"]) for line in lines if str(line.get("lot_id") or "").isdigit()}
+    lots = {
+        lot_id: (produit_id, date_fin)
+        for lot_id, produit_id, date_fin in Lot.objects.filter(id__in=lot_ids).values_list("id", "produit_id", "date_fin")
+    }
+
+    totals = defaultdict(int)
+    for line in lines:
+        ref = produits.get(str(line["code"]).strip().lower())
+        if ref is None:
+            errors.append(f"Ligne {line['ligne']}: produit '{line['code']}' introuvable.")
+            continue
+        try:
+            quantite = int(line["quantite"])
+            if quantite < 0:
+                raise ValueError
+        except (TypeError, ValueError):
+            errors.append(f"Ligne {line['ligne']}: quantite invalide '{line['quantite']}'.")
+            continue
+
+        lot_id = None
+        if line.get("lot_id"):
+            lot_id = int(line["lot_id"]) if str(line["lot_id"]).isdigit() else -1
+            if lots.get(lot_id, (None,))[0] != ref.id:
+                errors.append(f"Ligne {line['ligne']}: lot {line['lot_id']} inconnu pour {ref.reference}.")
+                continue
+        totals[(ref.id, lot_id)] += quantite
+
+    if errors or not totals:
+        return 0, errors
+
+    with write_atomic():
+        existing = InventaireComptage.objects.filter(
+            session=session, produit_id__in={produit_id for produit_id, _ in totals}
+        )
+        previous = {}
+        to_delete = []
+        rows = existing.values_list("id", "produit_id", "lot_numero", "quantite_comptee")
+        for row_id, produit_id, lot_id, quantite in rows:
+            if (produit_id, lot_id) in totals:
+                previous[(produit_id, lot_id)] = quantite
+                to_delete.append(row_id)
+        InventaireComptage.objects.filter(id__in=to_delete).delete()
+        InventaireComptage.objects.bulk_create(
+            [
+                InventaireComptage(
+                    session=session,
+                    produit_id=produit_id,
+                    lot_id=lot_id,
+                    lot_numero=lot_id,
+                    lot_date_fin=lots[lot_id][1] if lot_id else None,
+                    quantite_comptee=quantite + (previous.get((produit_id, lot_id), 0) if cumulative else 0),
+                )
+                for (produit_id, lot_id), quantite in totals.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return len(totals), []
+
+
+def reconciliation(session):
+    """Comptages annotes du stock systeme et de l'ecart, en une requete.
+
+    Un comptage dont le lot a disparu (archive, supprime) n'a ni stock
+    systeme ni ecart (NULL).
+    """
+    stock_produit = (
+        Lot.objects
+        .filter(produit=OuterRef("produit_id"), quantite__gt=0)
+        .order_by()
+        .values("produit")
+        .annotate(total=Sum("quantite"))
+        .values("total")
+    )
+    return (
+        InventaireComptage.objects
+        .filter(session=session)
+        .annotate(
+            systeme=Case(
+                When(lot__isnull=False, then=F("lot__quantite")),
+                When(lot_numero__isnull=False, then=Value(None)),
+                default=Coalesce(Subquery(stock_produit, output_field=IntegerField()), 0),
+                output_field=IntegerField(),
+            ),
+        )
+        .annotate(
+            difference=ExpressionWrapper(F("quantite_comptee") - F("systeme"), output_field=IntegerField()),
+        )
+    )
+
+
+def _fefo_adjust(lots, difference):
+    """Repartit un ecart produit sur ses lots (lots tries FEFO).
+
+    `lots` est une liste de [lot_id, quantite, date_fin]. Un manque est
+    retire des lots les plus proches de la peremption, un surplus est
+    ajoute au prochain lot consomme. Retourne (ajustements, reste).
+    """
+    if difference > 0:
+        if not lots:
+            return [], difference
+        lot_id, quantite, _ = lots[0]
+        return [(lot_id, quantite, quantite + difference)], 0
+
+    changes = []
+    reste = -difference
+    for lot_id, quantite, _ in lots:
+        if reste == 0:
+            break
+        preleve = min(quantite, reste)
+        if preleve:
+            changes.append((lot_id, quantite, quantite - preleve))
+            reste -= preleve
+    return changes, reste
+
+
+def apply_session(session, today=None):
+    """Applique tous les ecarts de la session en une transaction.
+
+    - comptage par lot : la quantite du lot devient la quantite comptee ;
+    - comptage par produit : l'ecart est reparti en FEFO sur ses lots ;
+    - comptage d'un lot archive ou supprime depuis : rejete (non applique),
+      il n'est pas reporte sur les autres lots du produit.
+    Le stock systeme et l'ecart sont figes sur les comptages par deux UPDATE,
+    chaque lot modifie recoit une ligne InventaireAjustement (avant/apres) et
+    les lots sont mis a jour par un seul UPDATE depuis ces ajustements.
+    """
+    today = today or timezone.now().date()
+    summary = {"lots_modifies": 0, "ecarts": 0, "non_appliques": []}
+
+    with write_atomic():
+        session = InventaireSession.objects.select_for_update().get(pk=session.pk)
+        if session.statut != InventaireSession.STATUT_OUVERT:
+            return summary
+
+        comptages = InventaireComptage.objects.filter(session=session)
+        # Sous PostgreSQL, seuls les lots des produits comptes sont verrouilles :
+        # une sortie concurrente sur ces lots attend, les autres passent.
+        list(
+            Lot.objects.filter(produit_id__in=comptages.values("produit_id"))
+            .select_for_update()
+            .values_list("id", flat=True)
+        )
+        lot_quantite = Lot.objects.filter(id=OuterRef("lot_id")).values("quantite")[:1]
+        stock_produit = (
+            Lot.objects
+            .filter(produit=OuterRef("produit_id"), quantite__gt=0)
+            .order_by()
+            .values("produit")
+            .annotate(total=Sum("quantite"))
+            .values("total")
+        )
+        comptages.update(
+            stock_systeme=Case(
+                When(lot__isnull=False, then=Subquery(lot_quantite)),
+                When(lot_numero__isnull=False, then=Value(None)),
+                default=Coalesce(Subquery(stock_produit, output_field=IntegerField()), 0),
+                output_field=IntegerField(),
+            )
+        )
+        comptages.update(ecart=F("quantite_comptee") - F("stock_systeme"))
+
+        rows = list(
+            comptages
+            .exclude(ecart=0)
+            .values_list(
+                "id", "produit_id", "lot_id", "lot_numero", "lot__date_fin", "quantite_comptee", "stock_systeme",
+                "ecart",
+            )
+            .iterator(chunk_size=BATCH_SIZE)
+        )
+        lot_counted = set(
+            comptages.filter(lot_numero__isnull=False).values_list("produit_id", flat=True).distinct()
+        )
+
+        adjustments = []
+        per_product = {}
+        unapplied = {}
+        missing = []
+        for row_id, produit_id, lot_id, lot_numero, date_fin, quantite, systeme, ecart in rows:
+            if lot_id:
+                adjustments.append((lot_id, produit_id, date_fin, systeme, quantite))
+            elif lot_numero:
+                # Lot archive ou supprime depuis le comptage : rien a ajuster.
+                missing.append(row_id)
+            elif produit_id in lot_counted:
+                # Le produit est deja compte lot par lot : on n'ajuste pas deux fois.
+                unapplied[row_id] = 0
+            else:
+                per_product[produit_id] = (row_id, ecart)
+
+        if per_product:
+            lots_by_product = defaultdict(list)
+            lots_qs = (
+                Lot.objects
+                .filter(produit_id__in=per_product.keys(), quantite__gt=0)
+                .order_by("produit_id", "date_fin", "id")
+                .values_list("produit_id", "id", "quantite", "date_fin")
+            )
+            for produit_id, lot_id, quantite, date_fin in lots_qs.iterator(chunk_size=BATCH_SIZE):
+                lots_by_product[produit_id].append((lot_id, quantite, date_fin))
+
+            for produit_id, (row_id, ecart) in per_product.items():
+                lots = lots_by_product[produit_id]
+                if ecart > 0:
+                    # Un surplus va au prochain lot valide, pas a un lot expire.
+                    lots.sort(key=lambda lot: (lot[2] < today, lot[2], lot[0]))
+                changes, reste = _fefo_adjust(lots, ecart)
+                date_fins = {lot_id: date_fin for lot_id, _, date_fin in lots}
+                adjustments.extend(
+                    (lot_id, produit_id, date_fins[lot_id], avant, apres) for lot_id, avant, apres in changes
+                )
+                if reste:
+                    unapplied[row_id] = ecart - reste if ecart > 0 else ecart + reste
+
+        InventaireAjustement.objects.bulk_create(
+            [
+                InventaireAjustement(
+                    session=session,
+                    lot_id=lot_id,
+                    produit_id=produit_id,
+                    lot_numero=lot_id,
+                    lot_date_fin=date_fin,
+                    quantite_avant=avant,
+                    quantite_apres=apres,
+                )
+                for lot_id, produit_id, date_fin, avant, apres in adjustments
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        # Ecarts dates pour stock_at : l'inventaire ne reecrit pas le passe.
+        corrections = defaultdict(int)
+        for _, produit_id, _, avant, apres in adjustments:
+            corrections[produit_id] += apres - avant
+        record_corrections(corrections, StockCorrection.MOTIF_INVENTAIRE, today)
+        ajustements = InventaireAjustement.objects.filter(session=session)
+        Lot.objects.filter(id__in=ajustements.values("lot_id")).update(
+            quantite=Subquery(ajustements.filter(lot_id=OuterRef("pk")).values("quantite_apres")[:1]),
+            modifie_le=timezone.now(),
+        )
+
+        if unapplied:
+            partial = list(InventaireComptage.objects.filter(id__in=unapplied.keys()).select_related("produit"))
+            for comptage in partial:
+                comptage.ecart = unapplied[comptage.id]
+                summary["non_appliques"].append(comptage.produit.reference)
+            InventaireComptage.objects.bulk_update(partial, ["ecart"], batch_size=BATCH_SIZE)
+        if missing:
+            for reference, lot_numero in (
+                InventaireComptage.objects.filter(id__in=missing).values_list("produit__reference", "lot_numero")
+            ):
+                summary["non_appliques"].append(f"{reference} (lot {lot_numero} archive ou supprime)")
+
+        session.statut = InventaireSession.STATUT_APPLIQUE
+        session.applique_le = timezone.now()
+        session.save(update_fields=["statut", "applique_le"])
+
+    summary["lots_modifies"] = len(adjustments)
+    summary["ecarts"] = len(rows) - len(missing) - sum(1 for value in unapplied.values() if value == 0)
+    bump_data_version()
+    return summary
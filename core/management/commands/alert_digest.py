@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.digest import collect_alerts, deliver_outbox
+
+
+class Command(BaseCommand):
+    help = (
+        "Write new or changed stock/expiry alerts since the previous run to the alert outbox, "
+        "then e-mail the unsent ones, one message per famille (ALERT_DIGEST_RECIPIENTS)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recheck the stock of every product, not only those changed since the previous run",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="List the alerts without writing or sending")
+        parser.add_argument("--no-email", action="store_true", help="Fill the outbox only")
+        parser.add_argument(
+            "--recipients",
+            help="Comma-separated addresses, instead of ALERT_DIGEST_RECIPIENTS",
+        )
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=0,
+            help="Scheduled mode: run again every N minutes (0 = run once)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self._run_once(options)
+            if options["every"] <= 0:
+                break
+            time.sleep(options["every"] * 60)
+
+    def _run_once(self, options):
+        start = time.perf_counter()
+        digest, rows = collect_alerts(full=options["full"], dry_run=options["dry_run"])
+        scope = "all products" if digest.complet else "touched products"
+        self.stdout.write(
+            f"{len(rows)} new or changed alert(s) ({scope}) in {(time.perf_counter() - start) * 1000:.0f}ms."
+        )
+        if options["dry_run"]:
+            for row in rows:
+                self.stdout.write(f"  {row.type} {row.niveau} produit={row.produit_id} lot={row.lot_id or '-'}")
+            return
+        if options["no_email"]:
+            return
+
+        recipients = None
+        if options["recipients"]:
+            recipients = [address.strip() for address in options["recipients"].split(",") if address.strip()]
+        emails, sent = deliver_outbox(recipients)
+        digest.envoyees = sent
+        digest.save(update_fields=["envoyees"])
+        if emails:
+            self.stdout.write(self.style.SUCCESS(f"Sent {emails} e-mail(s) for {sent} alert(s)."))
+        elif not (recipients or settings.ALERT_DIGEST_RECIPIENTS):
+            self.stdout.write(self.style.WARNING("No recipients (ALERT_DIGEST_RECIPIENTS): alerts kept in the outbox."))
@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.archive import DEFAULT_CHUNK_SIZE, DEFAULT_RETENTION_DAYS, archive_lots
+
+
+class Command(BaseCommand):
+    help = "Move depleted lots and long-expired lots from Lot to LotArchive in chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--retention-days",
+            type=int,
+            default=DEFAULT_RETENTION_DAYS,
+            help="Archive expired lots whose date_fin is older than this many days",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Lots moved per transaction",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="Only count archivable lots")
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=0,
+            help="Scheduled mode: run again every N minutes (0 = run once)",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            self._run_once(options)
+            if options["every"] <= 0:
+                break
+            time.sleep(options["every"] * 60)
+
+    def _run_once(self, options):
+        def progress(counts):
+            if options["verbosity"] >= 2:
+                self.stdout.write(
+                    f"  ... {counts['epuise']} epuise(s), {counts['expire']} expire(s)"
+                )
+
+        counts = archive_lots(
+            retention_days=max(0, options["retention_days"]),
+            chunk_size=max(1, options["chunk_size"]),
+            dry_run=options["dry_run"],
+            on_chunk=progress,
+        )
+        verb = "Archivable" if options["dry_run"] else "Archived"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{verb}: {counts['epuise']} depleted lot(s), {counts['expire']} expired lot(s)."
+            )
+        )
@@ -0,0 +1,83 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bench import SERVERS, format_summary, free_port, start_server, stop_server, summarize, wait_ready
+
+
+DEFAULT_PATHS = "/,/products/,/alerts/,/lots/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Start the app under gunicorn (WSGI, as in the former start.sh) and under "
+        "gunicorn + uvicorn workers (ASGI), then compare concurrent-request throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+        parser.add_argument("--duration", type=float, default=15.0, help="Seconds of load per server")
+        parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+        parser.add_argument("--threads", type=int, default=1, help="Threads per WSGI worker")
+        parser.add_argument("--paths", default=DEFAULT_PATHS, help="Comma-separated paths to request")
+        parser.add_argument("--only", choices=sorted(SERVERS), help="Benchmark a single server")
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options["paths"].split(",") if path.strip()]
+        for name in [options["only"]] if options["only"] else ["wsgi", "asgi"]:
+            port = free_port()
+            server, command = start_server(name, port, options["workers"], options["threads"])
+            self.stdout.write(f"[{name}] {command}")
+            try:
+                wait_ready(port, server)
+                self._load(name, port, paths, options)
+            except RuntimeError as exc:
+                raise CommandError(str(exc))
+            finally:
+                stop_server(server)
+
+    def _load(self, name, port, paths, options):
+        samples = []
+        errors = []
+        lock = threading.Lock()
+        stop_at = time.monotonic() + options["duration"]
+
+        def client(offset):
+            i = offset
+            while time.monotonic() < stop_at:
+                path = paths[i % len(paths)]
+                i += 1
+                # X-Forwarded-Proto : evite la redirection HTTPS quand DEBUG est faux.
+                request = urllib.request.Request(
+                    f"http://127.0.0.1:{port}{path}",
+                    headers={"X-Forwarded-Proto": "https"},
+                )
+                start = time.perf_counter()
+                try:
+                    with urllib.request.urlopen(request, timeout=60) as response:
+                        response.read()
+                    ok = True
+                except (urllib.error.URLError, OSError):
+                    ok = False
+                elapsed = (time.perf_counter() - start) * 1000.0
+                with lock:
+                    (samples if ok else errors).append(elapsed)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(max(1, options["concurrency"]))]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.monotonic() - started
+
+        self.stdout.write(format_summary(f"[{name}] latency", summarize(samples)))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"[{name}] {len(samples) / wall:.1f} req/s over {wall:.1f}s, "
+                f"{len(errors)} error(s), concurrency {options['concurrency']}"
+            )
+        )
@@ -0,0 +1,94 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Min, Q, Sum
+
+from core.bench import Rollback, format_summary, seed_synthetic, summarize, time_call
+from core.expiry import ALERT_BUCKETS, classify, refresh_expiry, with_next_expiry
+from core.models import Lot, LotExpiration, Produit
+
+
+class Command(BaseCommand):
+    help = "Compare live expiry computation with reads from the LotExpiration table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10, help="Runs per scenario")
+        parser.add_argument(
+            "--seed-lots",
+            type=int,
+            default=0,
+            help="Insert N synthetic lots first (rolled back at the end)",
+        )
+        parser.add_argument("--seed-produits", type=int, default=20000, help="Synthetic produits")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options["seed_lots"]:
+                    self.stdout.write(
+                        f"Seeding {options['seed_produits']} produits / {options['seed_lots']} lots..."
+                    )
+                    seed_synthetic(produits=options["seed_produits"], lots=options["seed_lots"])
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        elapsed, count = time_call(refresh_expiry)
+        self.stdout.write(f"Full refresh: {count} lot(s) in {elapsed:.0f}ms")
+        today = date.today()
+
+        def alerts_live():
+            rows = (
+                Lot.objects
+                .filter(quantite__gt=0)
+                .values_list("id", "date_fin", "produit__nbr_days_alert")
+            )
+            return [
+                lot_id for lot_id, date_fin, days in rows
+                if classify(date_fin, days, today)[0] in ALERT_BUCKETS
+            ]
+
+        def alerts_table():
+            return list(
+                LotExpiration.objects
+                .filter(bucket__in=ALERT_BUCKETS, lot__quantite__gt=0)
+                .values_list("lot_id", flat=True)
+            )
+
+        def next_expiry_live():
+            rows = (
+                Produit.objects
+                .annotate(
+                    stock_total=Sum("lots__quantite"),
+                    next_fin=Min("lots__date_fin", filter=Q(lots__quantite__gt=0)),
+                )
+                .values_list("id", "next_fin", "nbr_days_alert")
+            )
+            return [
+                (pid, classify(next_fin, days, today) if next_fin else None)
+                for pid, next_fin, days in rows
+            ]
+
+        def next_expiry_table():
+            return list(
+                with_next_expiry(Produit.objects.annotate(stock_total=Sum("lots__quantite")))
+                .values_list("id", "next_bucket", "next_days_left")
+            )
+
+        scenarios = (
+            ("alerts live", alerts_live),
+            ("alerts table", alerts_table),
+            ("next expiry live", next_expiry_live),
+            ("next expiry table", next_expiry_table),
+        )
+        for label, func in scenarios:
+            samples = [time_call(func)[0] for _ in range(max(1, options["iterations"]))]
+            self.stdout.write(format_summary(label, summarize(samples)))
+
+        if sorted(alerts_live()) != sorted(alerts_table()):
+            self.stdout.write(self.style.ERROR("Live and table alert lists differ."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Live and table alert lists match."))
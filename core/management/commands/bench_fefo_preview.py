@@ -0,0 +1,68 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+
+from core.bench import Rollback, format_summary, seed_synthetic, summarize, time_call
+from core.models import Produit
+from core.resolver import get_code_index
+from core.views import fefo_preview
+
+
+class Command(BaseCommand):
+    help = "Measure fefo_preview latency (p50/p95/p99) on current or synthetic data."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=2000, help="Number of preview calls")
+        parser.add_argument(
+            "--seed-lots",
+            type=int,
+            default=0,
+            help="Insert N synthetic lots first (rolled back at the end)",
+        )
+        parser.add_argument("--seed-produits", type=int, default=100000, help="Synthetic produits")
+        parser.add_argument("--miss-ratio", type=float, default=0.1, help="Share of unknown codes")
+        parser.add_argument("--target-ms", type=float, default=20.0, help="p99 target in ms")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options["seed_lots"]:
+                    self.stdout.write(
+                        f"Seeding {options['seed_produits']} produits / {options['seed_lots']} lots..."
+                    )
+                    seed_synthetic(produits=options["seed_produits"], lots=options["seed_lots"])
+                self._run(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def _run(self, options):
+        codes = list(Produit.objects.values_list("barcode", flat=True))
+        if not codes:
+            self.stdout.write(self.style.WARNING("No produits: use --seed-lots or seed_demo_data."))
+            return
+
+        factory = RequestFactory()
+        time_ms, _ = time_call(get_code_index)
+        self.stdout.write(f"Code index warmup: {time_ms:.1f}ms for {len(codes)} produits")
+
+        samples = []
+        for _ in range(max(1, options["iterations"])):
+            if random.random() < options["miss_ratio"]:
+                code = "UNKNOWN-CODE"
+            else:
+                code = random.choice(codes)
+            request = factory.get("/movements/fefo/", {"code": code, "quantite": 1})
+            elapsed, response = time_call(fefo_preview, request)
+            if response.status_code != 200:
+                self.stderr.write(f"Unexpected status {response.status_code} for {code}")
+            samples.append(elapsed)
+
+        summary = summarize(samples)
+        self.stdout.write(format_summary("fefo_preview", summary))
+        if summary["p99"] <= options["target_ms"]:
+            self.stdout.write(self.style.SUCCESS(f"p99 within target ({options['target_ms']}ms)."))
+        else:
+            self.stdout.write(self.style.ERROR(f"p99 above target ({options['target_ms']}ms)."))
@@ -0,0 +1,235 @@
+import random
+import threading
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+
+from core.bench import format_summary, seed_synthetic, summarize
+from core.bulk_delete import delete_famille
+from core.fefo import allocate_exit, available_lots
+from core.models import Famille, Lot, Site, Sort
+
+
+PREFIX = "BENCHSITES"
+PHASES = ("same", "split")
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent FEFO exits per site: the same threads first all consume on one "
+        "site (same), then each on its own site (split). Reports throughput, latency "
+        "percentiles and lock failures per phase, and how many lots an exit locks with and "
+        "without the site scope. Synthetic sites, products and lots are committed (threads "
+        "use their own connections) and deleted at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sites", type=int, default=4, help="Synthetic sites")
+        parser.add_argument("--threads", type=int, default=4, help="Concurrent exit threads")
+        parser.add_argument("--produits", type=int, default=5, help="Products, stocked on every site")
+        parser.add_argument("--lots", type=int, default=4, help="Lots per product and site")
+        parser.add_argument("--duration", type=float, default=5.0, help="Seconds per phase")
+        parser.add_argument(
+            "--hold-ms",
+            type=float,
+            default=5.0,
+            help="Time each exit keeps its transaction (and locks) open after the allocation",
+        )
+        parser.add_argument("--max-qty", type=int, default=3, help="Max quantity per exit")
+
+    def handle(self, *args, **options):
+        site_ids, produits = self._seed(options)
+        try:
+            self._report_scope(site_ids, produits)
+            results = {phase: self._run(phase, site_ids, produits, options) for phase in PHASES}
+            self._report(results, options)
+            self._check_consistency(site_ids, results)
+        finally:
+            self._cleanup(site_ids)
+
+    # ------------------------------------------------------------------
+    # Jeu de test
+    # ------------------------------------------------------------------
+    def _seed(self, options):
+        today = date.today()
+        sites = Site.objects.bulk_create(
+            [Site(nom=f"{PREFIX}-SITE-{i:02d}") for i in range(max(1, options["sites"]))]
+        )
+        site_ids = [site.pk for site in sites]
+        produits = seed_synthetic(produits=max(1, options["produits"]), lots=0, familles=1, prefix=PREFIX)
+        # Assez de stock pour toute la mesure : une sortie ne doit pas echouer faute de lots.
+        Lot.objects.bulk_create(
+            [
+                Lot(
+                    produit=produit,
+                    site_id=site_id,
+                    quantite=100000,
+                    quantite_initiale=100000,
+                    date_entree=today,
+                    date_fin=today + timedelta(days=30 + 30 * n),
+                )
+                for site_id in site_ids
+                for produit in produits
+                for n in range(max(1, options["lots"]))
+            ],
+            batch_size=5000,
+        )
+        self.stdout.write(
+            f"Seeded {len(site_ids)} sites x {len(produits)} produits x {options['lots']} lots "
+            f"({connection.vendor})."
+        )
+        return site_ids, produits
+
+    def _cleanup(self, site_ids):
+        for famille_id in Famille.objects.filter(nom__startswith=f"{PREFIX}-").values_list("id", flat=True):
+            delete_famille(famille_id)
+        Site.objects.filter(id__in=site_ids).delete()
+
+    def _site_stock(self, site_ids, produits):
+        return dict(
+            Lot.objects
+            .filter(site_id__in=site_ids, produit__in=produits)
+            .values("site_id")
+            .annotate(total=Sum("quantite"))
+            .values_list("site_id", "total")
+        )
+
+    # ------------------------------------------------------------------
+    # Charge
+    # ------------------------------------------------------------------
+    def _run(self, phase, site_ids, produits, options):
+        today = date.today()
+        hold = options["hold_ms"] / 1000.0
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {"samples": [], "locks": 0, "stock_outs": 0, "quantite": {}}
+        before = self._site_stock(site_ids, produits)
+
+        def worker(index):
+            site_id = site_ids[0] if phase == "same" else site_ids[index % len(site_ids)]
+            rng = random.Random(index)
+            samples, locks, stock_outs, quantite = [], 0, 0, 0
+            try:
+                while not stop.is_set():
+                    produit = rng.choice(produits)
+                    qty = rng.randint(1, max(1, options["max_qty"]))
+                    start = time.perf_counter()
+                    try:
+                        # La transaction externe garde les verrous du site pendant `hold`.
+                        with transaction.atomic():
+                            sortie = allocate_exit(produit, qty, site_id, today)
+                            if hold:
+                                time.sleep(hold)
+                    except OperationalError:
+                        locks += 1
+                        continue
+                    samples.append((time.perf_counter() - start) * 1000.0)
+                    if sortie is None:
+                        stock_outs += 1
+                    else:
+                        quantite += qty
+            finally:
+                connection.close()
+                with lock:
+                    stats["samples"].extend(samples)
+                    stats["locks"] += locks
+                    stats["stock_outs"] += stock_outs
+                    stats["quantite"][site_id] = stats["quantite"].get(site_id, 0) + quantite
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(max(1, options["threads"]))]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(options["duration"])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        stats["wall"] = time.perf_counter() - started
+
+        after = self._site_stock(site_ids, produits)
+        stats["stock_delta"] = {site_id: before[site_id] - after[site_id] for site_id in site_ids}
+        return stats
+
+    # ------------------------------------------------------------------
+    # Rapport
+    # ------------------------------------------------------------------
+    def _report_scope(self, site_ids, produits):
+        today = date.today()
+        produit = produits[0]
+        scoped = available_lots(produit.id, site_ids[0], today).count()
+        unscoped = Lot.objects.filter(produit=produit, quantite__gt=0, date_fin__gte=today).count()
+        self.stdout.write(
+            f"Lots locked per exit: {scoped} with the site scope, {unscoped} without "
+            f"(one product, {len(site_ids)} sites)."
+        )
+        lookup = available_lots(produit.id, site_ids[0], today).order_by("date_fin", "id")
+        sql, params = lookup.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plan = " / ".join(row[-1] for row in cursor.fetchall())
+            elif connection.vendor == "postgresql":
+                cursor.execute(f"EXPLAIN {sql}", params)
+                plan = " / ".join(row[0].strip() for row in cursor.fetchall())
+            else:
+                plan = "n/a"
+        self.stdout.write(f"FEFO lookup plan: {plan}")
+
+    def _report(self, results, options):
+        self.stdout.write(
+            f"{options['threads']} threads, {options['duration']}s per phase, "
+            f"hold {options['hold_ms']}ms per exit."
+        )
+        for phase in PHASES:
+            stats = results[phase]
+            summary = summarize(stats["samples"])
+            attempts = summary["count"] + stats["locks"]
+            self.stdout.write(format_summary(f"[{phase}] exit", summary))
+            self.stdout.write(
+                f"[{phase}] throughput={summary['count'] / stats['wall']:.1f} exits/s "
+                f"lock_failures={stats['locks']} ({100.0 * stats['locks'] / attempts if attempts else 0:.1f}%) "
+                f"stock_outs={stats['stock_outs']}"
+            )
+
+        same = summarize(results["same"]["samples"])
+        split = summarize(results["split"]["samples"])
+        ratio = (split["count"] / results["split"]["wall"]) / max(same["count"] / results["same"]["wall"], 1e-9)
+        self.stdout.write(f"Throughput split/same: x{ratio:.2f}")
+        if connection.vendor == "sqlite":
+            self.stdout.write(self.style.WARNING(
+                "SQLite takes one write lock for the whole database: exits on different sites "
+                "still run one at a time. Run against PostgreSQL to see per-site row locks."
+            ))
+
+    def _check_consistency(self, site_ids, results):
+        problems = []
+        for phase in PHASES:
+            stats = results[phase]
+            for site_id in site_ids:
+                expected = stats["quantite"].get(site_id, 0)
+                if stats["stock_delta"][site_id] != expected:
+                    problems.append(
+                        f"[{phase}] site {site_id}: stock -{stats['stock_delta'][site_id]}, exits {expected}"
+                    )
+        recorded = dict(
+            Sort.objects
+            .filter(site_id__in=site_ids)
+            .values("site_id")
+            .annotate(total=Sum("quantite"))
+            .values_list("site_id", "total")
+        )
+        for site_id in site_ids:
+            exits = sum(results[phase]["quantite"].get(site_id, 0) for phase in PHASES)
+            if recorded.get(site_id, 0) != exits:
+                problems.append(f"site {site_id}: Sort {recorded.get(site_id, 0)}, exits {exits}")
+        if Lot.objects.filter(site_id__in=site_ids, quantite__lt=0).exists():
+            problems.append("negative lot quantities")
+
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(problem))
+        else:
+            self.stdout.write(self.style.SUCCESS("Stock consistent: every site lost exactly its own exits."))
@@ -0,0 +1,166 @@
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import nullcontext
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core.bench import (
+    format_summary, free_port, seed_synthetic, sqlite_copy, start_server, stop_server, summarize, wait_ready,
+)
+
+
+DEFAULT_PATHS = "/,/alerts/"
+MODES = {
+    # Demarrage de start.sh avant le prechauffage.
+    "cold": [],
+    "preload": ["--preload"],
+}
+PREFIX = "BENCHSTART"
+
+
+class Command(BaseCommand):
+    help = (
+        "Start gunicorn + uvicorn workers cold, then with --preload (warmup in the master "
+        "before forking), send --rounds rounds of concurrent requests on every path and measure "
+        "the time from launch to the first fast round: every path within --fast-factor of its "
+        "steady latency (median of the slowest response of the last rounds). Also reports the "
+        "latency of the first round."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+        parser.add_argument("--paths", default=DEFAULT_PATHS, help="Comma-separated paths to request")
+        parser.add_argument("--rounds", type=int, default=10, help="Rounds of requests after each start")
+        parser.add_argument(
+            "--fast-factor",
+            type=float,
+            default=1.5,
+            help="A round is fast when every path is within this factor of its steady latency",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=0,
+            help="Concurrent requests per path and round (default: 2 per worker, to reach every worker)",
+        )
+        parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the server to listen")
+        parser.add_argument("--runs", type=int, default=1, help="Starts per mode")
+        parser.add_argument("--only", choices=sorted(MODES), help="Benchmark a single mode")
+        parser.add_argument(
+            "--produits",
+            type=int,
+            default=0,
+            help="Synthetic products to add for the measure, in a temporary copy of the database",
+        )
+        parser.add_argument("--lots", type=int, default=0, help="Synthetic lots for --produits")
+
+    def handle(self, *args, **options):
+        paths = [path.strip() for path in options["paths"].split(",") if path.strip()]
+        concurrency = options["concurrency"] or 2 * max(1, options["workers"])
+        if options["produits"] and connection.vendor != "sqlite":
+            raise CommandError("--produits needs a SQLite database (it seeds a temporary copy).")
+        # Avec --produits, le jeu synthetique et les serveurs utilisent une
+        # copie de la base, supprimee a la fin : la vraie base n'est pas touchee.
+        with sqlite_copy() if options["produits"] else nullcontext() as path:
+            env = {"SQLITE_PATH": path} if path else None
+            if path:
+                seed_synthetic(produits=options["produits"], lots=options["lots"], prefix=PREFIX)
+                self.stdout.write(f"Seeded {options['produits']} produits / {options['lots']} lots in {path}.")
+            results = {}
+            for mode in [options["only"]] if options["only"] else list(MODES):
+                results[mode] = [
+                    self._start(mode, paths, concurrency, options, env) for _ in range(max(1, options["runs"]))
+                ]
+            self._report(results)
+
+    def _start(self, mode, paths, concurrency, options, env):
+        port = free_port()
+        launched = time.perf_counter()
+        server, command = start_server("asgi", port, options["workers"], extra_args=MODES[mode], env=env)
+        self.stdout.write(f"[{mode}] {command}")
+        try:
+            wait_ready(port, server, timeout=options["timeout"])
+            listening = time.perf_counter() - launched
+            rounds = []
+            for _ in range(max(2, options["rounds"])):
+                samples = self._round(port, paths, concurrency)
+                rounds.append((time.perf_counter() - launched, samples))
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+        finally:
+            stop_server(server)
+
+        # Regime etabli : mediane des pires latences de la seconde moitie des tours.
+        steady = {}
+        for path in paths:
+            tail = sorted(max(samples[path]) for _, samples in rounds[len(rounds) // 2:])
+            steady[path] = tail[len(tail) // 2]
+        fast = next(
+            (
+                elapsed
+                for elapsed, samples in rounds
+                if all(max(samples[path]) <= steady[path] * options["fast_factor"] for path in paths)
+            ),
+            None,
+        )
+        first_round = [ms for path in paths for ms in rounds[0][1][path]]
+        self.stdout.write(format_summary(f"[{mode}] first round", summarize(first_round)))
+        self.stdout.write(
+            f"[{mode}] steady "
+            + ", ".join(f"{path} {steady[path]:.0f}ms" for path in paths)
+            + f"; listening after {listening:.2f}s, first fast round after "
+            + (f"{fast:.2f}s" if fast is not None else "never")
+        )
+        if fast is None:
+            raise CommandError(f"[{mode}] no round within x{options['fast_factor']} of the steady latency.")
+        return {"listening": listening, "fast": fast, "first_max": max(first_round)}
+
+    def _round(self, port, paths, concurrency):
+        """`concurrency` requetes simultanees par chemin ; les erreurs comptent comme lentes."""
+        samples = {path: [] for path in paths}
+        lock = threading.Lock()
+
+        def client(path):
+            # X-Forwarded-Proto : evite la redirection HTTPS quand DEBUG est faux.
+            request = urllib.request.Request(
+                f"http://127.0.0.1:{port}{path}",
+                headers={"X-Forwarded-Proto": "https"},
+            )
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                elapsed = (time.perf_counter() - start) * 1000.0
+            except (urllib.error.URLError, OSError):
+                elapsed = float("inf")
+            with lock:
+                samples[path].append(elapsed)
+
+        threads = [threading.Thread(target=client, args=(path,)) for path in paths for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return samples
+
+    def _report(self, results):
+        for mode, runs in results.items():
+            fast = sorted(run["fast"] for run in runs)
+            first = sorted(run["first_max"] for run in runs)
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"[{mode}] time to first fast response: median {fast[len(fast) // 2]:.2f}s "
+                    f"(min {fast[0]:.2f}s, max {fast[-1]:.2f}s); slowest first-round request "
+                    f"median {first[len(first) // 2]:.0f}ms"
+                )
+            )
+        if "cold" in results and "preload" in results:
+            cold = sorted(run["fast"] for run in results["cold"])
+            preload = sorted(run["fast"] for run in results["preload"])
+            self.stdout.write(
+                f"Time to first fast response preload/cold: "
+                f"x{preload[len(preload) // 2] / max(cold[len(cold) // 2], 1e-9):.2f}"
+            )
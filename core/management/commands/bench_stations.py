@@ -0,0 +1,323 @@
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Max, Q, Sum
+
+from core.bench import SERVERS, format_summary, free_port, start_server, stop_server, summarize, wait_ready
+from core.models import Lot, Produit, Sort, SortieLot
+
+
+LOCK_MARKER = "OperationalError: database is locked"
+CSRF_INPUT = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+OPERATIONS = ("scan", "consume", "dashboard", "alerts")
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Le 302 du POST /movements/ suffit : ne pas recharger la page a chaque sortie.
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the scanner stations: N simulated stations run scan (FEFO preview) + "
+        "consume (POST /movements/) sequences on hot and cold products, alongside "
+        "dashboard/alerts readers and idle SSE connections. Reports throughput, latency "
+        "percentiles, error and lock-failure rates, then checks stock consistency. "
+        "Consumes real stock: run it on a copy of the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stations", type=int, default=8, help="Simulated scanner stations")
+        parser.add_argument("--readers", type=int, default=2, help="Dashboard/alerts readers")
+        parser.add_argument("--sse", type=int, default=10, help="Idle SSE connections")
+        parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+        parser.add_argument("--hot", type=int, default=5, help="Number of hot products")
+        parser.add_argument("--cold", type=int, default=50, help="Number of cold products")
+        parser.add_argument("--hot-ratio", type=float, default=0.8, help="Share of scans on hot products")
+        parser.add_argument("--max-qty", type=int, default=3, help="Max quantity per exit")
+        parser.add_argument("--think-ms", type=int, default=200, help="Pause between two scans of a station")
+        parser.add_argument("--server", choices=sorted(SERVERS), default="asgi", help="Server to start")
+        parser.add_argument("--workers", type=int, default=2, help="gunicorn worker processes")
+        parser.add_argument("--threads", type=int, default=1, help="Threads per WSGI worker")
+        parser.add_argument("--url", help="Use an already running server (e.g. http://127.0.0.1:8000)")
+
+    def handle(self, *args, **options):
+        hot, cold = self._pick_products(options["hot"], options["cold"])
+        produit_ids = [p.id for p in hot + cold]
+        baseline = self._baseline(produit_ids)
+
+        log = tempfile.TemporaryFile(mode="w+")
+        server = None
+        if options["url"]:
+            base_url = options["url"].rstrip("/")
+        else:
+            port = free_port()
+            server, command = start_server(
+                options["server"], port, options["workers"], options["threads"], log=log
+            )
+            self.stdout.write(f"[{options['server']}] {command}")
+            base_url = f"http://127.0.0.1:{port}"
+        try:
+            if server is not None:
+                try:
+                    wait_ready(port, server)
+                except RuntimeError as exc:
+                    raise CommandError(str(exc))
+            stats, wall = self._run(base_url, hot, cold, options)
+        finally:
+            if server is not None:
+                stop_server(server)
+
+        log.seek(0)
+        logged_locks = sum(1 for line in log if LOCK_MARKER in line and line.startswith("django."))
+        log.close()
+
+        self._report(stats, wall, logged_locks if server is not None else None, options)
+        self._check_consistency(produit_ids, baseline)
+
+    # ------------------------------------------------------------------
+    # Jeu de test et etat initial
+    # ------------------------------------------------------------------
+    def _pick_products(self, hot_count, cold_count):
+        today = date.today()
+        ranked = list(
+            Produit.objects
+            .annotate(stock=Sum("lots__quantite", filter=Q(lots__quantite__gt=0, lots__date_fin__gte=today)))
+            .filter(stock__gt=0)
+            .order_by("-stock")
+            .only("id", "reference", "barcode")
+        )
+        if not ranked:
+            raise CommandError("No product with valid stock: seed data first (seed_demo_data).")
+        hot = ranked[:max(1, hot_count)]
+        rest = ranked[len(hot):]
+        cold = random.sample(rest, min(len(rest), max(0, cold_count)))
+        return hot, cold
+
+    def _baseline(self, produit_ids):
+        return {
+            "sort_id": Sort.objects.aggregate(m=Max("id"))["m"] or 0,
+            "allocation_id": SortieLot.objects.aggregate(m=Max("id"))["m"] or 0,
+            "stock": self._stock_by_product(produit_ids),
+        }
+
+    def _stock_by_product(self, produit_ids):
+        return dict(
+            Lot.objects
+            .filter(produit_id__in=produit_ids)
+            .values("produit_id")
+            .annotate(total=Sum("quantite"))
+            .values_list("produit_id", "total")
+        )
+
+    # ------------------------------------------------------------------
+    # Charge
+    # ------------------------------------------------------------------
+    def _run(self, base_url, hot, cold, options):
+        host = urllib.parse.urlsplit(base_url).netloc
+        # X-Forwarded-Proto : evite la redirection HTTPS quand DEBUG est faux ;
+        # le Referer doit alors correspondre a l'hote pour le controle CSRF.
+        headers = {"X-Forwarded-Proto": "https", "Referer": f"https://{host}/movements/"}
+        opener = urllib.request.build_opener(_NoRedirect)
+        stop = threading.Event()
+        lock = threading.Lock()
+        stats = {
+            "samples": defaultdict(list),
+            "errors": defaultdict(int),
+            "locks": 0,
+            "stock_outs": 0,
+            "sse_open": 0,
+            "sse_events": 0,
+        }
+
+        def call(name, path, data=None, extra=None):
+            request = urllib.request.Request(
+                base_url + path,
+                data=urllib.parse.urlencode(data).encode() if data is not None else None,
+                headers={**headers, **(extra or {})},
+            )
+            start = time.perf_counter()
+            body, status = b"", 0
+            try:
+                with opener.open(request, timeout=60) as response:
+                    body, status = response.read(), response.status
+            except urllib.error.HTTPError as exc:
+                body, status = exc.read(), exc.code
+            except (urllib.error.URLError, OSError):
+                status = 0
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with lock:
+                if 0 < status < 400:
+                    stats["samples"][name].append(elapsed)
+                else:
+                    stats["errors"][name] += 1
+                    if LOCK_MARKER.encode() in body:
+                        stats["locks"] += 1
+            return status, body
+
+        def station(seed):
+            rng = random.Random(seed)
+            status, body = call("page", "/movements/")
+            match = CSRF_INPUT.search(body.decode(errors="replace"))
+            if not match:
+                with lock:
+                    stats["errors"]["csrf"] += 1
+                return
+            # Le formulaire masque donne le jeton ; le cookie csrftoken est "Secure",
+            # on le renvoie a la main comme le ferait le navigateur de la station.
+            token = match.group(1)
+            cookie = {"Cookie": f"csrftoken={token}"}
+            while not stop.is_set():
+                produit = rng.choice(hot) if not cold or rng.random() < options["hot_ratio"] else rng.choice(cold)
+                code = produit.barcode or produit.reference
+                quantite = rng.randint(1, max(1, options["max_qty"]))
+                status, body = call("scan", "/movements/fefo/?" + urllib.parse.urlencode(
+                    {"code": code, "quantite": quantite}
+                ))
+                if status == 200 and b'"suffisant": false' in body:
+                    with lock:
+                        stats["stock_outs"] += 1
+                else:
+                    call(
+                        "consume", "/movements/",
+                        {"csrfmiddlewaretoken": token, "code": code, "quantite": quantite},
+                        cookie,
+                    )
+                stop.wait(options["think_ms"] / 1000.0)
+
+        def reader(offset):
+            i = offset
+            while not stop.is_set():
+                name, path = (("dashboard", "/"), ("alerts", "/alerts/"))[i % 2]
+                i += 1
+                call(name, path)
+                stop.wait(1.0)
+
+        def idle_sse():
+            request = urllib.request.Request(base_url + "/updates/stream/", headers=headers)
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    with lock:
+                        stats["sse_open"] += 1
+                    while not stop.is_set():
+                        line = response.readline()
+                        if not line:
+                            break
+                        if line.startswith(b"event: data-update"):
+                            with lock:
+                                stats["sse_events"] += 1
+            except (urllib.error.URLError, OSError):
+                with lock:
+                    stats["errors"]["sse"] += 1
+
+        # Les flux SSE restent bloques en lecture : threads demons, fermes avec le serveur.
+        for _ in range(max(0, options["sse"])):
+            threading.Thread(target=idle_sse, daemon=True).start()
+        workers = [threading.Thread(target=station, args=(i,)) for i in range(max(1, options["stations"]))]
+        workers += [threading.Thread(target=reader, args=(i,)) for i in range(max(0, options["readers"]))]
+
+        started = time.monotonic()
+        for thread in workers:
+            thread.start()
+        stop.wait(options["duration"])
+        stop.set()
+        for thread in workers:
+            thread.join()
+        return stats, time.monotonic() - started
+
+    # ------------------------------------------------------------------
+    # Rapport
+    # ------------------------------------------------------------------
+    def _report(self, stats, wall, logged_locks, options):
+        samples, errors = stats["samples"], stats["errors"]
+        total_ok = sum(len(values) for values in samples.values())
+        total_err = sum(errors.values())
+        total = total_ok + total_err
+
+        for name in OPERATIONS:
+            if samples[name] or errors[name]:
+                self.stdout.write(
+                    format_summary(f"{name:<9}", summarize(samples[name])) + f" errors={errors[name]}"
+                )
+
+        consumes = len(samples["consume"]) + errors["consume"]
+        locks = stats["locks"] if logged_locks is None else max(stats["locks"], logged_locks)
+        self.stdout.write(
+            f"stations={options['stations']} readers={options['readers']} "
+            f"sse={stats['sse_open']}/{options['sse']} open, {stats['sse_events']} update event(s) received"
+        )
+        self.stdout.write(
+            f"throughput: {total_ok / wall:.1f} req/s, {len(samples['consume']) / wall:.1f} exits/s "
+            f"over {wall:.1f}s; {stats['stock_outs']} scan(s) refused for insufficient stock"
+        )
+        style = self.style.SUCCESS if not total_err else self.style.WARNING
+        self.stdout.write(
+            style(
+                f"errors: {total_err}/{total} ({100.0 * total_err / total if total else 0:.2f}%), "
+                f"lock failures: {locks}/{consumes} exits "
+                f"({100.0 * locks / consumes if consumes else 0:.2f}%)"
+            )
+        )
+        if logged_locks is None:
+            self.stdout.write("(--url: lock failures only detected on DEBUG error pages; check the server log)")
+
+    def _check_consistency(self, produit_ids, baseline):
+        """Stock consomme = sorties creees = allocations par lot, sans lot negatif."""
+        after = self._stock_by_product(produit_ids)
+        sorties = dict(
+            Sort.objects
+            .filter(id__gt=baseline["sort_id"], produit_id__in=produit_ids)
+            .values("produit_id")
+            .annotate(total=Sum("quantite"))
+            .values_list("produit_id", "total")
+        )
+        allocations = dict(
+            SortieLot.objects
+            .filter(id__gt=baseline["allocation_id"], produit_id__in=produit_ids)
+            .values("produit_id")
+            .annotate(total=Sum("quantite"))
+            .values_list("produit_id", "total")
+        )
+        split_mismatch = (
+            Sort.objects
+            .filter(id__gt=baseline["sort_id"])
+            .annotate(alloue=Sum("allocations__quantite"))
+            .exclude(alloue=F("quantite"))
+            .count()
+        )
+
+        problems = []
+        for produit_id in produit_ids:
+            consumed = (baseline["stock"].get(produit_id) or 0) - (after.get(produit_id) or 0)
+            if not consumed == sorties.get(produit_id, 0) == allocations.get(produit_id, 0):
+                problems.append(
+                    f"produit {produit_id}: stock -{consumed}, sorties {sorties.get(produit_id, 0)}, "
+                    f"allocations {allocations.get(produit_id, 0)}"
+                )
+        negative = Lot.objects.filter(produit_id__in=produit_ids, quantite__lt=0).count()
+        if negative:
+            problems.append(f"{negative} lot(s) with negative quantity")
+        if split_mismatch:
+            problems.append(f"{split_mismatch} sortie(s) whose lot allocations do not add up")
+
+        exits = Sort.objects.filter(id__gt=baseline["sort_id"]).count()
+        if problems:
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(problem))
+            raise CommandError(f"Stock inconsistent after {exits} exit(s).")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"stock consistent: {exits} exit(s), {sum(sorties.values())} unit(s) consumed "
+                f"on {len(produit_ids)} product(s)"
+            )
+        )
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk_delete import DEFAULT_CHUNK_SIZE, delete_famille, delete_produits
+from core.data_version import bump_data_version
+from core.models import Famille, Produit
+
+
+class Command(BaseCommand):
+    help = "Delete a famille with all its produits, or some produits, in chunked transactions."
+
+    def add_arguments(self, parser):
+        target = parser.add_mutually_exclusive_group(required=True)
+        target.add_argument("--famille", help="Famille id or name to delete with its produits")
+        target.add_argument("--produit", action="append", help="Produit id or reference (repeatable)")
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Rows deleted per transaction",
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options["chunk_size"])
+
+        def progress(label, total):
+            self.stdout.write(f"  {label}: {total} supprime(s)")
+
+        if options["famille"]:
+            value = options["famille"]
+            fam = Famille.objects.filter(nom=value).first()
+            if fam is None and value.isdigit():
+                fam = Famille.objects.filter(pk=value).first()
+            if fam is None:
+                raise CommandError(f"Famille introuvable: {value}")
+            self.stdout.write(f"Suppression de la famille '{fam.nom}' ({fam.produits.count()} produit(s))...")
+            counts = delete_famille(fam.pk, chunk_size=chunk_size, on_progress=progress)
+        else:
+            ids = []
+            for value in options["produit"]:
+                produit = Produit.objects.filter(reference=value).first()
+                if produit is None and value.isdigit():
+                    produit = Produit.objects.filter(pk=value).first()
+                if produit is None:
+                    raise CommandError(f"Produit introuvable: {value}")
+                ids.append(produit.pk)
+            counts = delete_produits(ids, chunk_size=chunk_size, on_progress=progress)
+
+        bump_data_version(catalog=True)
+        summary = ", ".join(f"{label}={count}" for label, count in sorted(counts.items())) or "rien"
+        self.stdout.write(self.style.SUCCESS(f"Done: {summary}."))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.expiry import BATCH_SIZE, check_expiry, refresh_expiry
+
+
+class Command(BaseCommand):
+    help = "Compare the LotExpiration table with a live computation and report missing or wrong rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="Recompute the rows found inconsistent")
+
+    def handle(self, *args, **options):
+        report = check_expiry()
+        missing, stale, mismatch = report["missing"], report["stale"], report["mismatch"]
+        self.stdout.write(
+            f"{report['total']} lot(s) checked: {len(missing)} missing, "
+            f"{len(stale)} stale, {len(mismatch)} mismatched."
+        )
+        for label, ids in (("missing", missing), ("stale", stale), ("mismatched", mismatch)):
+            if ids and options["verbosity"] >= 2:
+                self.stdout.write(f"  {label}: {', '.join(str(i) for i in ids[:50])}")
+
+        bad = missing + stale + mismatch
+        if not bad:
+            self.stdout.write(self.style.SUCCESS("LotExpiration is consistent."))
+            return
+
+        if options["fix"]:
+            # Table perimee ou trop d'ecarts : un recalcul complet coute moins qu'un gros IN.
+            if stale or len(bad) > BATCH_SIZE:
+                fixed = refresh_expiry()
+            else:
+                fixed = refresh_expiry(lot_ids=bad)
+            self.stdout.write(self.style.SUCCESS(f"{fixed} row(s) recomputed."))
+            return
+        raise CommandError(f"{len(bad)} inconsistent lot(s), run with --fix.")
@@ -0,0 +1,50 @@
+import io
+import os
+import pstats
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = "Merge the stored request profiles and print the top hotspots per view."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--view", help="Only this view (directory name under PROFILING_DIR)")
+        parser.add_argument("--limit", type=int, default=20, help="Functions listed per view")
+        parser.add_argument(
+            "--sort",
+            choices=["cumulative", "tottime", "ncalls"],
+            default="cumulative",
+            help="Sort key for the hotspot list",
+        )
+        parser.add_argument("--dir", default=None, help="Profiles directory (default: PROFILING_DIR)")
+
+    def handle(self, *args, **options):
+        root = options["dir"] or settings.PROFILING_DIR
+        if not os.path.isdir(root):
+            raise CommandError(f"No profiles directory: {root}")
+
+        views = sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+        if options["view"]:
+            if options["view"] not in views:
+                raise CommandError(f"No profiles for view '{options['view']}'. Known: {', '.join(views) or '-'}")
+            views = [options["view"]]
+
+        for view in views:
+            view_dir = os.path.join(root, view)
+            files = sorted(
+                os.path.join(view_dir, name) for name in os.listdir(view_dir) if name.endswith(".prof")
+            )
+            if not files:
+                continue
+
+            # pstats ecrit par morceaux : on passe par un tampon plutot que self.stdout.
+            buffer = io.StringIO()
+            stats = pstats.Stats(files[0], stream=buffer)
+            for path in files[1:]:
+                stats.add(path)
+            stats.strip_dirs().sort_stats(options["sort"]).print_stats(max(1, options["limit"]))
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f"== {view}: {len(files)} profile(s) =="))
+            self.stdout.write(buffer.getvalue())
@@ -0,0 +1,37 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.rollup import DEFAULT_CHUNK_DAYS, rebuild_consumption
+
+
+class Command(BaseCommand):
+    help = "Backfill or rebuild the ConsommationJournaliere rollup from Sort, in date-range chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--start", help="First day to rebuild (YYYY-MM-DD), default: first sortie")
+        parser.add_argument("--end", help="Last day to rebuild (YYYY-MM-DD), default: last sortie")
+        parser.add_argument(
+            "--chunk-days",
+            type=int,
+            default=DEFAULT_CHUNK_DAYS,
+            help="Number of days rebuilt per transaction",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            start = date.fromisoformat(options["start"]) if options["start"] else None
+            end = date.fromisoformat(options["end"]) if options["end"] else None
+        except ValueError as exc:
+            raise CommandError(f"Invalid date: {exc}")
+
+        def progress(chunk_start, chunk_end, count):
+            self.stdout.write(f"  {chunk_start} -> {chunk_end}: {count} ligne(s)")
+
+        written = rebuild_consumption(
+            start=start,
+            end=end,
+            chunk_days=max(1, options["chunk_days"]),
+            on_chunk=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rollup rebuilt: {written} daily row(s) written."))
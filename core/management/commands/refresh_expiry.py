@@ -0,0 +1,47 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.data_version import bump_data_version
+from core.expiry import refresh_day
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the LotExpiration table (expiry bucket and days_left of every lot) for today. "
+        "One process at a time; a day already computed is skipped unless --force is given. Views "
+        "never rebuild the table: until this runs they classify lots live."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--watch",
+            action="store_true",
+            help="Scheduled mode: stay running and refresh again right after each midnight",
+        )
+        parser.add_argument("--force", action="store_true", help="Recompute even if today is already computed")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            count = refresh_day(force=options["force"])
+            if count is None:
+                self.stdout.write(f"LotExpiration already computed for {timezone.now().date()}.")
+            else:
+                bump_data_version()
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        f"{count} lot(s) classified for {timezone.now().date()} "
+                        f"in {time.perf_counter() - started:.1f}s."
+                    )
+                )
+            if not options["watch"]:
+                break
+            time.sleep(self._seconds_to_midnight())
+
+    def _seconds_to_midnight(self):
+        now = timezone.localtime()
+        midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=now.tzinfo)
+        return max(1.0, (midnight - now).total_seconds() + 1)
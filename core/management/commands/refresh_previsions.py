@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.forecast import DEFAULT_ALPHA, DEFAULT_MA_DAYS, DEFAULT_WINDOW_DAYS, refresh_previsions
+
+
+class Command(BaseCommand):
+    help = "Recompute stock-out dates and expiry waste forecasts into Prevision / PrevisionLot."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--window", type=int, default=DEFAULT_WINDOW_DAYS, help="History window in days")
+        parser.add_argument("--ma-days", type=int, default=DEFAULT_MA_DAYS, help="Moving-average window in days")
+        parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA, help="Exponential smoothing factor")
+        parser.add_argument(
+            "--source",
+            choices=["rollup", "sort"],
+            default="rollup",
+            help="Read history from ConsommationJournaliere (default) or directly from Sort",
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        produits_count, lots_count = refresh_previsions(
+            window_days=max(1, options["window"]),
+            ma_days=max(1, options["ma_days"]),
+            alpha=min(max(options["alpha"], 0.01), 1.0),
+            source=options["source"],
+        )
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Previsions refreshed: {produits_count} produit(s), "
+                f"{lots_count} lot(s) with expected waste in {elapsed:.2f}s."
+            )
+        )
@@ -5,7 +5,10 @@ from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.utils import timezone
 
-from core.models import Famille, Lot, Produit, Sort
+from core.data_version import bump_data_version
+from core.models import Famille, Lot, Produit, Site, Sort, default_site_id
+from core.expiry import refresh_expiry
+from core.rollup import rebuild_consumption
 
 
 class Command(BaseCommand):
@@ -16,6 +19,7 @@ class Command(BaseCommand):
         parser.add_argument("--produits", type=int, default=40, help="Number of produits to create")
         parser.add_argument("--lots", type=int, default=120, help="Number of lots to create")
         parser.add_argument("--sorts", type=int, default=30, help="Number of sorties to create")
+        parser.add_argument("--sites", type=int, default=1, help="Number of sites to spread lots and sorties over")
         parser.add_argument(
             "--reset",
             action="store_true",
@@ -28,6 +32,7 @@ class Command(BaseCommand):
         produits_count = max(1, options["produits"])
         lots_count = max(0, options["lots"])
         sorts_count = max(0, options["sorts"])
+        sites_count = max(1, options["sites"])
 
         if options["reset"]:
             Sort.objects.all().delete()
@@ -49,6 +54,11 @@ class Command(BaseCommand):
         if fallback:
             familles.append(fallback)
 
+        # Create sites (the default site is always the first one)
+        site_ids = [default_site_id()]
+        for i in range(2, sites_count + 1):
+            site_ids.append(Site.objects.get_or_create(nom=f"Site-{i:02d}")[0].pk)
+
         # Create products
         produits = []
         for i in range(1, produits_count + 1):
@@ -81,6 +91,7 @@ class Command(BaseCommand):
 
             Lot.objects.create(
                 produit=p,
+                site_id=random.choice(site_ids),
                 quantite=quantite,
                 date_entree=date_entree,
                 date_fin=date_fin,
@@ -89,10 +100,16 @@ class Command(BaseCommand):
         # Create sortie history (non-blocking demo records)
         if produits:
             for _ in range(sorts_count):
+                p = random.choice(produits)
                 Sort.objects.create(
-                    produit=random.choice(produits),
+                    produit=p,
+                    famille_id=p.famille_id,
+                    site_id=random.choice(site_ids),
                     quantite=random.randint(1, 10),
                 )
+            rebuild_consumption()
+        refresh_expiry()
+        bump_data_version(catalog=True)
 
         self.stdout.write(self.style.SUCCESS("Demo data generated successfully."))
         self.stdout.write(
@@ -0,0 +1,46 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.snapshots import build_checkpoints, write_checkpoint
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the end-of-day per-product stock checkpoint (yesterday by default, days "
+        "that have not ended are refused), or build checkpoints for a past date range "
+        "with --start/--end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Single day to checkpoint (YYYY-MM-DD)")
+        parser.add_argument("--start", help="First past day to build (YYYY-MM-DD)")
+        parser.add_argument("--end", help="Last past day to build (YYYY-MM-DD), default: yesterday")
+        parser.add_argument("--every", type=int, default=1, help="Keep one checkpoint every N days")
+
+    def handle(self, *args, **options):
+        try:
+            single = date.fromisoformat(options["date"]) if options["date"] else None
+            start = date.fromisoformat(options["start"]) if options["start"] else None
+            end = date.fromisoformat(options["end"]) if options["end"] else date.today() - timedelta(days=1)
+        except ValueError as exc:
+            raise CommandError(f"Invalid date: {exc}")
+
+        if start is None:
+            try:
+                count = write_checkpoint(single)
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            self.stdout.write(self.style.SUCCESS(f"Checkpoint {single or 'yesterday'}: {count} produit(s)."))
+            return
+
+        if start > end:
+            raise CommandError("--start must be before --end.")
+
+        written = build_checkpoints(
+            start,
+            end,
+            every=max(1, options["every"]),
+            on_day=lambda day: self.stdout.write(f"  {day}") if options["verbosity"] >= 2 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"{written} checkpoint day(s) written from {start} to {end}."))
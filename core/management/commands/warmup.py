@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from core.warmup import warm_process
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the warmup steps gunicorn --preload runs in the master before forking (URLconf, "
+        "templates, expiry table, code and fuzzy indexes, dashboard counters, site summaries, "
+        "expiry horizon) and report the time of each step. A second pass shows the warm cost."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--passes", type=int, default=2, help="Warmup passes in this process")
+
+    def handle(self, *args, **options):
+        for number in range(1, max(1, options["passes"]) + 1):
+            timings = warm_process()
+            for name, elapsed, result in timings:
+                self.stdout.write(f"[pass {number}] {name:<10} {elapsed:8.1f}ms  ({result})")
+            total = sum(elapsed for _, elapsed, _ in timings)
+            self.stdout.write(self.style.SUCCESS(f"[pass {number}] total {total:.1f}ms"))
@@ -0,0 +1,196 @@
+import os
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+
+# Metriques Prometheus (texte) exposees sur /metrics/.
+#
+# Sous gunicorn, chaque worker ecrit ses valeurs dans des fichiers mmap de
+# PROMETHEUS_MULTIPROC_DIR (voir start.sh et gunicorn.conf.py) et la vue
+# agrege tous les fichiers a la lecture : une observation coute quelques
+# microsecondes et aucun worker n'est interroge. Sans cette variable (runserver),
+# les metriques restent dans le registre du processus.
+#
+# Sans prometheus_client installe, les fonctions ci-dessous ne font rien.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+LOTS_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 50)
+
+_queries = ContextVar("metrics_queries", default=None)
+
+if settings.HAS_PROMETHEUS:
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+        generate_latest, multiprocess,
+    )
+
+    REQUEST_LATENCY = Histogram(
+        "stock_request_duration_seconds", "Duree des requetes par vue.",
+        ["view", "method"], buckets=LATENCY_BUCKETS,
+    )
+    REQUESTS = Counter(
+        "stock_requests_total", "Requetes par vue et classe de statut.", ["view", "status"],
+    )
+    REQUEST_QUERIES = Histogram(
+        "stock_request_db_queries", "Requetes SQL par requete HTTP.",
+        ["view"], buckets=QUERY_BUCKETS,
+    )
+    FEFO_DURATION = Histogram(
+        "stock_fefo_allocation_seconds", "Duree de l'allocation FEFO d'une sortie.",
+        buckets=LATENCY_BUCKETS,
+    )
+    FEFO_LOTS = Histogram(
+        "stock_fefo_lots_per_exit", "Lots entames par sortie.", buckets=LOTS_BUCKETS,
+    )
+    DATA_VERSION_BUMPS = Counter(
+        "stock_data_version_bumps_total", "Increments de la version de donnees.",
+    )
+    STREAMS_OPEN = Gauge(
+        "stock_updates_streams_open", "Connexions updates_stream ouvertes.",
+        multiprocess_mode="livesum",
+    )
+    CACHE_LOOKUPS = Counter(
+        "stock_cache_lookups_total", "Lectures de cache par cache et resultat.", ["cache", "result"],
+    )
+
+
+def _count_queries(execute, sql, params, many, context):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    connection.execute_wrappers.append(_count_queries)
+
+
+if settings.HAS_PROMETHEUS:
+    # Une liste partagee : sync_to_async copie le contexte, les requetes des
+    # threads sync d'une vue async incrementent donc le meme compteur.
+    connection_created.connect(_install_query_counter)
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    return match.view_name if match is not None and match.view_name else "unresolved"
+
+
+def observe_fefo(seconds, lots):
+    if settings.HAS_PROMETHEUS:
+        FEFO_DURATION.observe(seconds)
+        FEFO_LOTS.observe(lots)
+
+
+def record_bump():
+    if settings.HAS_PROMETHEUS:
+        DATA_VERSION_BUMPS.inc()
+
+
+def record_cache(name, hit):
+    if settings.HAS_PROMETHEUS:
+        CACHE_LOOKUPS.labels(name, "hit" if hit else "miss").inc()
+
+
+def stream_opened():
+    if settings.HAS_PROMETHEUS:
+        STREAMS_OPEN.inc()
+
+
+def stream_closed():
+    if settings.HAS_PROMETHEUS:
+        STREAMS_OPEN.dec()
+
+
+def render_metrics():
+    """Texte Prometheus agrege sur tous les workers : (contenu, content-type)."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        counter = [0]
+        token = _queries.set(counter)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _queries.reset(token)
+        return self._finish(request, response, start, counter)
+
+    async def __acall__(self, request):
+        counter = [0]
+        token = _queries.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _queries.reset(token)
+        return self._finish(request, response, start, counter)
+
+    def _finish(self, request, response, start, counter):
+        # Pour un flux SSE, seule l'ouverture est mesuree. Les autres reponses
+        # en streaming (products, alerts) sont mesurees jusqu'au dernier
+        # morceau : le rendu et les requetes SQL des lignes comptent.
+        if not response.streaming or response.get("Content-Type", "").startswith("text/event-stream"):
+            self._observe(request, response, time.perf_counter() - start, counter[0])
+            return response
+
+        done = []
+
+        def finish():
+            if not done:
+                done.append(True)
+                self._observe(request, response, time.perf_counter() - start, counter[0])
+
+        content = response.streaming_content
+        if response.is_async:
+            async def stream():
+                # Le corps est itere par le serveur, hors du contexte de la vue.
+                previous = _queries.get()
+                _queries.set(counter)
+                try:
+                    async for chunk in content:
+                        yield chunk
+                finally:
+                    _queries.set(previous)
+                    finish()
+        else:
+            def stream():
+                previous = _queries.get()
+                _queries.set(counter)
+                try:
+                    yield from content
+                finally:
+                    _queries.set(previous)
+                    finish()
+        response.streaming_content = stream()
+        response._resource_closers.append(finish)
+        return response
+
+    def _observe(self, request, response, elapsed, queries):
+        view = _view_name(request)
+        REQUEST_LATENCY.labels(view, request.method).observe(elapsed)
+        REQUESTS.labels(view, f"{response.status_code // 100}xx").inc()
+        REQUEST_QUERIES.labels(view).observe(queries)
@@ -0,0 +1,31 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_lot_produit_fefo_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_id', models.BigIntegerField(unique=True)),
+                ('quantite', models.PositiveIntegerField()),
+                ('date_entree', models.DateField()),
+                ('date_fin', models.DateField(verbose_name='Date de péremption')),
+                ('motif', models.CharField(choices=[('epuise', 'Lot épuisé'), ('expire', 'Lot expiré')], max_length=10)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lots_archives', to='core.produit')),
+            ],
+            options={
+                'ordering': ['date_fin'],
+                'indexes': [models.Index(fields=['produit', 'date_fin'], name='lotarchive_produit_idx')],
+            },
+        ),
+    ]
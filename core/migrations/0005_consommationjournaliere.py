@@ -0,0 +1,30 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_lotarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsommationJournaliere',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('quantite', models.PositiveBigIntegerField(default=0)),
+                ('nb_sorties', models.PositiveIntegerField(default=0)),
+                ('famille', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='consommations', to='core.famille')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consommations', to='core.produit')),
+            ],
+            options={
+                'ordering': ['-jour'],
+                'indexes': [models.Index(fields=['jour'], name='conso_jour_idx'), models.Index(fields=['famille', 'jour'], name='conso_famille_jour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('produit', 'jour'), name='conso_produit_jour_uniq')],
+            },
+        ),
+    ]
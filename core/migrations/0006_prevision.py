@@ -0,0 +1,40 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_consommationjournaliere'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Prevision',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taux_moyen', models.FloatField(default=0, verbose_name='Consommation moyenne / jour')),
+                ('taux_lisse', models.FloatField(default=0, verbose_name='Consommation lissée / jour')),
+                ('stock_disponible', models.PositiveIntegerField(default=0)),
+                ('date_rupture', models.DateField(blank=True, null=True, verbose_name='Date de rupture prévue')),
+                ('quantite_perimee', models.PositiveIntegerField(default=0, verbose_name='Quantité qui expirera avant consommation')),
+                ('calculee_le', models.DateTimeField()),
+                ('produit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='prevision', to='core.produit')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PrevisionLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_fin', models.DateField()),
+                ('quantite_perimee', models.PositiveIntegerField()),
+                ('lot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='prevision', to='core.lot')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='previsions_lots', to='core.produit')),
+            ],
+            options={
+                'ordering': ['date_fin'],
+            },
+        ),
+    ]
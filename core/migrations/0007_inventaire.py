@@ -0,0 +1,55 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_prevision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventaireSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100)),
+                ('statut', models.CharField(choices=[('ouvert', 'Ouvert'), ('applique', 'Appliqué')], default='ouvert', max_length=10)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+                ('applique_le', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-cree_le'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventaireComptage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite_comptee', models.PositiveIntegerField()),
+                ('stock_systeme', models.PositiveIntegerField(blank=True, null=True)),
+                ('ecart', models.IntegerField(blank=True, null=True)),
+                ('lot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='comptages', to='core.lot')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comptages', to='core.produit')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comptages', to='core.inventairesession')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['session', 'produit'], name='comptage_session_produit_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='InventaireAjustement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantite_avant', models.PositiveIntegerField()),
+                ('quantite_apres', models.PositiveIntegerField()),
+                ('lot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ajustements', to='core.lot')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ajustements', to='core.inventairesession')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('session', 'lot'), name='ajustement_session_lot_uniq')],
+            },
+        ),
+    ]
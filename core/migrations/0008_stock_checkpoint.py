@@ -0,0 +1,82 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_quantite_initiale(apps, schema_editor):
+    # Les quantites d'entree d'origine sont perdues : on part du stock restant.
+    for name in ("Lot", "LotArchive"):
+        model = apps.get_model("core", name)
+        model.objects.filter(quantite_initiale__isnull=True).update(quantite_initiale=F("quantite"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_inventaire'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('quantite', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockCheckpointJour',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField(unique=True)),
+                ('nb_produits', models.PositiveIntegerField(default=0)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-jour'],
+            },
+        ),
+        migrations.AddField(
+            model_name='lot',
+            name='quantite_initiale',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='lotarchive',
+            name='quantite_initiale',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_quantite_initiale, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['date_entree'], name='lot_date_entree_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lotarchive',
+            index=models.Index(fields=['date_entree'], name='lotarchive_date_entree_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sort',
+            index=models.Index(fields=['date_sortie'], name='sort_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sort',
+            index=models.Index(fields=['produit', 'date_sortie'], name='sort_produit_date_idx'),
+        ),
+        migrations.AddField(
+            model_name='stockcheckpoint',
+            name='produit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='core.produit'),
+        ),
+        migrations.AddIndex(
+            model_name='stockcheckpoint',
+            index=models.Index(fields=['produit', 'jour'], name='checkpoint_produit_jour_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='stockcheckpoint',
+            constraint=models.UniqueConstraint(fields=('jour', 'produit'), name='checkpoint_jour_produit_uniq'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_stock_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SortieLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lot_id', models.BigIntegerField()),
+                ('date_fin', models.DateField(verbose_name='Date de péremption')),
+                ('date_sortie', models.DateField()),
+                ('quantite', models.PositiveIntegerField()),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='core.produit')),
+                ('sortie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='core.sort')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['lot_id', 'date_sortie'], name='sortielot_lot_idx'), models.Index(fields=['sortie'], name='sortielot_sortie_idx'), models.Index(fields=['produit', 'date_fin'], name='sortielot_produit_fin_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def fill_lot_expiration(apps, schema_editor):
+    Lot = apps.get_model("core", "Lot")
+    LotExpiration = apps.get_model("core", "LotExpiration")
+    today = timezone.now().date()
+    batch = []
+    rows = Lot.objects.values_list("id", "produit_id", "date_fin", "produit__nbr_days_alert")
+    for lot_id, produit_id, date_fin, nbr_days_alert in rows.iterator(chunk_size=5000):
+        days_left = (date_fin - today).days
+        if days_left < 0:
+            bucket = "expire"
+        elif days_left == 0:
+            bucket = "aujourdhui"
+        elif days_left <= nbr_days_alert:
+            bucket = "proche"
+        else:
+            bucket = "ok"
+        batch.append(
+            LotExpiration(
+                lot_id=lot_id,
+                produit_id=produit_id,
+                date_fin=date_fin,
+                days_left=days_left,
+                bucket=bucket,
+                jour=today,
+            )
+        )
+        if len(batch) >= 5000:
+            LotExpiration.objects.bulk_create(batch)
+            batch = []
+    LotExpiration.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sortielot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotExpiration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date_fin', models.DateField()),
+                ('days_left', models.IntegerField()),
+                ('bucket', models.CharField(choices=[('expire', 'Expiré'), ('aujourdhui', "Expire aujourd'hui"), ('proche', 'Proche expiration'), ('ok', 'Normal')], max_length=10)),
+                ('jour', models.DateField()),
+                ('lot', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='expiration', to='core.lot')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='expirations', to='core.produit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket', 'produit'], name='expiration_bucket_idx'), models.Index(fields=['produit', 'date_fin'], name='expiration_produit_fin_idx'), models.Index(fields=['jour'], name='expiration_jour_idx')],
+            },
+        ),
+        migrations.RunPython(fill_lot_expiration, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 6.0.2 on 2026-10-19 14:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_lotexpiration'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['date_fin', 'produit', 'quantite'], name='lot_horizon_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:14
+
+import core.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_default_site(apps, schema_editor):
+    # Avant les AddField : leur valeur par defaut (default_site_id) lit ce site.
+    Site = apps.get_model("core", "Site")
+    Site.objects.get_or_create(nom=core.models.DEFAULT_SITE_NOM)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_lot_horizon_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Site',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nom', models.CharField(max_length=100, unique=True)),
+            ],
+        ),
+        migrations.RunPython(create_default_site, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='lot',
+            name='site',
+            field=models.ForeignKey(default=core.models.default_site_id, on_delete=django.db.models.deletion.PROTECT, related_name='lots', to='core.site'),
+        ),
+        migrations.AddField(
+            model_name='lotarchive',
+            name='site',
+            field=models.ForeignKey(default=core.models.default_site_id, on_delete=django.db.models.deletion.PROTECT, related_name='lots_archives', to='core.site'),
+        ),
+        migrations.AddField(
+            model_name='sort',
+            name='site',
+            field=models.ForeignKey(default=core.models.default_site_id, on_delete=django.db.models.deletion.PROTECT, related_name='sorties', to='core.site'),
+        ),
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['site', 'produit', 'date_fin'], name='lot_site_fefo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sort',
+            index=models.Index(fields=['site', 'date_sortie'], name='sort_site_date_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 6.0.2 on 2026-10-19 15:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_site'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlerteDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('lance_le', models.DateTimeField(auto_now_add=True)),
+                ('complet', models.BooleanField(default=False)),
+                ('sort_id', models.BigIntegerField(default=0)),
+                ('lot_id', models.BigIntegerField(default=0)),
+                ('archive_id', models.BigIntegerField(default=0)),
+                ('ajustement_id', models.BigIntegerField(default=0)),
+                ('nouvelles', models.PositiveIntegerField(default=0)),
+                ('envoyees', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-lance_le'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlerteEtat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('stock', 'Alerte stock'), ('expiration', 'Alerte expiration')], max_length=10)),
+                ('lot_id', models.BigIntegerField(blank=True, null=True)),
+                ('niveau', models.CharField(max_length=10)),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertes_etats', to='core.produit')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('type', 'expiration')), fields=('lot_id',), name='alerteetat_lot_uniq'), models.UniqueConstraint(condition=models.Q(('type', 'stock')), fields=('produit',), name='alerteetat_produit_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='AlerteOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('type', models.CharField(choices=[('stock', 'Alerte stock'), ('expiration', 'Alerte expiration')], max_length=10)),
+                ('niveau', models.CharField(max_length=10)),
+                ('libelle', models.CharField(max_length=100)),
+                ('lot_id', models.BigIntegerField(blank=True, null=True)),
+                ('quantite', models.IntegerField(default=0)),
+                ('date_fin', models.DateField(blank=True, null=True)),
+                ('days_left', models.IntegerField(blank=True, null=True)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+                ('envoye_le', models.DateTimeField(blank=True, null=True)),
+                ('acquitte_le', models.DateTimeField(blank=True, null=True)),
+                ('famille', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alertes_outbox', to='core.famille')),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='alertes_outbox', to='core.produit')),
+                ('site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='alertes_outbox', to='core.site')),
+            ],
+            options={
+                'ordering': ['-cree_le', '-id'],
+                'indexes': [models.Index(fields=['acquitte_le', 'cree_le'], name='outbox_acquitte_idx'), models.Index(fields=['envoye_le', 'famille'], name='outbox_envoi_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_alert_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='famille',
+            name='modifie_le',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='lot',
+            name='modifie_le',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='produit',
+            name='modifie_le',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='sort',
+            name='cree_le',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='famille',
+            index=models.Index(fields=['modifie_le'], name='famille_modifie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='lot',
+            index=models.Index(fields=['modifie_le'], name='lot_modifie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='produit',
+            index=models.Index(fields=['modifie_le'], name='produit_modifie_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sort',
+            index=models.Index(fields=['cree_le'], name='sort_cree_idx'),
+        ),
+    ]
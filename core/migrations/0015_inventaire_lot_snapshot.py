@@ -0,0 +1,85 @@
+# Generated by Django 6.0.2 on 2026-10-19 18:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_lot_snapshots(apps, schema_editor):
+    Lot = apps.get_model("core", "Lot")
+    InventaireComptage = apps.get_model("core", "InventaireComptage")
+    InventaireAjustement = apps.get_model("core", "InventaireAjustement")
+    lot = Lot.objects.filter(id=OuterRef("lot_id"))
+    InventaireComptage.objects.filter(lot__isnull=False).update(
+        lot_numero=models.F("lot_id"),
+        lot_date_fin=Subquery(lot.values("date_fin")[:1]),
+    )
+    InventaireAjustement.objects.update(
+        lot_numero=models.F("lot_id"),
+        produit_id=Subquery(lot.values("produit_id")[:1]),
+        lot_date_fin=Subquery(lot.values("date_fin")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_sync_timestamps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inventairecomptage',
+            name='lot_numero',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inventairecomptage',
+            name='lot_date_fin',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inventaireajustement',
+            name='produit',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='ajustements', to='core.produit'),
+        ),
+        migrations.AddField(
+            model_name='inventaireajustement',
+            name='lot_numero',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='inventaireajustement',
+            name='lot_date_fin',
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(fill_lot_snapshots, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='inventaireajustement',
+            name='produit',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ajustements', to='core.produit'),
+        ),
+        migrations.AlterField(
+            model_name='inventaireajustement',
+            name='lot_numero',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='inventaireajustement',
+            name='lot_date_fin',
+            field=models.DateField(),
+        ),
+        migrations.RemoveConstraint(
+            model_name='inventaireajustement',
+            name='ajustement_session_lot_uniq',
+        ),
+        migrations.AlterField(
+            model_name='inventaireajustement',
+            name='lot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ajustements', to='core.lot'),
+        ),
+        migrations.AddConstraint(
+            model_name='inventaireajustement',
+            constraint=models.UniqueConstraint(fields=('session', 'lot_numero'), name='ajustement_session_lot_uniq'),
+        ),
+    ]
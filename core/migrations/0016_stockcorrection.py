@@ -0,0 +1,28 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_inventaire_lot_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCorrection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField()),
+                ('quantite', models.IntegerField()),
+                ('motif', models.CharField(choices=[('perte', 'Lot expiré retiré'), ('inventaire', "Ajustement d'inventaire"), ('entree', "Entrée d'un lot supprimé")], max_length=10)),
+                ('cree_le', models.DateTimeField(auto_now_add=True)),
+                ('produit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='corrections', to='core.produit')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['jour'], name='correction_jour_idx'), models.Index(fields=['produit', 'jour'], name='correction_produit_jour_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_stockcorrection'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LotExpirationRefresh',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('jour', models.DateField(blank=True, null=True)),
+                ('calcule_le', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_lotexpirationrefresh'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='alertedigest',
+            name='ajustement_id',
+        ),
+        migrations.RemoveField(
+            model_name='alertedigest',
+            name='archive_id',
+        ),
+        migrations.RemoveField(
+            model_name='alertedigest',
+            name='lot_id',
+        ),
+        migrations.RemoveField(
+            model_name='alertedigest',
+            name='sort_id',
+        ),
+        migrations.AddField(
+            model_name='alertedigest',
+            name='demarre_le',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='stockcorrection',
+            index=models.Index(fields=['cree_le'], name='correction_cree_idx'),
+        ),
+    ]
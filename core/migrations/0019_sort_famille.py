@@ -0,0 +1,36 @@
+# Generated by Django 6.0.2 on 2026-10-19 16:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_sort_famille(apps, schema_editor):
+    # Famille au moment des sorties passees inconnue : famille actuelle.
+    Produit = apps.get_model("core", "Produit")
+    Sort = apps.get_model("core", "Sort")
+    Sort.objects.update(famille_id=Subquery(Produit.objects.filter(id=OuterRef("produit_id")).values("famille_id")[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_alertedigest_demarre_le'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='consommationjournaliere',
+            name='conso_produit_jour_uniq',
+        ),
+        migrations.AddField(
+            model_name='sort',
+            name='famille',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='sorties', to='core.famille'),
+        ),
+        migrations.RunPython(fill_sort_famille, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='consommationjournaliere',
+            constraint=models.UniqueConstraint(fields=('produit', 'famille', 'jour'), name='conso_produit_famille_jour_uniq'),
+        ),
+    ]
@@ -5,11 +5,45 @@ from django.db import models
 
 class Famille(models.Model):
     nom = models.CharField(max_length=100, unique=True)
+    # Synchronisation incrementale (API, ?updated_since=) : les UPDATE en
+    # masse doivent aussi le renseigner, auto_now ne passe que par save().
+    modifie_le = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.nom
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["modifie_le"], name="famille_modifie_idx"),
+        ]
+
+
+DEFAULT_SITE_NOM = "Principal"
+
+
+class Site(models.Model):
+    # Laboratoire / magasin : chaque lot et chaque sortie appartient a un site.
+    nom = models.CharField(max_length=100, unique=True)
 
     def __str__(self):
         return self.nom
 
 
+# Id du site par defaut, lu une fois par processus : le site est cree par la
+# migration 0012 et n'est jamais supprime.
+_default_site = {}
+
+
+def default_site_id():
+    """Site par defaut des lots et sorties crees sans site explicite."""
+    if "id" not in _default_site:
+        site_id = Site.objects.filter(nom=DEFAULT_SITE_NOM).values_list("pk", flat=True).first()
+        if site_id is None:
+            raise Site.DoesNotExist(f"Site par defaut '{DEFAULT_SITE_NOM}' absent : lancer migrate.")
+        _default_site["id"] = site_id
+    return _default_site["id"]
+
+
 class Produit(models.Model):
     reference = models.CharField(
         max_length=100,
@@ -46,10 +80,17 @@ class Produit(models.Model):
         verbose_name="Seuil stock minimum"
     )
 
+    modifie_le = models.DateTimeField(auto_now=True)
+
 
     def __str__(self):
         return self.reference
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["modifie_le"], name="produit_modifie_idx"),
+        ]
+
 
 class Lot(models.Model):
     produit = models.ForeignKey(
@@ -58,19 +99,43 @@ class Lot(models.Model):
         related_name="lots"
     )
 
+    site = models.ForeignKey(
+        Site,
+        on_delete=models.PROTECT,
+        default=default_site_id,
+        related_name="lots"
+    )
+
     quantite = models.PositiveIntegerField()
 
+    # Quantite recue a l'entree (quantite diminue avec les sorties).
+    quantite_initiale = models.PositiveIntegerField(blank=True, null=True)
+
     date_entree = models.DateField()
 
     date_fin = models.DateField(
         verbose_name="Date de péremption"
     )
 
+    modifie_le = models.DateTimeField(auto_now=True)
+
     def __str__(self):
         return f"{self.produit.reference} | {self.date_fin}"
 
+    def save(self, *args, **kwargs):
+        if self.quantite_initiale is None:
+            self.quantite_initiale = self.quantite
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ["date_fin"]  # FEFO automatique
+        indexes = [
+            models.Index(fields=["produit", "date_fin"], name="lot_produit_fefo_idx"),
+            models.Index(fields=["date_entree"], name="lot_date_entree_idx"),
+            models.Index(fields=["date_fin", "produit", "quantite"], name="lot_horizon_idx"),
+            models.Index(fields=["site", "produit", "date_fin"], name="lot_site_fefo_idx"),
+            models.Index(fields=["modifie_le"], name="lot_modifie_idx"),
+        ]
 
 
 class Sort(models.Model):
@@ -79,8 +144,562 @@ class Sort(models.Model):
         on_delete=models.CASCADE,
         related_name="sorties",
     )
+    site = models.ForeignKey(
+        Site,
+        on_delete=models.PROTECT,
+        default=default_site_id,
+        related_name="sorties",
+    )
+    # Famille du produit au moment de la sortie : un produit change de
+    # famille sans deplacer sa consommation passee (ConsommationJournaliere).
+    famille = models.ForeignKey(
+        Famille,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="sorties",
+    )
     quantite = models.PositiveIntegerField()
     date_sortie = models.DateField(auto_now_add=True)
+    cree_le = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"{self.produit.reference} | -{self.quantite} | {self.date_sortie}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["date_sortie"], name="sort_date_idx"),
+            models.Index(fields=["produit", "date_sortie"], name="sort_produit_date_idx"),
+            models.Index(fields=["site", "date_sortie"], name="sort_site_date_idx"),
+            models.Index(fields=["cree_le"], name="sort_cree_idx"),
+        ]
+
+
+class LotArchive(models.Model):
+    MOTIF_EPUISE = "epuise"
+    MOTIF_EXPIRE = "expire"
+    MOTIF_CHOICES = [
+        (MOTIF_EPUISE, "Lot épuisé"),
+        (MOTIF_EXPIRE, "Lot expiré"),
+    ]
+
+    lot_id = models.BigIntegerField(unique=True)
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="lots_archives"
+    )
+
+    site = models.ForeignKey(
+        Site,
+        on_delete=models.PROTECT,
+        default=default_site_id,
+        related_name="lots_archives"
+    )
+
+    quantite = models.PositiveIntegerField()
+
+    quantite_initiale = models.PositiveIntegerField(blank=True, null=True)
+
+    date_entree = models.DateField()
+
+    date_fin = models.DateField(
+        verbose_name="Date de péremption"
+    )
+
+    motif = models.CharField(max_length=10, choices=MOTIF_CHOICES)
+
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.produit.reference} | {self.date_fin} | archivé"
+
+    class Meta:
+        ordering = ["date_fin"]
+        indexes = [
+            models.Index(fields=["produit", "date_fin"], name="lotarchive_produit_idx"),
+            models.Index(fields=["date_entree"], name="lotarchive_date_entree_idx"),
+        ]
+
+
+class SortieLot(models.Model):
+    # lot_id sans cle etrangere : l'allocation doit survivre a l'archivage
+    # ou a la purge du lot pour rester exploitable lors d'un rappel.
+    sortie = models.ForeignKey(
+        Sort,
+        on_delete=models.CASCADE,
+        related_name="allocations"
+    )
+
+    lot_id = models.BigIntegerField()
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="allocations"
+    )
+
+    date_fin = models.DateField(
+        verbose_name="Date de péremption"
+    )
+
+    date_sortie = models.DateField()
+
+    quantite = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Lot {self.lot_id} | -{self.quantite} | {self.date_sortie}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lot_id", "date_sortie"], name="sortielot_lot_idx"),
+            models.Index(fields=["sortie"], name="sortielot_sortie_idx"),
+            models.Index(fields=["produit", "date_fin"], name="sortielot_produit_fin_idx"),
+        ]
+
+
+class ConsommationJournaliere(models.Model):
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="consommations"
+    )
+
+    famille = models.ForeignKey(
+        Famille,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="consommations"
+    )
+
+    jour = models.DateField()
+
+    quantite = models.PositiveBigIntegerField(default=0)
+
+    nb_sorties = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.produit.reference} | {self.jour} | -{self.quantite}"
+
+    class Meta:
+        ordering = ["-jour"]
+        constraints = [
+            # Une ligne par famille du produit le jour de ses sorties.
+            models.UniqueConstraint(fields=["produit", "famille", "jour"], name="conso_produit_famille_jour_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["jour"], name="conso_jour_idx"),
+            models.Index(fields=["famille", "jour"], name="conso_famille_jour_idx"),
+        ]
+
+
+class Prevision(models.Model):
+    produit = models.OneToOneField(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="prevision"
+    )
+
+    taux_moyen = models.FloatField(
+        default=0,
+        verbose_name="Consommation moyenne / jour"
+    )
+
+    taux_lisse = models.FloatField(
+        default=0,
+        verbose_name="Consommation lissée / jour"
+    )
+
+    stock_disponible = models.PositiveIntegerField(default=0)
+
+    date_rupture = models.DateField(
+        blank=True,
+        null=True,
+        verbose_name="Date de rupture prévue"
+    )
+
+    quantite_perimee = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Quantité qui expirera avant consommation"
+    )
+
+    calculee_le = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.produit.reference} | rupture {self.date_rupture or '-'}"
+
+
+class PrevisionLot(models.Model):
+    lot = models.OneToOneField(
+        Lot,
+        on_delete=models.CASCADE,
+        related_name="prevision"
+    )
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="previsions_lots"
+    )
+
+    date_fin = models.DateField()
+
+    quantite_perimee = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.produit.reference} | {self.date_fin} | -{self.quantite_perimee}"
+
+    class Meta:
+        ordering = ["date_fin"]
+
+
+class InventaireSession(models.Model):
+    STATUT_OUVERT = "ouvert"
+    STATUT_APPLIQUE = "applique"
+    STATUT_CHOICES = [
+        (STATUT_OUVERT, "Ouvert"),
+        (STATUT_APPLIQUE, "Appliqué"),
+    ]
+
+    nom = models.CharField(max_length=100)
+
+    statut = models.CharField(max_length=10, choices=STATUT_CHOICES, default=STATUT_OUVERT)
+
+    cree_le = models.DateTimeField(auto_now_add=True)
+
+    applique_le = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.nom} ({self.get_statut_display()})"
+
+    class Meta:
+        ordering = ["-cree_le"]
+
+
+class InventaireComptage(models.Model):
+    session = models.ForeignKey(
+        InventaireSession,
+        on_delete=models.CASCADE,
+        related_name="comptages"
+    )
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="comptages"
+    )
+
+    # Vide = comptage global du produit, sinon comptage d'un lot precis.
+    lot = models.ForeignKey(
+        Lot,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="comptages"
+    )
+
+    # Copie du lot compte : conservee si le lot est archive ou supprime avant
+    # l'application (la cle etrangere passe alors a NULL).
+    lot_numero = models.BigIntegerField(blank=True, null=True)
+
+    lot_date_fin = models.DateField(blank=True, null=True)
+
+    quantite_comptee = models.PositiveIntegerField()
+
+    # Renseignes a l'application : trace de l'ajustement.
+    stock_systeme = models.PositiveIntegerField(blank=True, null=True)
+
+    ecart = models.IntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.produit.reference} | compte {self.quantite_comptee}"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["session", "produit"], name="comptage_session_produit_idx"),
+        ]
+
+
+class InventaireAjustement(models.Model):
+    session = models.ForeignKey(
+        InventaireSession,
+        on_delete=models.CASCADE,
+        related_name="ajustements"
+    )
+
+    # L'ajustement reste apres l'archivage ou la suppression du lot : produit
+    # et lot sont recopies sur la ligne.
+    lot = models.ForeignKey(
+        Lot,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="ajustements"
+    )
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="ajustements"
+    )
+
+    lot_numero = models.BigIntegerField()
+
+    lot_date_fin = models.DateField()
+
+    quantite_avant = models.PositiveIntegerField()
+
+    quantite_apres = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"Lot {self.lot_numero} | {self.quantite_avant} -> {self.quantite_apres}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["session", "lot_numero"], name="ajustement_session_lot_uniq"),
+        ]
+
+
+class StockCheckpointJour(models.Model):
+    jour = models.DateField(unique=True)
+
+    nb_produits = models.PositiveIntegerField(default=0)
+
+    cree_le = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Checkpoint {self.jour}"
+
+    class Meta:
+        ordering = ["-jour"]
+
+
+class StockCheckpoint(models.Model):
+    jour = models.DateField()
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="checkpoints"
+    )
+
+    quantite = models.PositiveIntegerField()
+
+    def __str__(self):
+        return f"{self.produit.reference} | {self.jour} | {self.quantite}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["jour", "produit"], name="checkpoint_jour_produit_uniq"),
+        ]
+        indexes = [
+            models.Index(fields=["produit", "jour"], name="checkpoint_produit_jour_idx"),
+        ]
+
+
+class StockCorrection(models.Model):
+    # Mouvement de stock date qui n'est ni une entree de lot ni une sortie :
+    # perte d'un lot expire retire, ajustement d'inventaire, entree d'un lot
+    # supprime sans archive. Rejoue par stock_at avec les lots et les sorties.
+    MOTIF_PERTE = "perte"
+    MOTIF_INVENTAIRE = "inventaire"
+    MOTIF_ENTREE = "entree"
+    MOTIF_CHOICES = [
+        (MOTIF_PERTE, "Lot expiré retiré"),
+        (MOTIF_INVENTAIRE, "Ajustement d'inventaire"),
+        (MOTIF_ENTREE, "Entrée d'un lot supprimé"),
+    ]
+
+    jour = models.DateField()
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="corrections"
+    )
+
+    # Signee : negative pour une perte.
+    quantite = models.IntegerField()
+
+    motif = models.CharField(max_length=10, choices=MOTIF_CHOICES)
+
+    cree_le = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.produit.reference} | {self.jour} | {self.quantite:+d} ({self.motif})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["jour"], name="correction_jour_idx"),
+            models.Index(fields=["produit", "jour"], name="correction_produit_jour_idx"),
+            # Corrections recentes (alert_digest).
+            models.Index(fields=["cree_le"], name="correction_cree_idx"),
+        ]
+
+
+class LotExpiration(models.Model):
+    BUCKET_EXPIRE = "expire"
+    BUCKET_AUJOURDHUI = "aujourdhui"
+    BUCKET_PROCHE = "proche"
+    BUCKET_OK = "ok"
+    BUCKET_CHOICES = [
+        (BUCKET_EXPIRE, "Expiré"),
+        (BUCKET_AUJOURDHUI, "Expire aujourd'hui"),
+        (BUCKET_PROCHE, "Proche expiration"),
+        (BUCKET_OK, "Normal"),
+    ]
+
+    lot = models.OneToOneField(
+        Lot,
+        on_delete=models.CASCADE,
+        related_name="expiration"
+    )
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="expirations"
+    )
+
+    date_fin = models.DateField()
+
+    days_left = models.IntegerField()
+
+    bucket = models.CharField(max_length=10, choices=BUCKET_CHOICES)
+
+    # Jour de calcul : days_left et bucket ne valent que pour ce jour-la.
+    jour = models.DateField()
+
+    def __str__(self):
+        return f"Lot {self.lot_id} | {self.bucket} | {self.days_left}j"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["bucket", "produit"], name="expiration_bucket_idx"),
+            models.Index(fields=["produit", "date_fin"], name="expiration_produit_fin_idx"),
+            models.Index(fields=["jour"], name="expiration_jour_idx"),
+        ]
+
+
+class LotExpirationRefresh(models.Model):
+    # Ligne unique : jour du dernier recalcul complet de LotExpiration. Elle
+    # est verrouillee (select_for_update) pendant le recalcul : un seul
+    # processus recalcule, et un jour deja calcule n'est pas refait.
+    jour = models.DateField(blank=True, null=True)
+
+    calcule_le = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"LotExpiration calculee pour {self.jour}"
+
+
+class AlerteDigest(models.Model):
+    # Une ligne par passage de alert_digest : l'heure de debut du passage sert
+    # de point de depart au suivant (produits modifies depuis).
+    lance_le = models.DateTimeField(auto_now_add=True)
+
+    demarre_le = models.DateTimeField(null=True, blank=True)
+
+    complet = models.BooleanField(default=False)
+
+    nouvelles = models.PositiveIntegerField(default=0)
+
+    envoyees = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Digest {self.lance_le:%Y-%m-%d %H:%M} | {self.nouvelles} alerte(s)"
+
+    class Meta:
+        ordering = ["-lance_le"]
+
+
+class AlerteOutbox(models.Model):
+    TYPE_STOCK = "stock"
+    TYPE_EXPIRATION = "expiration"
+    TYPE_CHOICES = [
+        (TYPE_STOCK, "Alerte stock"),
+        (TYPE_EXPIRATION, "Alerte expiration"),
+    ]
+
+    type = models.CharField(max_length=10, choices=TYPE_CHOICES)
+
+    niveau = models.CharField(max_length=10)
+
+    libelle = models.CharField(max_length=100)
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="alertes_outbox"
+    )
+
+    famille = models.ForeignKey(
+        Famille,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name="alertes_outbox"
+    )
+
+    site = models.ForeignKey(
+        Site,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="alertes_outbox"
+    )
+
+    # lot_id sans cle etrangere, comme SortieLot : le lot peut etre archive.
+    lot_id = models.BigIntegerField(blank=True, null=True)
+
+    quantite = models.IntegerField(default=0)
+
+    date_fin = models.DateField(blank=True, null=True)
+
+    days_left = models.IntegerField(blank=True, null=True)
+
+    cree_le = models.DateTimeField(auto_now_add=True)
+
+    envoye_le = models.DateTimeField(blank=True, null=True)
+
+    acquitte_le = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.get_type_display()} | {self.produit.reference} | {self.libelle}"
+
+    class Meta:
+        ordering = ["-cree_le", "-id"]
+        indexes = [
+            models.Index(fields=["acquitte_le", "cree_le"], name="outbox_acquitte_idx"),
+            models.Index(fields=["envoye_le", "famille"], name="outbox_envoi_idx"),
+        ]
+
+
+class AlerteEtat(models.Model):
+    # Dernier niveau notifie par alert_digest, par lot (peremption, niveau =
+    # bucket) ou par produit (stock) : une alerte n'est reecrite dans
+    # l'outbox que si ce niveau change.
+    type = models.CharField(max_length=10, choices=AlerteOutbox.TYPE_CHOICES)
+
+    produit = models.ForeignKey(
+        Produit,
+        on_delete=models.CASCADE,
+        related_name="alertes_etats"
+    )
+
+    lot_id = models.BigIntegerField(blank=True, null=True)
+
+    niveau = models.CharField(max_length=10)
+
+    def __str__(self):
+        return f"{self.type} | {self.lot_id or self.produit_id} | {self.niveau}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["lot_id"], condition=models.Q(type="expiration"), name="alerteetat_lot_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["produit"], condition=models.Q(type="stock"), name="alerteetat_produit_uniq",
+            ),
+        ]
@@ -0,0 +1,206 @@
+import cProfile
+import os
+import pstats
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+
+PROFILE_HEADER = "HTTP_X_PROFILE"
+PROFILE_PARAM = "profile"
+
+# Requetes en cours dans le processus (corps en streaming compris) et
+# profilage actif ; `mixed` : une autre requete a recouvert le profil.
+_state = {"in_flight": 0, "profiling": False, "mixed": False}
+_lock = threading.Lock()
+
+# Profilage a la demande : un membre du staff envoie l'en-tete X-Profile: 1
+# (ou ?profile=1), ou bien PROFILING_SAMPLE_RATE % des requetes sont tirees
+# au sort. Le profil cProfile est ecrit dans PROFILING_DIR/<vue>/ et les plus
+# anciens fichiers sont supprimes au-dela des limites de taille.
+#
+# cProfile voit tout le processus depuis Python 3.12 (sys.monitoring), et
+# toute la boucle d'evenements sous ASGI : une requete n'est profilee que si
+# elle est seule en cours, et son profil est jete si une autre requete
+# demarre avant la fin. Pour une reponse en streaming, le profil couvre le
+# corps jusqu'au dernier morceau ; il n'a pas d'en-tete X-Profile-Id (les
+# en-tetes partent avant le corps).
+
+
+def _requested(request):
+    return request.META.get(PROFILE_HEADER) == "1" or request.GET.get(PROFILE_PARAM) == "1"
+
+
+def _sampled():
+    rate = settings.PROFILING_SAMPLE_RATE
+    return rate > 0 and random.random() * 100 < rate
+
+
+def _view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return (match.view_name or match._func_path).replace(":", "-").replace("/", "-")
+
+
+def _prune(root):
+    max_files = settings.PROFILING_MAX_FILES_PER_VIEW
+    files = []
+    for view_dir in os.scandir(root):
+        if not view_dir.is_dir():
+            continue
+        view_files = sorted(
+            (entry for entry in os.scandir(view_dir.path) if entry.name.endswith(".prof")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in view_files[:-max_files] if len(view_files) > max_files else []:
+            os.remove(entry.path)
+        files.extend(view_files[-max_files:])
+
+    budget = settings.PROFILING_MAX_MB * 1024 * 1024
+    files.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    used = 0
+    for entry in files:
+        used += entry.stat().st_size
+        if used > budget:
+            os.remove(entry.path)
+
+
+def save_profile(request, profilers, elapsed_ms):
+    """Fusionne les profileurs, ecrit le fichier .prof et applique les limites."""
+    stats = None
+    for profiler in profilers:
+        profiler.create_stats()
+        if not profiler.stats:
+            continue
+        if stats is None:
+            stats = pstats.Stats(profiler)
+        else:
+            stats.add(profiler)
+    if stats is None:
+        return None
+
+    root = settings.PROFILING_DIR
+    view_dir = os.path.join(root, _view_name(request))
+    os.makedirs(view_dir, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{int(elapsed_ms)}ms.prof"
+    stats.dump_stats(os.path.join(view_dir, name))
+    _prune(root)
+    return name
+
+
+def _enabled_profiler():
+    """Profileur demarre, ou None si un autre profileur est deja actif."""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None
+    return profiler
+
+
+def _start(wanted):
+    """Entree d'une requete ; profileur demarre si elle est voulue et seule en cours."""
+    with _lock:
+        _state["in_flight"] += 1
+        if _state["profiling"]:
+            _state["mixed"] = True
+            return None
+        if not wanted or _state["in_flight"] > 1:
+            return None
+        profiler = _enabled_profiler()
+        if profiler is not None:
+            _state["profiling"] = True
+            _state["mixed"] = False
+        return profiler
+
+
+def _stop(profiler):
+    """Fin d'une requete ; True si son profil est exploitable (pas recouvert)."""
+    with _lock:
+        _state["in_flight"] -= 1
+        if profiler is None:
+            return False
+        profiler.disable()
+        _state["profiling"] = False
+        return not _state["mixed"]
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        profiler = _start(_sampled() or (_requested(request) and request.user.is_staff))
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            _stop(profiler)
+            raise
+        if response.streaming:
+            return self._wrap_stream(request, response, profiler, start)
+        return self._finish(request, response, profiler, start)
+
+    async def __acall__(self, request):
+        wanted = _sampled() or (_requested(request) and (await request.auser()).is_staff)
+        profiler = _start(wanted)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            _stop(profiler)
+            raise
+        if response.streaming:
+            return self._wrap_stream(request, response, profiler, start)
+        if profiler is None:
+            _stop(None)
+            return response
+        return await sync_to_async(self._finish)(request, response, profiler, start)
+
+    def _finish(self, request, response, profiler, start):
+        if _stop(profiler):
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            name = save_profile(request, [profiler], elapsed_ms)
+            if name and not response.streaming:
+                response["X-Profile-Id"] = f"{_view_name(request)}/{name}"
+        return response
+
+    def _wrap_stream(self, request, response, profiler, start):
+        # La requete reste en cours (et profilee) jusqu'au dernier morceau, ou
+        # jusqu'a response.close() si le client part avant le premier.
+        done = []
+
+        def finish():
+            if not done:
+                done.append(True)
+                self._finish(request, response, profiler, start)
+
+        content = response.streaming_content
+        if response.is_async:
+            async def stream():
+                try:
+                    async for chunk in content:
+                        yield chunk
+                finally:
+                    await sync_to_async(finish)()
+        else:
+            def stream():
+                try:
+                    yield from content
+                finally:
+                    finish()
+        response.streaming_content = stream()
+        response._resource_closers.append(finish)
+        return response
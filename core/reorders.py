@@ -0,0 +1,92 @@
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Ceil, Coalesce, Greatest
+from django.utils import timezone
+
+from .models import ConsommationJournaliere, Lot, Produit
+
+
+DEFAULT_LEAD_TIME_DAYS = settings.REORDER_LEAD_TIME_DAYS
+DEFAULT_WINDOW_DAYS = settings.REORDER_WINDOW_DAYS
+
+
+def suggest_reorders(lead_time_days=DEFAULT_LEAD_TIME_DAYS, window_days=DEFAULT_WINDOW_DAYS,
+                     famille_id=None, today=None):
+    """Quantite a commander par produit, calculee en une seule requete.
+
+    besoin = seuil + consommation/jour * delai - stock non expire
+    La consommation vient du cumul journalier, le stock exclut les lots
+    depasses. Seuls les produits avec un besoin > 0 sont retournes.
+    """
+    today = today or timezone.now().date()
+    window_days = max(1, window_days)
+
+    stock_valide = (
+        Lot.objects
+        .filter(produit=OuterRef("pk"), quantite__gt=0, date_fin__gte=today)
+        .order_by()
+        .values("produit")
+        .annotate(total=Sum("quantite"))
+        .values("total")
+    )
+    consommation = (
+        ConsommationJournaliere.objects
+        .filter(produit=OuterRef("pk"), jour__gte=today - timedelta(days=window_days), jour__lt=today)
+        .order_by()
+        .values("produit")
+        .annotate(total=Sum("quantite"))
+        .values("total")
+    )
+
+    qs = (
+        Produit.objects
+        .annotate(
+            stock_valide=Coalesce(Subquery(stock_valide, output_field=IntegerField()), 0),
+            consommation=Coalesce(Subquery(consommation, output_field=IntegerField()), 0),
+        )
+        .annotate(
+            taux_jour=ExpressionWrapper(
+                F("consommation") * 1.0 / window_days, output_field=FloatField()
+            ),
+        )
+        .annotate(
+            besoin=Greatest(
+                Ceil(
+                    ExpressionWrapper(
+                        F("nbr_qnt_alert") + F("taux_jour") * lead_time_days - F("stock_valide"),
+                        output_field=FloatField(),
+                    )
+                ),
+                Value(0.0),
+            ),
+        )
+        .filter(besoin__gt=0)
+        .order_by("famille__nom", "reference")
+        .values(
+            "id",
+            "reference",
+            "nom",
+            "barcode",
+            "famille__nom",
+            "nbr_qnt_alert",
+            "stock_valide",
+            "consommation",
+            "taux_jour",
+            "besoin",
+        )
+    )
+    if famille_id:
+        qs = qs.filter(famille_id=famille_id)
+    return qs
+
+
+def group_by_famille(rows):
+    """[(famille, [lignes], total a commander), ...] dans l'ordre des familles."""
+    groups = []
+    for famille, items in groupby(rows, key=lambda row: row["famille__nom"]):
+        items = list(items)
+        groups.append((famille, items, sum(int(row["besoin"]) for row in items)))
+    return groups
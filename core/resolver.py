@@ -0,0 +1,112 @@
+import threading
+from collections import namedtuple
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from .data_version import get_catalog_version
+from .metrics import record_cache
+from .models import Produit
+
+
+# Index en memoire code (reference / code-barres) -> produit, reconstruit
+# une seule fois par version du catalogue au lieu d'un iexact par scan. Les
+# sorties ne touchent pas au catalogue : l'index survit aux mouvements de
+# stock, et un code renomme ou supprime en disparait a la montee de version.
+ProduitRef = namedtuple("ProduitRef", ["id", "reference", "barcode", "nom"])
+
+_lock = threading.Lock()
+_state = {"version": None, "codes": {}}
+
+
+def _build_code_index():
+    codes = {}
+    rows = (
+        Produit.objects
+        .order_by("id")
+        .values_list("id", "reference", "barcode", "nom")
+        .iterator(chunk_size=5000)
+    )
+    for row in rows:
+        ref = ProduitRef(*row)
+        # Le premier produit (id le plus petit) gagne, comme .first() avant.
+        codes.setdefault(ref.reference.lower(), ref)
+        codes.setdefault(ref.barcode.lower(), ref)
+    return codes
+
+
+def get_code_index():
+    version = get_catalog_version()
+    record_cache("code_index", _state["version"] == version)
+    if _state["version"] != version:
+        with _lock:
+            if _state["version"] != version:
+                _state["codes"] = _build_code_index()
+                _state["version"] = version
+    return _state["codes"]
+
+
+def _code_query(code):
+    return Produit.objects.filter(Q(reference__iexact=code) | Q(barcode__iexact=code)).order_by("id")
+
+
+def lookup_code(code):
+    """Retourne le ProduitRef du code, ou None.
+
+    Sans requete si le code est dans l'index. Un produit cree sans montee de
+    version du catalogue (import, commande) n'est pas encore indexe : un code
+    absent est cherche en base avant d'etre declare introuvable.
+    """
+    code = (code or "").strip()
+    if not code:
+        return None
+    ref = get_code_index().get(code.lower())
+    if ref is not None:
+        return ref
+    row = _code_query(code).values_list("id", "reference", "barcode", "nom").first()
+    return ProduitRef(*row) if row else None
+
+
+def resolve_produit(code):
+    """Retourne l'instance Produit pour une reference ou un code-barres.
+
+    Le produit lu est verifie (code toujours le sien) ; en cas d'absence ou
+    d'ecart, on retombe sur la recherche en base pour ne jamais refuser une
+    sortie valide.
+    """
+    code = (code or "").strip()
+    if not code:
+        return None
+    ref = get_code_index().get(code.lower())
+    if ref is not None:
+        produit = Produit.objects.filter(pk=ref.id).first()
+        if produit is not None and code.lower() in (produit.reference.lower(), produit.barcode.lower()):
+            return produit
+    return _code_query(code).first()
+
+
+def resolve_codes(codes):
+    """Resout une liste de codes en une passe : {code en minuscules: ProduitRef}.
+
+    L'index couvre le cas courant ; les codes absents (produits pas encore
+    indexes) sont recherches en une seule requete.
+    """
+    wanted = {(code or "").strip().lower() for code in codes} - {""}
+    index = get_code_index()
+    found = {code: index[code] for code in wanted if code in index}
+
+    missing = wanted - found.keys()
+    if missing:
+        rows = (
+            Produit.objects
+            .annotate(reference_lower=Lower("reference"), barcode_lower=Lower("barcode"))
+            .filter(Q(reference_lower__in=missing) | Q(barcode_lower__in=missing))
+            .order_by("id")
+            .values_list("id", "reference", "barcode", "nom")
+        )
+        for row in rows:
+            ref = ProduitRef(*row)
+            for code in (ref.reference.lower(), ref.barcode.lower()):
+                if code in missing:
+                    found.setdefault(code, ref)
+    return found
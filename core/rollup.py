@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Subquery, Sum
+
+from .models import ConsommationJournaliere, Sort
+from .transactions import write_atomic
+
+
+DEFAULT_CHUNK_DAYS = 31
+
+
+# Le cumul est tenu par famille au moment de la sortie (Sort.famille) : le
+# cumul incremental et la reconstruction donnent les memes lignes, meme
+# apres un changement de famille du produit.
+
+
+def record_consumption(produit, quantite, jour):
+    """Ajoute une sortie au cumul journalier (appele dans la transaction de sortie)."""
+    rows = ConsommationJournaliere.objects.filter(produit=produit, famille_id=produit.famille_id, jour=jour)
+    updated = rows.update(quantite=F("quantite") + quantite, nb_sorties=F("nb_sorties") + 1)
+    if updated:
+        return
+
+    try:
+        with transaction.atomic():
+            ConsommationJournaliere.objects.create(
+                produit=produit,
+                famille_id=produit.famille_id,
+                jour=jour,
+                quantite=quantite,
+                nb_sorties=1,
+            )
+    except IntegrityError:
+        # Une autre sortie a cree la ligne entre-temps.
+        rows.update(quantite=F("quantite") + quantite, nb_sorties=F("nb_sorties") + 1)
+
+
+def sort_date_range():
+    bounds = Sort.objects.aggregate(start=Min("date_sortie"), end=Max("date_sortie"))
+    return bounds["start"], bounds["end"]
+
+
+def rebuild_consumption(start=None, end=None, chunk_days=DEFAULT_CHUNK_DAYS, on_chunk=None):
+    """Reconstruit le cumul depuis Sort, par tranches de `chunk_days` jours.
+
+    Chaque tranche est remplacee dans sa propre transaction : les lignes
+    existantes de la periode sont supprimees puis reinserees en bulk a
+    partir d'un GROUP BY sur Sort.
+    """
+    first, last = sort_date_range()
+    start = start or first
+    end = end or last
+    if start is None or end is None:
+        return 0
+
+    written = 0
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+        with transaction.atomic():
+            ConsommationJournaliere.objects.filter(jour__range=(chunk_start, chunk_end)).delete()
+            groups = (
+                Sort.objects
+                .filter(date_sortie__range=(chunk_start, chunk_end))
+                .values("produit_id", "famille_id", "date_sortie")
+                .annotate(total=Sum("quantite"), count=Count("id"))
+                .order_by()
+            )
+            rows = [
+                ConsommationJournaliere(
+                    produit_id=g["produit_id"],
+                    famille_id=g["famille_id"],
+                    jour=g["date_sortie"],
+                    quantite=g["total"],
+                    nb_sorties=g["count"],
+                )
+                for g in groups.iterator(chunk_size=5000)
+            ]
+            ConsommationJournaliere.objects.bulk_create(rows, batch_size=5000)
+            written += len(rows)
+
+        if on_chunk:
+            on_chunk(chunk_start, chunk_end, len(rows))
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
+
+def reassign_famille(famille_id, to_famille_id):
+    """Rattache sorties et cumuls d'une famille supprimee a `to_famille_id`.
+
+    Un cumul deja present pour le meme produit et le meme jour dans la
+    famille cible (produit passe par les deux familles) est additionne.
+    """
+    with write_atomic():
+        Sort.objects.filter(famille_id=famille_id).update(famille_id=to_famille_id)
+        moved = ConsommationJournaliere.objects.filter(famille_id=famille_id)
+        same_day = moved.filter(produit_id=OuterRef("produit_id"), jour=OuterRef("jour"))
+        ConsommationJournaliere.objects.filter(famille_id=to_famille_id).filter(Exists(same_day)).update(
+            quantite=F("quantite") + Subquery(same_day.values("quantite")[:1]),
+            nb_sorties=F("nb_sorties") + Subquery(same_day.values("nb_sorties")[:1]),
+        )
+        merged = ConsommationJournaliere.objects.filter(
+            famille_id=to_famille_id, produit_id=OuterRef("produit_id"), jour=OuterRef("jour"),
+        )
+        moved.filter(Exists(merged)).delete()
+        moved.update(famille_id=to_famille_id)
@@ -0,0 +1,93 @@
+from .models import LotExpiration
+from .stock_status import next_expiry_state, stock_state
+
+
+# Lignes compactes des tableaux products et alerts : des objets a __slots__
+# construits depuis des tuples values_list(), a la place d'instances de
+# modeles et de dictionnaires de 12 a 17 cles par ligne.
+
+PRODUCT_FIELDS = (
+    "id", "nom", "reference", "barcode", "famille__nom", "stock_total",
+    "nbr_qnt_alert", "nbr_days_alert", "next_bucket", "next_days_left",
+)
+
+# Produits de la page alerts, avec le prochain lot non vide (sous-requetes).
+ALERT_PRODUCT_FIELDS = (
+    "id", "nom", "reference", "barcode", "famille__nom", "stock_total", "nbr_qnt_alert",
+    "next_quantite", "next_date_entree", "next_date_fin",
+)
+
+# Lots en alerte (current_expirations) : une ligne par lot, avec son produit.
+ALERT_EXPIRATION_FIELDS = (
+    "produit_id", "lot_id", "bucket_jour", "days_left_jour", "lot__quantite", "lot__date_entree", "date_fin",
+    "produit__nom", "produit__reference", "produit__barcode", "produit__famille__nom",
+)
+
+
+class ProductRow:
+    __slots__ = (
+        "id", "nom", "reference", "barcode", "famille_nom", "stock_total",
+        "nbr_qnt_alert", "nbr_days_alert", "stock_level", "stock_label", "exp_level", "exp_label",
+    )
+
+    def __init__(self, values):
+        (
+            self.id, self.nom, self.reference, self.barcode, self.famille_nom, stock,
+            self.nbr_qnt_alert, self.nbr_days_alert, next_bucket, next_days_left,
+        ) = values
+        self.stock_total = stock or 0
+        self.stock_level, self.stock_label = stock_state(self.stock_total, self.nbr_qnt_alert)
+        if self.stock_total <= 0:
+            self.exp_level, self.exp_label = "ok", "Pas de stock"
+        else:
+            self.exp_level, self.exp_label = next_expiry_state(next_bucket, next_days_left)
+
+
+class AlertRow:
+    __slots__ = (
+        "type", "status_label", "status_level", "lot_id", "produit_id", "produit_nom",
+        "reference", "barcode", "famille", "stock_total", "lot_quantite",
+        "date_entree", "date_fin", "days_left",
+    )
+
+    def __init__(self, type, status_level, status_label, produit, stock_total,
+                 lot_id, lot_quantite, date_entree, date_fin, days_left):
+        self.type = type
+        self.status_level = status_level
+        self.status_label = status_label
+        self.produit_id, self.produit_nom, self.reference, self.barcode, self.famille = produit
+        self.stock_total = stock_total
+        self.lot_id = lot_id
+        self.lot_quantite = lot_quantite
+        self.date_entree = date_entree
+        self.date_fin = date_fin
+        self.days_left = days_left
+
+    @property
+    def type_label(self):
+        return "Alerte stock" if self.type == "stock" else "Alerte expiration"
+
+    @classmethod
+    def for_stock(cls, produit, stock_total, level, label, next_lot, today):
+        """Alerte rupture / seuil ; next_lot = (quantite, date_entree, date_fin) ou None."""
+        if next_lot is None or next_lot[2] is None:
+            return cls("stock", level, label, produit, stock_total, None, "-", "-", "-", "-")
+        quantite, date_entree, date_fin = next_lot
+        return cls(
+            "stock", level, label, produit, stock_total,
+            None, quantite, date_entree, date_fin, (date_fin - today).days,
+        )
+
+    @classmethod
+    def for_expiration(cls, produit, stock_total, expiration):
+        _, lot_id, bucket, days_left, quantite, date_entree, date_fin = expiration
+        if bucket == LotExpiration.BUCKET_EXPIRE:
+            level, label = "danger", "Expire"
+        elif bucket == LotExpiration.BUCKET_AUJOURDHUI:
+            level, label = "danger", "Expire aujourd'hui"
+        else:
+            level, label = "near", "Proche expiration"
+        return cls(
+            "expiry", level, label, produit, stock_total,
+            lot_id, quantite, date_entree, date_fin, days_left,
+        )
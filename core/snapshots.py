@@ -0,0 +1,202 @@
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Lot, LotArchive, Sort, StockCheckpoint, StockCheckpointJour, StockCorrection
+
+
+BATCH_SIZE = 5000
+
+# Stock de fin de journee reconstitue a partir du checkpoint le plus proche :
+#   apres le checkpoint : checkpoint + entrees - sorties
+#   avant le checkpoint : checkpoint - entrees + sorties
+# Les entrees sont les quantites initiales des lots (archives compris) a leur
+# date d'entree, les sorties viennent de Sort ; tout autre changement de
+# stock (lot expire retire ou archive avec un reste, ajustement d'inventaire)
+# est une StockCorrection datee, sans quoi il reecrirait le passe. Le cout ne
+# depend que de l'ecart entre la date demandee et le checkpoint, pas de
+# l'historique.
+# Un checkpoint ne porte que sur une journee terminee (avant aujourd'hui) :
+# le stock pris en cours de journee ne vaut pas stock de fin de journee.
+
+
+def _grouped(qs, date_field, value, start, end, produit_id, by_day):
+    """Sommes groupees sur l'intervalle ]start, end]."""
+    qs = qs.filter(**{f"{date_field}__gt": start, f"{date_field}__lte": end})
+    if produit_id is not None:
+        qs = qs.filter(produit_id=produit_id)
+    keys = ("produit_id", date_field) if by_day else ("produit_id",)
+    return qs.order_by().values_list(*keys).annotate(total=Sum(value))
+
+
+def net_movements(start, end, produit_id=None, by_day=False):
+    """Entrees - sorties + corrections par produit (ou par (produit, jour)) sur ]start, end]."""
+    net = defaultdict(int)
+    entry_value = Coalesce("quantite_initiale", "quantite")
+    for model in (Lot, LotArchive):
+        for *key, total in _grouped(model.objects, "date_entree", entry_value, start, end, produit_id, by_day):
+            net[tuple(key) if by_day else key[0]] += total or 0
+    for *key, total in _grouped(Sort.objects, "date_sortie", "quantite", start, end, produit_id, by_day):
+        net[tuple(key) if by_day else key[0]] -= total or 0
+    for *key, total in _grouped(StockCorrection.objects, "jour", "quantite", start, end, produit_id, by_day):
+        net[tuple(key) if by_day else key[0]] += total or 0
+    return net
+
+
+def record_corrections(totals, motif, jour=None):
+    """Enregistre des corrections datees : `totals` {produit_id: quantite signee}."""
+    jour = jour or timezone.now().date()
+    StockCorrection.objects.bulk_create(
+        (
+            StockCorrection(jour=jour, produit_id=pid, quantite=quantite, motif=motif)
+            for pid, quantite in totals.items()
+            if quantite
+        ),
+        batch_size=BATCH_SIZE,
+    )
+
+
+def record_lot_removal(lots, archived, today=None):
+    """Corrections pour des lots (queryset) sur le point d'etre supprimes.
+
+    Leur reste sort du stock aujourd'hui (perte). Sans archive, leur entree
+    disparait aussi de l'historique : elle est reportee a sa date d'entree.
+    """
+    today = today or timezone.now().date()
+    pertes = lots.filter(quantite__gt=0).order_by().values_list("produit_id").annotate(total=Sum("quantite"))
+    record_corrections({pid: -total for pid, total in pertes}, StockCorrection.MOTIF_PERTE, today)
+    if not archived:
+        entrees = (
+            lots.order_by()
+            .values_list("date_entree", "produit_id")
+            .annotate(total=Sum(Coalesce("quantite_initiale", "quantite")))
+        )
+        by_day = defaultdict(dict)
+        for jour, pid, total in entrees:
+            by_day[jour][pid] = total
+        for jour, totals in by_day.items():
+            record_corrections(totals, StockCorrection.MOTIF_ENTREE, jour)
+
+
+def current_stock(produit_id=None):
+    qs = Lot.objects.filter(quantite__gt=0)
+    if produit_id is not None:
+        qs = qs.filter(produit_id=produit_id)
+    return dict(qs.order_by().values_list("produit_id").annotate(total=Sum("quantite")))
+
+
+def checkpoint_stock(jour, produit_id=None):
+    qs = StockCheckpoint.objects.filter(jour=jour)
+    if produit_id is not None:
+        qs = qs.filter(produit_id=produit_id)
+    return dict(qs.values_list("produit_id", "quantite").iterator(chunk_size=BATCH_SIZE))
+
+
+def nearest_anchor(day, today):
+    """Jour d'ancrage le plus proche de `day` : un checkpoint ou aujourd'hui.
+
+    Les checkpoints d'une journee non terminee sont ignores.
+    """
+    candidates = [today]
+    days = StockCheckpointJour.objects.filter(jour__lt=today)
+    before = days.filter(jour__lte=day).order_by("-jour").values_list("jour", flat=True).first()
+    after = days.filter(jour__gt=day).order_by("jour").values_list("jour", flat=True).first()
+    candidates.extend(jour for jour in (before, after) if jour is not None)
+    return min(candidates, key=lambda jour: (abs((jour - day).days), jour != before))
+
+
+def stock_at(day, produit_id=None, today=None):
+    """Stock de fin de journee `day` : {produit_id: quantite} ou un entier."""
+    today = today or timezone.now().date()
+    if day > today:
+        raise ValueError("La date demandee est dans le futur.")
+
+    anchor = nearest_anchor(day, today)
+    if anchor == today:
+        stock = current_stock(produit_id)
+    else:
+        stock = checkpoint_stock(anchor, produit_id)
+
+    if anchor < day:
+        net = net_movements(anchor, day, produit_id)
+        sign = 1
+    else:
+        net = net_movements(day, anchor, produit_id)
+        sign = -1
+
+    result = defaultdict(int, stock)
+    for pid, delta in net.items():
+        result[pid] += sign * delta
+    result = {pid: qty for pid, qty in result.items() if qty > 0}
+
+    if produit_id is not None:
+        return result.get(produit_id, 0)
+    return result
+
+
+def _write_day(jour, stock):
+    with transaction.atomic():
+        StockCheckpoint.objects.filter(jour=jour).delete()
+        StockCheckpoint.objects.bulk_create(
+            (
+                StockCheckpoint(jour=jour, produit_id=pid, quantite=qty)
+                for pid, qty in stock.items()
+                if qty > 0
+            ),
+            batch_size=BATCH_SIZE,
+        )
+        StockCheckpointJour.objects.update_or_create(
+            jour=jour, defaults={"nb_produits": sum(1 for qty in stock.values() if qty > 0)}
+        )
+
+
+def write_checkpoint(jour=None):
+    """Checkpoint d'une journee terminee (hier par defaut), reconstitue depuis le stock reel."""
+    today = timezone.now().date()
+    jour = jour or today - timedelta(days=1)
+    if jour >= today:
+        raise ValueError("Un checkpoint ne porte que sur une journee terminee (avant aujourd'hui).")
+    stock = stock_at(jour, today=today)
+    _write_day(jour, stock)
+    return len(stock)
+
+
+def build_checkpoints(start, end, every=1, on_day=None):
+    """Construit les checkpoints de `start` a `end` (hier au plus) en remontant le temps.
+
+    On part du stock reel (ou du premier checkpoint existant apres `end`) et
+    on retire jour par jour les mouvements, charges en deux requetes groupees
+    sur toute la periode.
+    """
+    today = timezone.now().date()
+    end = min(end, today - timedelta(days=1))
+    anchor = (
+        StockCheckpointJour.objects
+        .filter(jour__gte=end, jour__lt=today)
+        .order_by("jour")
+        .values_list("jour", flat=True)
+        .first()
+    ) or today
+    stock = defaultdict(int, current_stock() if anchor == today else checkpoint_stock(anchor))
+
+    net_by_day = defaultdict(dict)
+    for (pid, jour), delta in net_movements(start, anchor, by_day=True).items():
+        net_by_day[jour][pid] = delta
+
+    written = 0
+    day = anchor
+    while day >= start:
+        if day <= end and (end - day).days % every == 0:
+            _write_day(day, stock)
+            written += 1
+            if on_day:
+                on_day(day)
+        # Passage a la veille : on annule les mouvements de `day`.
+        for pid, delta in net_by_day.pop(day, {}).items():
+            stock[pid] -= delta
+        day -= timedelta(days=1)
+    return written
@@ -0,0 +1,204 @@
+from django.core.cache import cache
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .data_version import aget_data_version, get_data_version
+from .expiry import ALERT_BUCKETS, with_next_expiry
+from .metrics import record_cache
+from .models import Lot, LotExpiration, Produit, Site
+
+
+DANGER_BUCKETS = (LotExpiration.BUCKET_EXPIRE, LotExpiration.BUCKET_AUJOURDHUI)
+
+CACHE_TIMEOUT = 24 * 3600
+
+# Statut stock / peremption d'un produit exprime en SQL : les compteurs du
+# tableau de bord sont des COUNT(...) FILTER (WHERE ...) sur ces annotations,
+# sans charger les produits en Python. Compteurs et liste des produits
+# critiques sont mis en cache par version des donnees et par jour.
+STOCK_ALERT = Q(stock_total__lte=0) | Q(stock_total__lte=F("nbr_qnt_alert"))
+EXPIRY_ALERT = Q(stock_total__gt=0, next_bucket__in=ALERT_BUCKETS)
+CRITICAL = Q(stock_total__lte=0) | Q(next_bucket__in=DANGER_BUCKETS)
+
+
+def with_stock_status(produits_qs, days_left=True, site_id=None):
+    """Annote stock_total (sous-requete, pas de GROUP BY) et le premier lot FEFO.
+
+    Avec site_id, stock et premier lot sont ceux du site (index lot_site_fefo_idx).
+    """
+    lots = Lot.objects.filter(produit=OuterRef("pk"))
+    if site_id is not None:
+        lots = lots.filter(site_id=site_id)
+    stock = (
+        lots
+        .order_by()
+        .values("produit")
+        .annotate(total=Sum("quantite"))
+        .values("total")
+    )
+    return with_next_expiry(
+        produits_qs.annotate(stock_total=Coalesce(Subquery(stock), 0)), days_left, site_id,
+    )
+
+
+def carried_at(produits_qs, site_id):
+    """Produits ayant au moins un lot (meme vide) sur le site : les autres n'y sont pas en rupture."""
+    return produits_qs.filter(Exists(Lot.objects.filter(produit=OuterRef("pk"), site_id=site_id)))
+
+
+def _cache_key(name, version):
+    return f"stock_status:{version}:{timezone.now().date()}:{name}"
+
+
+def _counters_queryset(site_id=None):
+    produits = Produit.objects.all() if site_id is None else carried_at(Produit.objects.all(), site_id)
+    return with_stock_status(produits, days_left=False, site_id=site_id)
+
+
+def _counter_aggregates():
+    return {
+        "total": Count("id"),
+        "stock": Count("id", filter=STOCK_ALERT),
+        "expiry": Count("id", filter=EXPIRY_ALERT),
+        "critical": Count("id", filter=CRITICAL),
+    }
+
+
+def _critical_queryset():
+    """Produits critiques : ruptures d'abord, puis peremption la plus proche."""
+    return (
+        with_stock_status(Produit.objects.all())
+        .filter(CRITICAL)
+        .annotate(rupture=Case(When(stock_total__lte=0, then=Value(0)), default=Value(1)))
+        .order_by("rupture", F("next_days_left").asc(nulls_last=True), "reference")
+        .values_list("id", flat=True)
+    )
+
+
+def _page(ids, offset, limit, produits):
+    by_id = {p.id: p for p in produits}
+    page_ids = ids[offset:offset + limit]
+    return [by_id[pid] for pid in page_ids if pid in by_id], offset + limit < len(ids)
+
+
+def status_counters():
+    key = _cache_key("counters", get_data_version())
+    counters = cache.get(key)
+    record_cache("status_counters", counters is not None)
+    if counters is None:
+        counters = _counters_queryset().aggregate(**_counter_aggregates())
+        counters["alerts"] = counters["stock"] + counters["expiry"]
+        cache.set(key, counters, CACHE_TIMEOUT)
+    return counters
+
+
+def critical_products(offset=0, limit=10):
+    """Une page de produits critiques annotes, et s'il en reste apres."""
+    key = _cache_key("critical", get_data_version())
+    ids = cache.get(key)
+    record_cache("critical_products", ids is not None)
+    if ids is None:
+        ids = list(_critical_queryset())
+        cache.set(key, ids, CACHE_TIMEOUT)
+    produits = with_stock_status(Produit.objects.filter(id__in=ids[offset:offset + limit]))
+    return _page(ids, offset, limit, produits)
+
+
+def site_summaries(today=None):
+    """Stock, lots, produits et compteurs d'alerte de chaque site (cache par version)."""
+    today = today or timezone.now().date()
+    key = _cache_key("sites", get_data_version())
+    summaries = cache.get(key)
+    record_cache("site_summaries", summaries is not None)
+    if summaries is None:
+        sites = (
+            Site.objects
+            .annotate(
+                stock=Coalesce(Sum("lots__quantite", filter=Q(lots__date_fin__gte=today)), 0),
+                stock_expire=Coalesce(Sum("lots__quantite", filter=Q(lots__date_fin__lt=today)), 0),
+                nb_lots=Count("lots", filter=Q(lots__quantite__gt=0)),
+                nb_produits=Count("lots__produit", filter=Q(lots__quantite__gt=0), distinct=True),
+            )
+            .order_by("nom")
+            .values("id", "nom", "stock", "stock_expire", "nb_lots", "nb_produits")
+        )
+        summaries = []
+        for site in sites:
+            # Une requete par site : les compteurs lisent l'index lot_site_fefo_idx.
+            counters = _counters_queryset(site["id"]).aggregate(**_counter_aggregates())
+            site["alertes_stock"] = counters["stock"]
+            site["alertes_expiration"] = counters["expiry"]
+            site["critiques"] = counters["critical"]
+            summaries.append(site)
+        cache.set(key, summaries, CACHE_TIMEOUT)
+    return summaries
+
+
+# Versions async pour les vues ASGI (memes requetes, ORM async).
+
+async def astatus_counters():
+    key = _cache_key("counters", await aget_data_version())
+    counters = await cache.aget(key)
+    record_cache("status_counters", counters is not None)
+    if counters is None:
+        counters = await _counters_queryset().aaggregate(**_counter_aggregates())
+        counters["alerts"] = counters["stock"] + counters["expiry"]
+        await cache.aset(key, counters, CACHE_TIMEOUT)
+    return counters
+
+
+async def acritical_products(offset=0, limit=10):
+    key = _cache_key("critical", await aget_data_version())
+    ids = await cache.aget(key)
+    record_cache("critical_products", ids is not None)
+    if ids is None:
+        ids = [pid async for pid in _critical_queryset().aiterator(chunk_size=2000)]
+        await cache.aset(key, ids, CACHE_TIMEOUT)
+    page_qs = with_stock_status(Produit.objects.filter(id__in=ids[offset:offset + limit]))
+    return _page(ids, offset, limit, [p async for p in page_qs.aiterator()])
+
+
+def next_expiry_state(bucket, days_left):
+    """Statut de peremption d'un produit d'apres son premier lot FEFO."""
+    if bucket is None:
+        return "ok", "Aucune date de péremption"
+    if bucket == LotExpiration.BUCKET_EXPIRE:
+        return "danger", "Produit expiré"
+    if bucket == LotExpiration.BUCKET_AUJOURDHUI:
+        return "danger", "Expire aujourd’hui"
+    if bucket == LotExpiration.BUCKET_PROCHE:
+        return "near", f"Expire dans {days_left} jour(s)"
+    return "ok", f"Expire dans {days_left} jour(s)"
+
+
+def stock_state(stock, nbr_qnt_alert):
+    """Niveau et libelle du stock total d'un produit face a son seuil."""
+    if stock <= 0:
+        return "danger", "Rupture de stock"
+    if stock <= nbr_qnt_alert:
+        return "near", "Seuil de stock atteint"
+    return "ok", "Stock normal"
+
+
+def product_state(produit):
+    """Niveaux et libelles affiches pour un produit annote par with_stock_status."""
+    stock = produit.stock_total or 0
+    stock_level, stock_label = stock_state(stock, produit.nbr_qnt_alert)
+
+    if stock <= 0:
+        exp_level, exp_label = "ok", "Pas de stock"
+    else:
+        exp_level, exp_label = next_expiry_state(produit.next_bucket, produit.next_days_left)
+
+    return {
+        "id": produit.id,
+        "nom": produit.nom or "-",
+        "reference": produit.reference,
+        "barcode": produit.barcode,
+        "stock_total": stock,
+        "stock_level": stock_level,
+        "stock_label": stock_label,
+        "exp_level": exp_level,
+        "exp_label": exp_label,
+    }
@@ -0,0 +1,100 @@
+import heapq
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import get_template, render_to_string
+from django.utils.safestring import mark_safe
+
+
+# Rendu incremental des grands tableaux (products, alerts).
+#
+# La page est rendue une fois avec un marqueur a la place de chaque <tbody> :
+# en-tete, formulaires et messages sont donc produits pendant la vue (les
+# messages sont consommes avant les middlewares de reponse). Les lignes sont
+# ensuite rendues par paquets de ROW_CHUNK avec un gabarit dedie, au fil de
+# l'iteration : ni la liste complete des lignes, ni le HTML complet ne sont
+# gardes en memoire.
+#
+# Sous WSGI, Django consomme l'iterateur async en entier avant l'envoi :
+# le rendu reste correct mais n'est plus incremental.
+
+ROWS_MARKER = mark_safe("<!--rows-->")
+ROW_CHUNK = 500
+
+
+def avalues_list(queryset, fields, chunk_size=ROW_CHUNK):
+    """aiterator() de tuples des champs donnes.
+
+    named=True : l'iterable values_list simple execute sa requete des sa
+    creation, dans la boucle d'evenements (SynchronousOnlyOperation).
+    """
+    return queryset.values_list(*fields, named=True).aiterator(chunk_size=chunk_size)
+
+
+async def _aiter(rows):
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            yield row
+    else:
+        for row in rows:
+            yield row
+
+
+async def amerge(*streams):
+    """Fusion de flux async de paires (cle, ligne) deja tries par cle.
+
+    heapq.merge pour aiterator() : une ligne en tete par flux, a cle egale le
+    premier flux passe d'abord.
+    """
+    iterators = [stream.__aiter__() for stream in streams]
+    heads = []
+
+    async def push(index):
+        try:
+            key, row = await iterators[index].__anext__()
+        except StopAsyncIteration:
+            return
+        heapq.heappush(heads, (key, index, row))
+
+    for index in range(len(iterators)):
+        await push(index)
+    while heads:
+        _, index, row = heapq.heappop(heads)
+        yield row
+        await push(index)
+
+
+async def _render_sections(parts, sections, csrf_token, chunk_size):
+    yield parts[0]
+    for (template_name, rows), tail in zip(sections, parts[1:]):
+        render_chunk = sync_to_async(get_template(template_name).render)
+        chunk = []
+        count = 0
+        async for row in _aiter(rows):
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                count += len(chunk)
+                yield await render_chunk({"items": chunk, "csrf_token": csrf_token})
+                chunk = []
+        if chunk or not count:
+            # Un paquet vide affiche la ligne {% empty %} du gabarit.
+            yield await render_chunk({"items": chunk, "csrf_token": csrf_token})
+        yield tail
+
+
+async def astream_page(request, template_name, context, sections, chunk_size=ROW_CHUNK):
+    """StreamingHttpResponse de la page ; sections = [(gabarit des lignes, lignes), ...].
+
+    Les lignes sont un iterable ou un iterable async (aiterator d'un values_list).
+    Le gabarit de page contient {{ rows_marker }} une fois par section.
+    """
+    html = await sync_to_async(render_to_string)(
+        template_name, dict(context, rows_marker=ROWS_MARKER), request
+    )
+    parts = html.split(ROWS_MARKER)
+    if len(parts) != len(sections) + 1:
+        raise ValueError(f"{template_name}: {len(parts) - 1} marqueur(s) pour {len(sections)} section(s).")
+    # Jeton CSRF des formulaires de ligne (rendus sans requete).
+    csrf_token = get_token(request)
+    return StreamingHttpResponse(_render_sections(parts, sections, csrf_token, chunk_size))
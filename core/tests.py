@@ -1,3 +1,1038 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import random
+import tempfile
+import tracemalloc
+from datetime import timedelta
+from pathlib import Path
+from unittest import skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import path
+from django.utils import timezone
+
+from . import expiry, views
+from .data_version import DATA_VERSION_CACHE_KEY, bump_data_version, get_catalog_version, get_data_version
+from .archive import archive_lots, purge_expired_lots
+from .digest import collect_alerts
+from .inventory import add_counts, apply_session
+from .models import (
+    DEFAULT_SITE_NOM, AlerteDigest, AlerteOutbox, ConsommationJournaliere, Famille, LotArchive, InventaireAjustement, InventaireComptage, InventaireSession, Lot, LotExpiration,
+    Prevision, PrevisionLot, Produit, Site, Sort, SortieLot, StockCheckpoint, StockCheckpointJour, default_site_id,
+)
+from . import profiling
+from .bench import summarize
+from .management.commands import bench_stations
+from .profiling import _enabled_profiler
+from .bulk_delete import delete_famille, delete_produits
+from .fefo import allocate_exit
+from .forecast import project_fefo, refresh_previsions
+from .rollup import reassign_famille, rebuild_consumption
+from .fuzzy import FuzzyIndex, _grams
+from .horizon import expiry_horizon
+from .resolver import get_code_index, lookup_code, resolve_produit
+from .snapshots import stock_at, write_checkpoint
+from .stock_status import critical_products, status_counters, with_stock_status
+from .views import fefo_preview
+
+
+def make_produit(reference="REF-1", famille=None):
+    famille = famille or Famille.objects.get_or_create(nom="Tests")[0]
+    return Produit.objects.create(reference=reference, barcode=f"BC-{reference}", nom=reference, famille=famille)
+
+
+def setUpModule():
+    # Le cache est partage sur disque : pas de compteurs d'un lancement precedent.
+    cache.clear()
+
+
+class DataVersionTests(TestCase):
+    def test_bump_is_shared_through_the_cache(self):
+        version, catalog = get_data_version(), get_catalog_version()
+        bump_data_version()
+        self.assertEqual(get_data_version(), version + 1)
+        self.assertEqual(get_catalog_version(), catalog)
+        bump_data_version(catalog=True)
+        self.assertEqual(cache.get(DATA_VERSION_CACHE_KEY), version + 2)
+        self.assertEqual(get_catalog_version(), catalog + 1)
+
+    def test_evicted_version_restarts_above_previous(self):
+        version = get_data_version()
+        cache.delete(DATA_VERSION_CACHE_KEY)
+        self.assertGreater(get_data_version(), version)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    def setUp(self):
+        # Le client de test ne ferme pas les reponses en streaming non lues des
+        # autres tests : elles resteraient "en cours".
+        profiling._state.update(in_flight=0, profiling=False, mixed=False)
+
+    async def test_profiled_asgi_request(self):
+        with tempfile.TemporaryDirectory() as profiles, override_settings(
+            PROFILING_SAMPLE_RATE=100, PROFILING_DIR=profiles,
+        ):
+            response = await AsyncClient().get("/dashboard/", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("X-Profile-Id", response)
+        # Le profileur de la requete est arrete : un autre peut demarrer.
+        profiler = _enabled_profiler()
+        self.assertIsNotNone(profiler)
+        profiler.disable()
+
+    async def test_streamed_body_is_profiled(self):
+        with tempfile.TemporaryDirectory() as profiles, override_settings(
+            PROFILING_SAMPLE_RATE=100, PROFILING_DIR=profiles,
+        ):
+            response = await AsyncClient().get("/products/", secure=True)
+            self.assertTrue(response.streaming)
+            self.assertEqual(list(Path(profiles).rglob("*.prof")), [])
+            body = b"".join([chunk async for chunk in response.streaming_content])
+            self.assertIn(b"</html>", body)
+            # Le profil est ecrit apres le dernier morceau du corps.
+            self.assertEqual(len(list(Path(profiles).rglob("*.prof"))), 1)
+        self.assertEqual(profiling._state["in_flight"], 0)
+
+    async def test_concurrent_request_is_not_profiled(self):
+        # Une autre requete est en cours : son travail serait melange au profil.
+        profiling._start(False)
+        try:
+            with tempfile.TemporaryDirectory() as profiles, override_settings(
+                PROFILING_SAMPLE_RATE=100, PROFILING_DIR=profiles,
+            ):
+                response = await AsyncClient().get("/dashboard/", secure=True)
+                self.assertEqual(list(Path(profiles).rglob("*.prof")), [])
+        finally:
+            profiling._stop(None)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Profile-Id", response)
+
+
+async def streamed_queries(request):
+    async def body():
+        yield str(await Produit.objects.acount())
+        yield str(await Lot.objects.acount())
+
+    return StreamingHttpResponse(body())
+
+
+urlpatterns = [path("streamed/", streamed_queries, name="streamed")]
+
+
+@skipUnless(settings.HAS_PROMETHEUS, "prometheus_client n'est pas installe")
+@override_settings(ROOT_URLCONF=__name__)
+class MetricsMiddlewareTests(TestCase):
+    @staticmethod
+    def observed(view):
+        from prometheus_client import REGISTRY
+
+        count = REGISTRY.get_sample_value("stock_request_db_queries_count", {"view": view}) or 0
+        total = REGISTRY.get_sample_value("stock_request_db_queries_sum", {"view": view}) or 0
+        return count, total
+
+    async def test_streamed_body_is_measured(self):
+        count, total = self.observed("streamed")
+        response = await AsyncClient().get("/streamed/", secure=True)
+        self.assertEqual(self.observed("streamed"), (count, total))
+        body = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(body, b"00")
+        # Observe une fois, au dernier morceau, avec les deux requetes du corps.
+        self.assertEqual(self.observed("streamed"), (count + 1, total + 2))
+
+
+class ArchiveLotsTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        produit = make_produit()
+
+        def lot(quantite, days_left):
+            return Lot.objects.create(
+                produit=produit, quantite=quantite, quantite_initiale=max(quantite, 1),
+                date_entree=today - timedelta(days=400), date_fin=today + timedelta(days=days_left),
+            )
+
+        self.epuise = lot(0, 30)
+        self.vieux = lot(4, -200)
+        self.recent = lot(4, -10)
+        self.actif = lot(6, 30)
+
+    def test_archives_depleted_and_old_expired_lots_only(self):
+        counts = archive_lots(retention_days=90, chunk_size=1)
+        self.assertEqual(counts, {"epuise": 1, "expire": 1})
+        self.assertEqual(
+            set(Lot.objects.values_list("id", flat=True)), {self.recent.id, self.actif.id}
+        )
+        self.assertEqual(
+            dict(LotArchive.objects.values_list("lot_id", "motif")),
+            {self.epuise.id: LotArchive.MOTIF_EPUISE, self.vieux.id: LotArchive.MOTIF_EXPIRE},
+        )
+        self.assertEqual(LotArchive.objects.get(lot_id=self.vieux.id).quantite, 4)
+
+    def test_dry_run_writes_nothing(self):
+        self.assertEqual(archive_lots(retention_days=90, dry_run=True), {"epuise": 1, "expire": 1})
+        self.assertEqual(Lot.objects.count(), 4)
+        self.assertFalse(LotArchive.objects.exists())
+
+    def test_lots_page_lists_archive_on_request(self):
+        archive_lots(retention_days=90)
+        self.assertNotContains(self.client.get("/lots/", secure=True), "Archivé (lot")
+        self.assertContains(self.client.get("/lots/", {"archive": "1"}, secure=True), "Archivé (lot", count=2)
+
+
+class ForecastTests(TestCase):
+    def test_project_fefo_stops_each_lot_at_its_expiry(self):
+        # Produit 0 : 1/jour, un lot expire avant d'etre fini. Produit 1 : aucune sortie.
+        elapsed, waste = project_fefo(
+            np.array([0, 0, 1]),
+            np.array([10.0, 10.0, 3.0]),
+            np.array([5.0, 100.0, 10.0]),
+            np.array([1.0, 0.0]),
+            2,
+        )
+        self.assertEqual(elapsed.tolist(), [15.0, 0.0])
+        self.assertEqual(waste.tolist(), [5.0, 0.0, 3.0])
+
+    def test_refresh_writes_rupture_and_lot_waste(self):
+        today = timezone.localdate()
+        produit = make_produit()
+        ConsommationJournaliere.objects.bulk_create(
+            ConsommationJournaliere(produit=produit, famille=produit.famille, jour=today - timedelta(days=d), quantite=2)
+            for d in range(1, 91)
+        )
+        court = Lot.objects.create(
+            produit=produit, quantite=100, date_entree=today, date_fin=today + timedelta(days=20),
+        )
+        Lot.objects.create(produit=produit, quantite=10, date_entree=today, date_fin=today + timedelta(days=30))
+
+        self.assertEqual(refresh_previsions(today=today), (1, 1))
+
+        prevision = Prevision.objects.get(produit=produit)
+        self.assertAlmostEqual(prevision.taux_moyen, 2.0)
+        self.assertAlmostEqual(prevision.taux_lisse, 2.0)
+        self.assertEqual(prevision.stock_disponible, 110)
+        # 21 jours sur le lot court (42 sortis, 58 perimes) puis 5 jours sur l'autre.
+        self.assertEqual(prevision.date_rupture, today + timedelta(days=26))
+        self.assertEqual(prevision.quantite_perimee, 58)
+        self.assertEqual(list(PrevisionLot.objects.values_list("lot_id", "quantite_perimee")), [(court.id, 58)])
+
+
+class BulkDeleteTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        self.cible = Famille.objects.create(nom="Cible")
+        self.autre = Famille.objects.create(nom="Autre")
+        self.produits = [make_produit("A-1", self.cible), make_produit("A-2", self.cible), make_produit("B-1", self.autre)]
+        for produit in self.produits:
+            lot = Lot.objects.create(produit=produit, quantite=10, date_entree=today, date_fin=today + timedelta(days=90))
+            allocate_exit(produit, 2, lot.site_id, today)
+
+    def test_delete_famille_only_touches_its_products(self):
+        counts = delete_famille(self.cible.id, chunk_size=1)
+        self.assertEqual(counts["core.Famille"], 1)
+        self.assertEqual(counts["core.Produit"], 2)
+        self.assertEqual(counts["core.Lot"], 2)
+        self.assertEqual(counts["core.Sort"], 2)
+        self.assertEqual(list(Famille.objects.filter(nom__in=["Cible", "Autre"]).values_list("nom", flat=True)), ["Autre"])
+        self.assertEqual(list(Produit.objects.values_list("reference", flat=True)), ["B-1"])
+        self.assertEqual(set(Lot.objects.values_list("produit__reference", flat=True)), {"B-1"})
+        self.assertEqual(set(Sort.objects.values_list("produit__reference", flat=True)), {"B-1"})
+        self.assertEqual(set(ConsommationJournaliere.objects.values_list("famille__nom", flat=True)), {"Autre"})
+
+    def test_delete_produits_keeps_famille_and_siblings(self):
+        counts = delete_produits([self.produits[0].id])
+        self.assertEqual(counts["core.Produit"], 1)
+        self.assertEqual(sorted(Produit.objects.values_list("reference", flat=True)), ["A-2", "B-1"])
+        self.assertTrue(Famille.objects.filter(pk=self.cible.pk).exists())
+        self.assertEqual(Lot.objects.count(), 2)
+
+    def test_famille_view_deletes_with_products(self):
+        response = self.client.post(
+            "/famille/",
+            {"action": "delete_famille", "famille_id": self.cible.id, "delete_mode": "with_products"},
+            secure=True, follow=True,
+        )
+        self.assertContains(response, "supprimee avec 2 produit(s)")
+        self.assertEqual(list(Produit.objects.values_list("reference", flat=True)), ["B-1"])
+
+
+class BulkThresholdTests(TestCase):
+    def setUp(self):
+        self.cible = Famille.objects.create(nom="Cible")
+        make_produit("A-1", self.cible)
+        make_produit("A-2", self.cible)
+        make_produit("B-1", Famille.objects.create(nom="Autre"))
+
+    def test_preview_counts_targeted_products(self):
+        response = self.client.get("/products/thresholds/", {"famille": self.cible.id, "nbr_qnt_alert": 7}, secure=True)
+        self.assertContains(response, "<strong>2</strong> produit(s)")
+
+    def test_apply_is_one_update_and_one_bump(self):
+        version = get_data_version()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(
+                "/products/thresholds/", {"famille": self.cible.id, "nbr_qnt_alert": 7}, secure=True,
+            )
+        self.assertEqual(response.status_code, 302)
+        updates = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith('UPDATE "core_produit"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(get_data_version(), version + 1)
+        self.assertEqual(
+            dict(Produit.objects.values_list("reference", "nbr_qnt_alert")),
+            {"A-1": 7, "A-2": 7, "B-1": Produit._meta.get_field("nbr_qnt_alert").default},
+        )
+
+    def test_requires_a_threshold(self):
+        response = self.client.post("/products/thresholds/", {"famille": self.cible.id}, secure=True)
+        self.assertContains(response, "Indiquez au moins un seuil a modifier.")
+
+
+class RecallTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.produit = make_produit()
+        self.court = Lot.objects.create(
+            produit=self.produit, quantite=3, date_entree=self.today, date_fin=self.today + timedelta(days=10),
+        )
+        self.long = Lot.objects.create(
+            produit=self.produit, quantite=10, date_entree=self.today, date_fin=self.today + timedelta(days=20),
+        )
+        allocate_exit(self.produit, 5, self.court.site_id, self.today)
+
+    def test_exit_records_one_allocation_per_lot(self):
+        self.assertEqual(
+            sorted(SortieLot.objects.values_list("lot_id", "quantite", "date_fin")),
+            sorted([(self.court.id, 3, self.court.date_fin), (self.long.id, 2, self.long.date_fin)]),
+        )
+
+    def test_recall_by_lot_survives_lot_deletion(self):
+        sortie_id, lot_id = Sort.objects.get().id, self.court.id
+        self.court.delete()
+        response = self.client.get("/recall/", {"lot": lot_id, "export": "csv"}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[1:], [
+            f"{self.today.isoformat()};{sortie_id};{lot_id};REF-1;{self.court.date_fin.isoformat()};3",
+        ])
+
+    def test_recall_by_code_filters_on_expiry_window(self):
+        response = self.client.get(
+            "/recall/", {"code": "BC-REF-1", "du": (self.today + timedelta(days=15)).isoformat()}, secure=True,
+        )
+        self.assertEqual(response.context["totals"]["nb_lots"], 1)
+        self.assertEqual([row["lot_id"] for row in response.context["rows"]], [self.long.id])
+
+
+class ExpiryHorizonTests(TestCase):
+    def setUp(self):
+        # Un lundi : les semaines commencent aujourd'hui.
+        self.today = timezone.now().date() - timedelta(days=timezone.now().date().weekday())
+        self.a = Famille.objects.create(nom="A")
+        self.b = Famille.objects.create(nom="B")
+        produit_a, produit_b = make_produit("A-1", self.a), make_produit("B-1", self.b)
+        for produit, quantite, jours in [
+            (produit_a, 4, -1), (produit_a, 5, 2), (produit_a, 2, 8), (produit_a, 0, 1),
+            (produit_b, 3, 9), (produit_b, 7, 30),
+        ]:
+            Lot.objects.create(
+                produit=produit, quantite=quantite, quantite_initiale=max(quantite, 1),
+                date_entree=self.today - timedelta(days=60), date_fin=self.today + timedelta(days=jours),
+            )
+
+    def test_weekly_buckets_skip_empty_and_far_lots(self):
+        horizon = expiry_horizon("week", 2, by_famille=True, today=self.today)
+        self.assertEqual(horizon["expire"], {"quantite": 4, "nb_lots": 1})
+        self.assertEqual(
+            [(p["debut"], p["quantite"], p["nb_lots"]) for p in horizon["periodes"]],
+            [(self.today.isoformat(), 5, 1), ((self.today + timedelta(days=7)).isoformat(), 5, 2)],
+        )
+        self.assertEqual(horizon["periodes"][1]["familles"], {str(self.a.id): 2, str(self.b.id): 3})
+        self.assertEqual(
+            [(f["nom"], f["quantite"]) for f in horizon["familles"]], [("A", 7), ("B", 3)],
+        )
+
+    def test_famille_filter(self):
+        horizon = expiry_horizon("month", 3, famille_id=self.b.id, today=self.today)
+        self.assertEqual(horizon["expire"]["nb_lots"], 0)
+        self.assertEqual(sum(p["quantite"] for p in horizon["periodes"]), 10)
+
+    def test_endpoint_rejects_invalid_params(self):
+        for params in [{"by": "day"}, {"periods": "abc"}, {"famille": "x"}]:
+            response = self.client.get("/expiry/horizon/", params, secure=True)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn("error", response.json())
+
+    def test_endpoint_returns_requested_periods(self):
+        response = self.client.get("/expiry/horizon/", {"by": "month", "periods": 4}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["periodes"]), 4)
+
+
+class DashboardCountersTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        famille = Famille.objects.get_or_create(nom="Tests")[0]
+        Produit.objects.bulk_create(
+            Produit(reference=f"R-{i:02}", barcode=f"BC-R-{i:02}", nom=f"R-{i:02}", famille=famille,
+                    nbr_qnt_alert=5, nbr_days_alert=5)
+            for i in range(1, 13)
+        )
+        for reference, quantite, jours in [("LOW", 3, 60), ("EXP", 10, 0), ("OK", 100, 60)]:
+            produit = make_produit(reference, famille)
+            Produit.objects.filter(pk=produit.pk).update(nbr_qnt_alert=5, nbr_days_alert=5)
+            Lot.objects.create(
+                produit=produit, quantite=quantite, date_entree=self.today,
+                date_fin=self.today + timedelta(days=jours),
+            )
+        expiry.refresh_day(force=True)
+        bump_data_version()
+
+    def tearDown(self):
+        expiry._state.update(today=None, oldest=None)
+
+    def test_counters(self):
+        self.assertEqual(
+            status_counters(), {"total": 15, "stock": 13, "expiry": 1, "critical": 13, "alerts": 14},
+        )
+
+    def test_counters_follow_data_version(self):
+        status_counters()
+        Lot.objects.create(
+            produit=Produit.objects.get(reference="R-01"), quantite=50, date_entree=self.today,
+            date_fin=self.today + timedelta(days=60),
+        )
+        self.assertEqual(status_counters()["stock"], 13)
+        bump_data_version()
+        self.assertEqual(status_counters()["stock"], 12)
+
+    def test_critical_pages_put_ruptures_first(self):
+        page, has_more = critical_products(limit=10)
+        self.assertTrue(has_more)
+        self.assertEqual([p.reference for p in page], [f"R-{i:02}" for i in range(1, 11)])
+        page, has_more = critical_products(offset=10, limit=10)
+        self.assertFalse(has_more)
+        self.assertEqual([p.reference for p in page], ["R-11", "R-12", "EXP"])
+
+    def test_critical_endpoint_returns_next_offset(self):
+        first = self.client.get("/dashboard/critical/", secure=True).json()
+        self.assertEqual(first["next"], 10)
+        self.assertIn("R-10", first["html"])
+        second = self.client.get("/dashboard/critical/", {"offset": first["next"]}, secure=True).json()
+        self.assertIsNone(second["next"])
+        self.assertIn("EXP", second["html"])
+        self.assertNotIn("R-10", second["html"])
+
+
+class AsyncReadViewsTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.rupture = make_produit("ASYNC-1")
+        self.proche = make_produit("ASYNC-2")
+        Produit.objects.filter(pk=self.proche.pk).update(nbr_qnt_alert=0, nbr_days_alert=5)
+        Lot.objects.create(
+            produit=self.proche, quantite=4, date_entree=self.today, date_fin=self.today + timedelta(days=2),
+        )
+        expiry.refresh_day(force=True)
+        bump_data_version(catalog=True)
+
+    def tearDown(self):
+        expiry._state.update(today=None, oldest=None)
+
+    def test_read_views_are_coroutines(self):
+        for view in (views.dashboard, views.products, views.lots, views.alerts):
+            self.assertTrue(asyncio.iscoroutinefunction(view), view.__name__)
+
+    async def test_pages_render_under_asgi(self):
+        client = AsyncClient()
+        for url, expected in [
+            ("/dashboard/", ["ASYNC-1"]),
+            ("/products/", ["ASYNC-1", "ASYNC-2"]),
+            ("/alerts/", ["ASYNC-1", "ASYNC-2"]),
+            ("/lots/", ["ASYNC-2"]),
+        ]:
+            response = await client.get(url, secure=True)
+            self.assertEqual(response.status_code, 200, url)
+            if response.streaming:
+                body = b"".join([chunk async for chunk in response.streaming_content]).decode()
+            else:
+                body = response.content.decode()
+            for text in expected:
+                self.assertIn(text, body, url)
+
+    async def test_lot_post_goes_through_the_sync_form(self):
+        response = await AsyncClient().post("/lots/", {
+            "produit": self.rupture.id,
+            "site": await sync_to_async(default_site_id)(),
+            "date_entree": self.today.isoformat(),
+            "date_fin": (self.today + timedelta(days=90)).isoformat(),
+            "quantite": 12,
+        }, secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(await Lot.objects.filter(produit=self.rupture).aaggregate(total=Sum("quantite")), {"total": 12})
+
+
+class BenchStationsTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.produit = make_produit()
+        self.lot = Lot.objects.create(
+            produit=self.produit, quantite=10, date_entree=self.today, date_fin=self.today + timedelta(days=30),
+        )
+        self.command = bench_stations.Command(stdout=io.StringIO())
+
+    def test_summary_percentiles(self):
+        summary = summarize([float(ms) for ms in range(100, 0, -1)])
+        self.assertEqual(summary["count"], 100)
+        self.assertAlmostEqual(summary["mean"], 50.5)
+        self.assertAlmostEqual(summary["p50"], 50.5)
+        self.assertAlmostEqual(summary["p95"], 95.05)
+        self.assertAlmostEqual(summary["p99"], 99.01)
+        self.assertEqual(summary["max"], 100.0)
+        self.assertEqual(summarize([])["p99"], 0.0)
+
+    def test_consistency_check_after_exits(self):
+        baseline = self.command._baseline([self.produit.id])
+        allocate_exit(self.produit, 4, self.lot.site_id, self.today)
+        self.command._check_consistency([self.produit.id], baseline)
+        self.assertIn("stock consistent: 1 exit(s), 4 unit(s)", self.command.stdout.getvalue())
+
+    def test_consistency_check_flags_lost_stock(self):
+        baseline = self.command._baseline([self.produit.id])
+        allocate_exit(self.produit, 4, self.lot.site_id, self.today)
+        Lot.objects.filter(pk=self.lot.pk).update(quantite=F("quantite") - 1)
+        with self.assertRaisesMessage(CommandError, "Stock inconsistent after 1 exit(s)."):
+            self.command._check_consistency([self.produit.id], baseline)
+
+    def test_csrf_token_is_read_from_movements_page(self):
+        response = self.client.get("/movements/", secure=True)
+        self.assertIsNotNone(bench_stations.CSRF_INPUT.search(response.content.decode()))
+
+    def test_requires_stock(self):
+        Lot.objects.update(quantite=0)
+        with self.assertRaisesMessage(CommandError, "No product with valid stock"):
+            self.command._pick_products(5, 50)
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        self.produits = [make_produit(f"API-{i}") for i in range(5)]
+        Lot.objects.create(
+            produit=self.produits[0], quantite=7, date_entree=today, date_fin=today + timedelta(days=30),
+        )
+
+    @override_settings(API_TOKEN="s3cret")
+    def test_token_is_required_when_set(self):
+        self.assertEqual(self.client.get("/api/produits/", secure=True).status_code, 403)
+        self.assertEqual(
+            self.client.get("/api/produits/", secure=True, HTTP_AUTHORIZATION="Bearer autre").status_code, 403,
+        )
+        response = self.client.get("/api/produits/", secure=True, HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get("/api/", secure=True).status_code, 403)
+
+    def test_cursor_pages_cover_every_row_once(self):
+        ids, url, pages = [], "/api/produits/?limit=2&fields=id", 0
+        while url:
+            body = self.client.get(url, secure=True).json()
+            ids += [row["id"] for row in body["results"]]
+            url, pages = body["next"], pages + 1
+        self.assertEqual(ids, sorted(p.id for p in self.produits))
+        self.assertEqual(pages, 3)
+
+    def test_fields_selection(self):
+        body = self.client.get("/api/produits/", {"fields": "reference,stock", "limit": 1}, secure=True).json()
+        self.assertEqual(body["results"], [{"reference": "API-0", "stock": 7}])
+        response = self.client.get("/api/produits/", {"fields": "reference,prix"}, secure=True)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("prix", response.json()["error"])
+
+    def test_invalid_params(self):
+        for url, params in [
+            ("/api/produits/", {"limit": 0}),
+            ("/api/produits/", {"cursor": "!!"}),
+            ("/api/produits/", {"site": 1}),
+            ("/api/lots/", {"expire_after": "demain"}),
+            ("/api/sorties/", {"updated_since": "hier"}),
+        ]:
+            response = self.client.get(url, params, secure=True)
+            self.assertEqual(response.status_code, 400, params)
+
+    def test_etag_round_trip(self):
+        for encoding in ("", "gzip"):
+            response = self.client.get("/api/lots/", secure=True, HTTP_ACCEPT_ENCODING=encoding)
+            self.assertEqual(response.status_code, 200)
+            again = self.client.get(
+                "/api/lots/", secure=True, HTTP_ACCEPT_ENCODING=encoding, HTTP_IF_NONE_MATCH=response["ETag"],
+            )
+            self.assertEqual(again.status_code, 304, encoding)
+        Lot.objects.update(quantite=6)
+        changed = self.client.get("/api/lots/", secure=True, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(changed.status_code, 200)
+
+
+class StockCheckpointTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.produit = make_produit()
+        self.lot = Lot.objects.create(
+            produit=self.produit, quantite=50, date_entree=self.today - timedelta(days=3),
+            date_fin=self.today + timedelta(days=90),
+        )
+
+    def _exit(self, quantite):
+        Sort.objects.create(produit=self.produit, quantite=quantite)
+        self.lot.quantite -= quantite
+        self.lot.save()
+
+    def test_checkpoint_refuses_unfinished_day(self):
+        with self.assertRaises(ValueError):
+            write_checkpoint(self.today)
+
+    def test_exit_after_checkpoint_counts_today(self):
+        write_checkpoint()
+        self._exit(10)
+        self.assertEqual(stock_at(self.today, self.produit.id), 40)
+        self.assertEqual(stock_at(self.today - timedelta(days=1), self.produit.id), 50)
+
+    def test_purge_and_archive_keep_past_stock(self):
+        expire = Lot.objects.create(
+            produit=self.produit, quantite=7, date_entree=self.today - timedelta(days=5),
+            date_fin=self.today - timedelta(days=2),
+        )
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(stock_at(yesterday, self.produit.id), 57)
+        purge_expired_lots(lot_ids=[expire.id], archive=False)
+        self.assertEqual(stock_at(yesterday, self.produit.id), 57)
+        self.assertEqual(stock_at(self.today - timedelta(days=6), self.produit.id), 0)
+        self.assertEqual(stock_at(self.today, self.produit.id), 50)
+
+        expire = Lot.objects.create(
+            produit=self.produit, quantite=3, date_entree=self.today - timedelta(days=200),
+            date_fin=self.today - timedelta(days=100),
+        )
+        # Le lot purge plus haut etait encore en stock hier.
+        self.assertEqual(stock_at(yesterday, self.produit.id), 60)
+        archive_lots()
+        self.assertFalse(Lot.objects.filter(id=expire.id).exists())
+        self.assertEqual(stock_at(yesterday, self.produit.id), 60)
+        self.assertEqual(stock_at(self.today, self.produit.id), 50)
+
+    def test_inventory_adjustment_keeps_past_stock(self):
+        write_checkpoint()
+        session = InventaireSession.objects.create(nom="Inventaire")
+        add_counts(session, [{"ligne": 1, "code": self.produit.reference, "quantite": 42, "lot_id": ""}])
+        apply_session(session)
+        self.assertEqual(stock_at(self.today, self.produit.id), 42)
+        self.assertEqual(stock_at(self.today - timedelta(days=1), self.produit.id), 50)
+        self.assertEqual(stock_at(self.today - timedelta(days=2), self.produit.id), 50)
+
+    def test_checkpoint_of_today_is_not_an_anchor(self):
+        # Checkpoint ecrit en cours de journee par une version precedente.
+        StockCheckpointJour.objects.create(jour=self.today, nb_produits=1)
+        StockCheckpoint.objects.create(jour=self.today, produit=self.produit, quantite=50)
+        self._exit(10)
+        self.assertEqual(stock_at(self.today, self.produit.id), 40)
+
+
+class DigestWatermarkTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.produit = make_produit()
+        self.produit.nbr_qnt_alert = 5
+        self.produit.save()
+        self.lot = Lot.objects.create(
+            produit=self.produit, quantite=10, date_entree=self.today - timedelta(days=3),
+            date_fin=self.today + timedelta(days=200),
+        )
+        collect_alerts(today=self.today)
+
+    def stock_alerts(self):
+        _, rows = collect_alerts(today=self.today)
+        return [(row.produit_id, row.niveau) for row in rows if row.type == AlerteOutbox.TYPE_STOCK]
+
+    def test_threshold_edit_is_picked_up(self):
+        Produit.objects.filter(pk=self.produit.pk).update(nbr_qnt_alert=20, modifie_le=timezone.now())
+        self.assertEqual(self.stock_alerts(), [(self.produit.id, "near")])
+
+    def test_purge_is_picked_up(self):
+        Lot.objects.filter(pk=self.lot.pk).update(date_fin=self.today - timedelta(days=1))
+        purge_expired_lots(archive=False, today=self.today)
+        self.assertEqual(self.stock_alerts(), [(self.produit.id, "danger")])
+
+    def test_late_commit_inside_overlap_is_picked_up(self):
+        # Lot modifie avant le debut du passage precedent, valide apres.
+        started = AlerteDigest.objects.get().demarre_le
+        Lot.objects.filter(pk=self.lot.pk).update(quantite=0, modifie_le=started - timedelta(minutes=1))
+        self.assertEqual(self.stock_alerts(), [(self.produit.id, "danger")])
+        self.assertEqual(self.stock_alerts(), [])
+
+
+class WriteTransactionTests(TransactionTestCase):
+    def test_only_read_then_write_transactions_begin_immediate(self):
+        produit = make_produit()
+        lot = Lot.objects.create(
+            produit=produit, quantite=5, date_entree=timezone.now().date(),
+            date_fin=timezone.now().date() + timedelta(days=30),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            allocate_exit(produit, 2, lot.site_id, timezone.now().date())
+        self.assertEqual(queries.captured_queries[0]["sql"], "BEGIN IMMEDIATE")
+
+        with CaptureQueriesContext(connection) as queries:
+            with transaction.atomic():
+                Produit.objects.count()
+        self.assertEqual(queries.captured_queries[0]["sql"], "BEGIN")
+
+
+class ConsumptionFamilleTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.avant = Famille.objects.create(nom="Avant")
+        self.apres = Famille.objects.create(nom="Apres")
+        self.produit = make_produit(famille=self.avant)
+        self.lot = Lot.objects.create(
+            produit=self.produit, quantite=100, date_entree=self.today, date_fin=self.today + timedelta(days=90),
+        )
+        allocate_exit(self.produit, 5, self.lot.site_id, self.today)
+        self.produit.famille = self.apres
+        self.produit.save()
+        allocate_exit(self.produit, 3, self.lot.site_id, self.today)
+
+    def rollup(self):
+        return sorted(
+            ConsommationJournaliere.objects.values_list("produit_id", "famille__nom", "jour", "quantite", "nb_sorties")
+        )
+
+    def test_incremental_and_rebuilt_totals_match(self):
+        incremental = self.rollup()
+        self.assertEqual(
+            incremental,
+            [(self.produit.id, "Apres", self.today, 3, 1), (self.produit.id, "Avant", self.today, 5, 1)],
+        )
+        rebuild_consumption()
+        self.assertEqual(self.rollup(), incremental)
+
+    def test_deleted_famille_is_merged(self):
+        reassign_famille(self.apres.id, self.avant.id)
+        self.assertEqual(self.rollup(), [(self.produit.id, "Avant", self.today, 8, 2)])
+        rebuild_consumption()
+        self.assertEqual(self.rollup(), [(self.produit.id, "Avant", self.today, 8, 2)])
+
+
+class DefaultSiteTests(TestCase):
+    def test_default_site_comes_from_migration_and_is_read_once(self):
+        site_id = default_site_id()
+        self.assertEqual(Site.objects.get(pk=site_id).nom, DEFAULT_SITE_NOM)
+        # Valeur par defaut des champs site : ni requete ni ecriture par instance.
+        with self.assertNumQueries(0):
+            self.assertEqual(Lot().site_id, site_id)
+            self.assertEqual(Sort().site_id, site_id)
+
+
+class ExpiryFreshnessTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.produit = make_produit()
+        self.produit.nbr_days_alert = 5
+        self.produit.save()
+        for days in (-1, 0, 3, 30):
+            Lot.objects.create(
+                produit=self.produit, quantite=1, date_entree=self.today - timedelta(days=10),
+                date_fin=self.today + timedelta(days=days),
+            )
+        # Table calculee il y a trois jours, recalcul du jour pas encore passe.
+        expiry.refresh_expiry(today=self.today - timedelta(days=3))
+        expiry._state.update(today=None, oldest=None)
+
+    def tearDown(self):
+        expiry._state.update(today=None, oldest=None)
+
+    def test_stale_table_is_classified_live_without_rebuild(self):
+        rows = sorted(
+            expiry.current_expirations()
+            .values_list("date_fin", "bucket_jour", "days_left_jour")
+        )
+        self.assertEqual(
+            [(bucket, days_left) for _, bucket, days_left in rows],
+            [("expire", -1), ("aujourdhui", 0), ("proche", 3), ("ok", 30)],
+        )
+        response = self.client.get("/products/", secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(LotExpiration.objects.values_list("jour", flat=True)), {self.today - timedelta(days=3)})
+        produit = with_stock_status(Produit.objects.filter(id=self.produit.id)).get()
+        self.assertEqual((produit.next_bucket, produit.next_days_left), ("expire", -1))
+
+    def test_refresh_day_runs_once(self):
+        self.assertEqual(expiry.refresh_day(), 4)
+        self.assertIsNone(expiry.refresh_day())
+        self.assertEqual(expiry.refresh_day(force=True), 4)
+        self.assertIsNone(expiry.expiry_state())
+        self.assertEqual(set(LotExpiration.objects.values_list("jour", flat=True)), {self.today})
+
+
+class FefoPreviewTests(TestCase):
+    def test_request_without_session(self):
+        # Comme bench_fefo_preview : RequestFactory, sans middleware de session.
+        today = timezone.now().date()
+        produit = make_produit()
+        Lot.objects.create(produit=produit, quantite=5, date_entree=today, date_fin=today + timedelta(days=30))
+        request = RequestFactory().get("/movements/fefo/", {"code": produit.reference, "quantite": 1})
+        response = fefo_preview(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)["found"])
+
+
+class InventaireLotSnapshotTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        self.produit = make_produit()
+        self.lot = Lot.objects.create(
+            produit=self.produit, quantite=10, date_entree=today, date_fin=today + timedelta(days=30),
+        )
+        self.autre = Lot.objects.create(
+            produit=self.produit, quantite=20, date_entree=today, date_fin=today + timedelta(days=60),
+        )
+        self.session = InventaireSession.objects.create(nom="Inventaire")
+
+    def count_lot(self, quantite):
+        lines = [{"ligne": 1, "code": self.produit.reference, "quantite": quantite, "lot_id": self.lot.id}]
+        self.assertEqual(add_counts(self.session, lines), (1, []))
+
+    def test_count_of_deleted_lot_is_rejected(self):
+        self.count_lot(4)
+        lot_id, date_fin = self.lot.id, self.lot.date_fin
+        self.lot.delete()
+        comptage = InventaireComptage.objects.get(session=self.session)
+        self.assertEqual((comptage.lot_id, comptage.lot_numero, comptage.lot_date_fin), (None, lot_id, date_fin))
+        response = self.client.get(f"/inventaires/{self.session.id}/", secure=True)
+        self.assertEqual(response.status_code, 200)
+
+        summary = apply_session(self.session)
+        self.assertEqual((summary["lots_modifies"], summary["ecarts"]), (0, 0))
+        self.assertEqual(summary["non_appliques"], [f"REF-1 (lot {lot_id} archive ou supprime)"])
+        self.autre.refresh_from_db()
+        self.assertEqual(self.autre.quantite, 20)
+
+    def test_adjustment_survives_lot_deletion(self):
+        self.count_lot(4)
+        apply_session(self.session)
+        lot_id = self.lot.id
+        self.lot.delete()
+        ajustement = InventaireAjustement.objects.get(session=self.session)
+        self.assertEqual(
+            (ajustement.lot_id, ajustement.produit_id, ajustement.lot_numero, ajustement.quantite_apres),
+            (None, self.produit.id, lot_id, 4),
+        )
+
+
+class LotsDeliveryJsonTests(TestCase):
+    def post(self, payload):
+        return self.client.post("/lots/delivery/", payload, content_type="application/json", secure=True)
+
+    def test_malformed_payloads_return_400(self):
+        make_produit("REF-1")
+        for payload in (
+            {"lignes": "abc"},
+            {"lignes": [1]},
+            {"lignes": [{"code": 123, "quantite": 2, "date_fin": "2030-01-01"}]},
+            {"lignes": [{"code": "REF-1", "quantite": 2, "date_fin": 20300101}]},
+        ):
+            with self.subTest(payload=payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(response.json()["errors"])
+        self.assertFalse(Lot.objects.exists())
+
+    def test_valid_payload(self):
+        make_produit("REF-1")
+        response = self.post({"lignes": [{"code": "ref-1", "quantite": 2, "date_fin": "2030-01-01"}]})
+        self.assertEqual(response.json(), {"created": 1, "errors": []})
+
+
+class StaleCodeIndexTests(TestCase):
+    def test_product_created_by_another_worker_is_found(self):
+        # Index construit avant la creation, sans montee de version dans ce
+        # processus : comme un produit cree par un autre worker.
+        get_code_index()
+        produit = make_produit("NEW-1")
+        self.assertEqual(lookup_code("new-1").id, produit.id)
+        response = self.client.get("/movements/fefo/", {"code": "NEW-1"}, secure=True)
+        self.assertTrue(response.json()["found"])
+        response = self.client.get("/movements/suggest/", {"code": "NEW-1"}, secure=True)
+        self.assertTrue(response.json()["found"])
+
+
+class CodeIndexVersionTests(TestCase):
+    def setUp(self):
+        self.today = timezone.now().date()
+        self.produit = make_produit("REF-1")
+
+    def test_exit_then_lookup_keeps_index(self):
+        Lot.objects.create(produit=self.produit, quantite=5, date_entree=self.today, date_fin=self.today + timedelta(days=30))
+        index = get_code_index()
+        self.assertIsNotNone(allocate_exit(self.produit, 2, default_site_id(), self.today))
+        self.assertIs(get_code_index(), index)
+        self.assertEqual(lookup_code("ref-1").id, self.produit.id)
+
+    def test_rename_then_lookup(self):
+        get_code_index()
+        response = self.client.post(
+            f"/products/{self.produit.id}/edit/",
+            {
+                "nom": "Renomme", "reference": "REF-2", "famille": self.produit.famille_id,
+                "barcode": "BC-NEW", "nbr_qnt_alert": 0, "nbr_days_alert": 0,
+            },
+            secure=True,
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNone(lookup_code("REF-1"))
+        self.assertIsNone(lookup_code("BC-REF-1"))
+        self.assertIsNone(resolve_produit("REF-1"))
+        self.assertEqual(get_code_index()["ref-2"].nom, "Renomme")
+        self.assertEqual(resolve_produit("bc-new").id, self.produit.id)
+
+
+class AlertsPurgeTests(TestCase):
+    def setUp(self):
+        self.lot = Lot.objects.create(
+            produit=make_produit(), quantite=5, date_entree=timezone.now().date() - timedelta(days=30),
+            date_fin=timezone.now().date() - timedelta(days=1),
+        )
+
+    def test_invalid_ids_are_rejected(self):
+        response = self.client.post(
+            "/alerts/", {"action": "purge_expired", "scope": "famille", "famille_id": "abc"}, secure=True
+        )
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post("/alerts/", {"action": "delete_expired_lot", "lot_id": "abc"}, secure=True)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Lot.objects.filter(pk=self.lot.pk).exists())
+
+    def test_purge_by_famille(self):
+        response = self.client.post(
+            "/alerts/",
+            {"action": "purge_expired", "scope": "famille", "famille_id": str(self.lot.produit.famille_id)},
+            secure=True,
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Lot.objects.filter(pk=self.lot.pk).exists())
+
+
+class CodeSuggestionTests(TestCase):
+    def setUp(self):
+        self.produit = make_produit("REF-100")
+        Lot.objects.create(
+            produit=self.produit, quantite=5, date_entree=timezone.now().date(),
+            date_fin=timezone.now().date() + timedelta(days=30),
+        )
+        bump_data_version(catalog=True)
+
+    def test_suggest_endpoint(self):
+        response = self.client.get("/movements/suggest/", {"code": "REF-10O"}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertFalse(data["found"])
+        self.assertEqual([s["reference"] for s in data["suggestions"]], ["REF-100"])
+        self.assertEqual(data["suggestions"][0]["distance"], 1)
+
+        data = self.client.get("/movements/suggest/", {"code": "bc-ref-100"}, secure=True).json()
+        self.assertTrue(data["found"])
+        self.assertEqual(data["suggestions"], [])
+        response = self.client.get("/movements/suggest/", secure=True)
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_code_on_exit_lists_close_codes(self):
+        response = self.client.post(
+            "/movements/", {"code": "REF-01", "quantite": 1}, secure=True, follow=True,
+        )
+        self.assertIn(
+            "Produit non disponible. Codes proches : REF-100 (BC-REF-100).",
+            [str(message) for message in response.context["messages"]],
+        )
+        self.assertEqual(Lot.objects.get().quantite, 5)
+
+    def test_long_code_is_not_lost_among_short_matches(self):
+        # 257 trigrammes partages : un compteur sur 8 bits repasserait a 1,
+        # sous les 36 fragments courts qui en partagent chacun 5.
+        rng = random.Random(0)
+        long = ""
+        while len(_grams(long)) < 257:
+            long += rng.choice("abcdefghijklmnopqrstuvwxyz0123456789")
+        index = FuzzyIndex([long] + [long[i:i + 7] for i in range(0, 252, 7)])
+        self.assertIn(long, index.candidates(long))
+
+
+class StreamingMemoryTests(TestCase):
+    # Pic de memoire Python pendant le streaming des tableaux products et
+    # alerts : borne fixe, la meme pour 1 000 et 5 000 produits (ni les lignes
+    # ni le HTML complet ne sont gardes). Environ 5 Mo mesures, pour 1,6 puis
+    # 8 Mo de HTML.
+    PEAK_BOUND = 8 * 1024 * 1024
+    PEAK_GROWTH = 1024 * 1024
+
+    def seed(self, start, end):
+        famille = Famille.objects.get_or_create(nom="Tests")[0]
+        Produit.objects.bulk_create(
+            [
+                Produit(reference=f"MEM-{i:06d}", barcode=f"MEMBC-{i:06d}", nom=f"Produit {i}", famille=famille)
+                for i in range(start, end)
+            ],
+            batch_size=2000,
+        )
+
+    async def stream_peak(self, path):
+        tracemalloc.start()
+        try:
+            response = await AsyncClient().get(path, secure=True)
+            size = 0
+            async for chunk in response.streaming_content:
+                size += len(chunk)
+            return tracemalloc.get_traced_memory()[1], size
+        finally:
+            tracemalloc.stop()
+
+    async def assert_peak_is_bounded(self, path):
+        await sync_to_async(self.seed)(0, 1000)
+        await self.stream_peak(path)  # gabarits compiles, caches remplis
+        small_peak, small_size = await self.stream_peak(path)
+        await sync_to_async(self.seed)(1000, 5000)
+        large_peak, large_size = await self.stream_peak(path)
+
+        self.assertGreater(large_size, 4 * small_size)
+        self.assertLess(small_peak, self.PEAK_BOUND)
+        self.assertLess(large_peak, self.PEAK_BOUND)
+        self.assertLess(large_peak - small_peak, self.PEAK_GROWTH)
+
+    async def test_products_stream_peak_memory_is_bounded(self):
+        await self.assert_peak_is_bounded("/products/")
+
+    async def test_alerts_stream_peak_memory_is_bounded(self):
+        # Produits sans lot : une alerte rupture par produit.
+        await self.assert_peak_is_bounded("/alerts/")
+
+
+class ConsommationFiltersTests(TestCase):
+    def test_invalid_famille_is_ignored(self):
+        response = self.client.get("/consommation/", {"famille": "abc", "group": "famille"}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["famille_filter"], "")
+
+
+class ReordersFiltersTests(TestCase):
+    def test_invalid_famille_is_ignored(self):
+        make_produit()
+        response = self.client.get("/reorders/", {"famille": "abc"}, secure=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["famille_filter"], "")
+        response = self.client.get("/reorders/", {"famille": "abc", "export": "csv"}, secure=True)
+        self.assertEqual(response.status_code, 200)
@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+# Transactions qui lisent avant d'ecrire (sortie FEFO, inventaire, purge,
+# recalcul du jour, digest).
+#
+# Sous SQLite, select_for_update est ignore, et une transaction DEFERRED qui a
+# lu puis veut ecrire echoue aussitot en "database is locked" si un autre
+# processus a ecrit entre-temps. Ces transactions commencent donc par BEGIN
+# IMMEDIATE : le verrou d'ecriture est pris avant la premiere lecture, avec
+# l'attente du timeout. Les autres transactions restent DEFERRED : tant
+# qu'elles lisent, elles ne bloquent pas les ecritures. Sous PostgreSQL,
+# c'est un atomic() ordinaire et select_for_update verrouille les lignes.
+
+
+@contextmanager
+def write_atomic(using=None):
+    """transaction.atomic() qui prend le verrou d'ecriture SQLite des le BEGIN.
+
+    Sans effet dans un bloc atomic() deja ouvert (le BEGIN a eu lieu).
+    """
+    connection = transaction.get_connection(using)
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    connection.ensure_connection()
+    previous = connection.transaction_mode
+    connection.transaction_mode = "IMMEDIATE"
+    try:
+        with transaction.atomic(using=using):
+            connection.transaction_mode = previous
+            yield
+    finally:
+        connection.transaction_mode = previous
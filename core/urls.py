@@ -7,12 +7,31 @@ urlpatterns = [
 
     path('dashboard/',dashboard ,name='dashboard'),
     path('updates/stream/', updates_stream, name='updates_stream'),
+    path('metrics/', metrics, name='metrics'),
+    path('api/', api_index, name='api_index'),
+    path('api/produits/', api_list, {'resource': 'produits'}, name='api_produits'),
+    path('api/lots/', api_list, {'resource': 'lots'}, name='api_lots'),
+    path('api/sorties/', api_list, {'resource': 'sorties'}, name='api_sorties'),
+    path('api/familles/', api_list, {'resource': 'familles'}, name='api_familles'),
     path('products/',products ,name='products'),
     path('products/<int:product_id>/edit/', product_edit, name='product_edit'),
+    path('products/thresholds/', product_thresholds, name='product_thresholds'),
     path('lots/',lots ,name='lots'),
+    path('lots/delivery/', lots_delivery, name='lots_delivery'),
     path('movements/',movements ,name='movements'),
+    path('movements/fefo/', fefo_preview, name='fefo_preview'),
+    path('movements/suggest/', code_suggestions, name='code_suggestions'),
     path('alerts/',alerts ,name='alerts'),
+    path('stock/at/', stock_at_date, name='stock_at_date'),
+    path('dashboard/critical/', dashboard_critical, name='dashboard_critical'),
+    path('expiry/horizon/', expiry_horizon_data, name='expiry_horizon'),
+    path('recall/', recall, name='recall'),
     path('historique/',historique ,name='historique'),
+    path('consommation/', consommation, name='consommation'),
+    path('reorders/', reorders, name='reorders'),
+    path('inventaires/', inventaires, name='inventaires'),
+    path('inventaires/<int:session_id>/', inventaire_detail, name='inventaire_detail'),
     path('famille/',famille ,name='famille'),
+    path('sites/', sites, name='sites'),
 
 ]
@@ -1,128 +1,279 @@
+import asyncio
+import csv
+import json
 import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib import messages
-from django.core.cache import cache
-from django.db import transaction
-from django.db.models import Q
-from django.http import StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import conditional_page, require_safe
 from datetime import date
 
 # Create your views here.
-from django.db.models import Sum
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Lower, TruncMonth
+
+from .api import RESOURCES, api_page, resource_filters
+from .archive import purge_expired_lots
+from .bulk_delete import delete_famille, delete_produits
+from .data_version import aget_data_version, bump_data_version, get_data_version
+from .deliveries import build_delivery, create_delivery, parse_delivery_text
+from .horizon import GRANULARITIES, cached_expiry_horizon
+from .metrics import render_metrics, stream_closed, stream_opened
+from .inventory import add_counts, apply_session, parse_count_text, reconciliation
+from .expiry import aexpiry_state, classify, current_expirations, refresh_expiry
+from .fefo import allocate_exit, available_lots
+from .fuzzy import DEFAULT_SUGGESTIONS, MAX_SUGGESTIONS, suggest_codes
+from .forms import BulkThresholdForm, DeliveryForm, ProductForm, FamilleForm, LotForm, MovementForm, SiteForm
+from .models import (
+    AlerteOutbox, ConsommationJournaliere, Famille, InventaireSession, Produit, Lot, LotArchive, LotExpiration,
+    Site, Sort, SortieLot, default_site_id,
+)
+from .reorders import DEFAULT_LEAD_TIME_DAYS, DEFAULT_WINDOW_DAYS, group_by_famille, suggest_reorders
+from .rollup import reassign_famille
+from .resolver import lookup_code, resolve_produit
+from .rows import ALERT_EXPIRATION_FIELDS, ALERT_PRODUCT_FIELDS, PRODUCT_FIELDS, AlertRow, ProductRow
+from .snapshots import record_lot_removal, stock_at
+from .stock_status import (
+    DANGER_BUCKETS, acritical_products, astatus_counters, carried_at, critical_products,
+    product_state, site_summaries, stock_state, with_stock_status,
+)
+from .streaming import amerge, astream_page, avalues_list
+from .transactions import write_atomic
+
+
+FEFO_PREVIEW_MAX_LOTS = 3
+
+
+DASHBOARD_CRITICAL_PAGE = 10
+
+DIGEST_PAGE = 50
+
+
+# -------------------------
+# Vues de lecture async (dashboard, products, lots, alerts)
+# -------------------------
+# Les requetes independantes passent par l'ORM async et sont lancees
+# ensemble avec asyncio.gather. Les POST (formulaires, transactions) et le
+# rendu des templates restent synchrones : messages, session et champs de
+# formulaire lisent la base a l'affichage.
+
+async def _alist(queryset, chunk_size=2000):
+    return [obj async for obj in queryset.aiterator(chunk_size=chunk_size)]
+
+
+_arender = sync_to_async(render)
+
+
+async def dashboard(request):
+    active_page = "dashboard"
+    await aexpiry_state()
+
+    horizon_by = request.GET.get("horizon")
+    if horizon_by not in GRANULARITIES:
+        horizon_by = "week"
+    counters, (critical, has_more), horizon = await asyncio.gather(
+        astatus_counters(),
+        acritical_products(limit=DASHBOARD_CRITICAL_PAGE),
+        sync_to_async(cached_expiry_horizon)(horizon_by),
+    )
+    horizon_max = max([periode["quantite"] for periode in horizon["periodes"]] + [1])
+    horizon_rows = [
+        dict(periode, pct=round(100 * periode["quantite"] / horizon_max))
+        for periode in horizon["periodes"]
+    ]
 
-from .forms import ProductForm, FamilleForm, LotForm, MovementForm
-from .models import Famille, Produit, Lot, Sort
+    context = {
+        "active_page": active_page,
+        "horizon": horizon,
+        "horizon_by": horizon_by,
+        "horizon_rows": horizon_rows,
+        "total_alerts": counters["alerts"],
+        "stock_alert_count": counters["stock"],
+        "expiry_alert_count": counters["expiry"],
+        "critical_products_count": counters["critical"],
+        "product_states": [product_state(p) for p in critical],
+        "next_offset": DASHBOARD_CRITICAL_PAGE if has_more else None,
+    }
+    return await _arender(request, "dashboard.html", context)
+
+
+def dashboard_critical(request):
+    try:
+        offset = max(0, int(request.GET.get("offset") or 0))
+    except ValueError:
+        offset = 0
+    critical, has_more = critical_products(offset=offset, limit=DASHBOARD_CRITICAL_PAGE)
+    html = render_to_string(
+        "dashboard_critical_rows.html",
+        {"product_states": [product_state(p) for p in critical]},
+        request=request,
+    )
+    return JsonResponse({"html": html, "next": offset + DASHBOARD_CRITICAL_PAGE if has_more else None})
 
 
-DATA_VERSION_CACHE_KEY = "core_data_version"
+def expiry_horizon_data(request):
+    granularity = request.GET.get("by") or "week"
+    if granularity not in GRANULARITIES:
+        return JsonResponse({"error": "Parametre by invalide (week ou month)."}, status=400)
+    try:
+        periods = int(request.GET.get("periods") or 0) or None
+    except ValueError:
+        return JsonResponse({"error": "Parametre periods invalide."}, status=400)
+    famille_id = (request.GET.get("famille") or "").strip()
+    if famille_id and not famille_id.isdigit():
+        return JsonResponse({"error": "Parametre famille invalide."}, status=400)
 
+    by_famille = request.GET.get("familles") == "1"
+    return JsonResponse(cached_expiry_horizon(granularity, periods, famille_id or None, by_famille))
 
-def get_data_version():
-    return int(cache.get(DATA_VERSION_CACHE_KEY, 1))
 
+def updates_stream(request):
+    def stream():
+        last_sent = get_data_version()
+        stream_opened()
+        try:
+            yield f"event: init\ndata: {last_sent}\n\n"
+            while True:
+                time.sleep(1)
+                current = get_data_version()
+                if current != last_sent:
+                    last_sent = current
+                    yield f"event: data-update\ndata: {current}\n\n"
+        finally:
+            stream_closed()
+
+    async def astream():
+        last_sent = await aget_data_version()
+        stream_opened()
+        try:
+            yield f"event: init\ndata: {last_sent}\n\n"
+            while True:
+                await asyncio.sleep(1)
+                current = await aget_data_version()
+                if current != last_sent:
+                    last_sent = current
+                    yield f"event: data-update\ndata: {current}\n\n"
+        finally:
+            stream_closed()
+
+    # Sous ASGI, une connexion SSE inactive ne doit pas occuper un thread.
+    iterator = astream() if isinstance(request, ASGIRequest) else stream()
+    response = StreamingHttpResponse(iterator, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
 
-def bump_data_version():
-    cache.set(DATA_VERSION_CACHE_KEY, get_data_version() + 1, None)
-def dashboard(request):
-    active_page = "dashboard"
-    today = date.today()
 
-    produits_qs = (
-        Produit.objects
-        .select_related("famille")
-        .annotate(stock_total=Sum("lots__quantite"))
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    authorized = (
+        (token and request.headers.get("Authorization") == f"Bearer {token}")
+        or request.user.is_staff
+        or (settings.DEBUG and not token)
+    )
+    if not authorized:
+        return HttpResponse("Acces refuse.", status=403, content_type="text/plain")
+    if not settings.HAS_PROMETHEUS:
+        return HttpResponse("prometheus_client non installe.", status=503, content_type="text/plain")
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
+
+
+# -------------------------
+# API JSON en lecture seule (core/api.py)
+# -------------------------
+# Reponses compressees (gzip) avec un ETag calcule sur le contenu : un client
+# qui renvoie If-None-Match recoit un 304 sans corps si la page n'a pas change.
+# Sans API_TOKEN, l'API est ouverte comme les pages HTML.
+
+def _api_authorized(request):
+    token = settings.API_TOKEN
+    return (
+        not token
+        or request.headers.get("Authorization") == f"Bearer {token}"
+        or request.user.is_authenticated
     )
 
-    product_states = []
-    stock_alert_count = 0
-    expiry_alert_count = 0
-    critical_products_count = 0
-
-    for p in produits_qs:
-        stock = p.stock_total or 0
-
-        if stock <= 0:
-            stock_level = "danger"
-            stock_label = "Rupture de stock"
-            stock_alert_count += 1
-        elif stock <= p.nbr_qnt_alert:
-            stock_level = "near"
-            stock_label = "Seuil de stock atteint"
-            stock_alert_count += 1
-        else:
-            stock_level = "ok"
-            stock_label = "Stock normal"
 
-        if stock <= 0:
-            exp_level = "ok"
-            exp_label = "Pas de stock"
-        else:
-            next_lot = p.lots.filter(quantite__gt=0).order_by("date_fin").first()
-            if not next_lot:
-                exp_level = "ok"
-                exp_label = "Aucune date de péremption"
-            else:
-                days_left = (next_lot.date_fin - today).days
-                if days_left < 0:
-                    exp_level = "danger"
-                    exp_label = "Produit expiré"
-                    expiry_alert_count += 1
-                elif days_left == 0:
-                    exp_level = "danger"
-                    exp_label = "Expire aujourd’hui"
-                    expiry_alert_count += 1
-                elif days_left <= p.nbr_days_alert:
-                    exp_level = "near"
-                    exp_label = f"Expire dans {days_left} jour(s)"
-                    expiry_alert_count += 1
-                else:
-                    exp_level = "ok"
-                    exp_label = f"Expire dans {days_left} jour(s)"
+@gzip_page
+@conditional_page
+@require_safe
+def api_index(request):
+    if not _api_authorized(request):
+        return JsonResponse({"error": "Acces refuse."}, status=403)
+    return JsonResponse(
+        {
+            name: {
+                "url": request.build_absolute_uri(reverse(f"api_{name}")),
+                "fields": list(spec["fields"]),
+                "default_fields": list(spec["default"]),
+                "filters": resource_filters(spec),
+            }
+            for name, spec in RESOURCES.items()
+        }
+    )
 
-        if stock_level == "danger" or exp_level == "danger":
-            critical_products_count += 1
 
-        product_states.append(
-            {
-                "nom": p.nom or "-",
-                "reference": p.reference,
-                "barcode": p.barcode,
-                "stock_level": stock_level,
-                "stock_label": stock_label,
-                "exp_level": exp_level,
-                "exp_label": exp_label,
-            }
-        )
+@gzip_page
+@conditional_page
+@require_safe
+def api_list(request, resource):
+    if not _api_authorized(request):
+        return JsonResponse({"error": "Acces refuse."}, status=403)
+    try:
+        results, next_cursor = api_page(resource, request.GET)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    next_url = None
+    if next_cursor:
+        params = request.GET.copy()
+        params["cursor"] = next_cursor
+        next_url = request.build_absolute_uri(f"{request.path}?{params.urlencode()}")
+    return JsonResponse(
+        {"results": results, "next_cursor": next_cursor, "next": next_url},
+        json_dumps_params={"separators": (",", ":")},
+    )
 
-    context = {
-        "active_page": active_page,
-        "total_alerts": stock_alert_count + expiry_alert_count,
-        "stock_alert_count": stock_alert_count,
-        "expiry_alert_count": expiry_alert_count,
-        "critical_products_count": critical_products_count,
-        "product_states": product_states,
-    }
-    return render(request, "dashboard.html", context)
 
+def _products_post(request):
+    """Ajout / suppression de produit : (redirection, None) ou (None, form invalide)."""
+    action = request.POST.get("action", "add_product")
+
+    if action == "delete_product":
+        product_id = request.POST.get("product_id")
+        product = Produit.objects.filter(id=product_id).first()
+        if not product:
+            messages.error(request, "Produit introuvable.")
+            return redirect("products"), None
+
+        product_ref = product.reference
+        counts = delete_produits([product.id])
+        lots_count = counts.get("core.Lot", 0)
+        bump_data_version(catalog=True)
+        messages.success(
+            request,
+            f"Produit {product_ref} supprime avec {lots_count} lot(s) associe(s).",
+        )
+        return redirect("products"), None
 
-def updates_stream(request):
-    def stream():
-        last_sent = get_data_version()
-        yield f"event: init\ndata: {last_sent}\n\n"
-        while True:
-            time.sleep(1)
-            current = get_data_version()
-            if current != last_sent:
-                last_sent = current
-                yield f"event: data-update\ndata: {current}\n\n"
-
-    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
-    response["Cache-Control"] = "no-cache"
-    response["X-Accel-Buffering"] = "no"
-    return response
+    form = ProductForm(request.POST)
+    if form.is_valid():
+        form.save()
+        bump_data_version(catalog=True)
+        return redirect("products"), None
+    return None, form
 
 
-def products(request):
+async def products(request):
     active_page = "products"
     selected_famille_id = (request.GET.get("famille") or "").strip()
 
@@ -130,114 +281,35 @@ def products(request):
     # Form ajout produit
     # -------------------------
     if request.method == "POST":
-        action = request.POST.get("action", "add_product")
-
-        if action == "delete_product":
-            product_id = request.POST.get("product_id")
-            product = Produit.objects.filter(id=product_id).first()
-            if not product:
-                messages.error(request, "Produit introuvable.")
-                return redirect("products")
-
-            product_ref = product.reference
-            lots_count = product.lots.count()
-            product.delete()
-            bump_data_version()
-            messages.success(
-                request,
-                f"Produit {product_ref} supprime avec {lots_count} lot(s) associe(s).",
-            )
-            return redirect("products")
-
-        form = ProductForm(request.POST)
-        if form.is_valid():
-            form.save()
-            bump_data_version()
-            return redirect("products")
+        response, form = await sync_to_async(_products_post)(request)
+        if response is not None:
+            return response
     else:
         form = ProductForm()
 
     # -------------------------
     # Produits + stock total
     # -------------------------
-    produits_qs = (
-        Produit.objects
-        .select_related("famille")
-        .annotate(stock_total=Sum("lots__quantite"))
-    )
+    # Lignes compactes lues au fil de l'eau et rendues par paquets.
+    await aexpiry_state()
+    produits_qs = with_stock_status(Produit.objects.order_by("id"))
     if selected_famille_id:
         produits_qs = produits_qs.filter(famille_id=selected_famille_id)
+    rows = (
+        ProductRow(values)
+        async for values in avalues_list(produits_qs, PRODUCT_FIELDS)
+    )
 
-    today = date.today()
-    items = []
-
-    for p in produits_qs:
-        stock = p.stock_total or 0
-
-        # ---------- Statut du stock ----------
-        if stock <= 0:
-            stock_level = "danger"
-            stock_label = "Rupture de stock"
-        elif stock <= p.nbr_qnt_alert:
-            stock_level = "near"
-            stock_label = "Seuil de stock atteint"
-        else:
-            stock_level = "ok"
-            stock_label = "Stock normal"
-
-        # ---------- Statut de péremption ----------
-        # Si le stock est nul, on ignore le statut d'expiration.
-        if stock <= 0:
-            exp_level = "ok"
-            exp_label = "Pas de stock"
-        else:
-            next_lot = p.lots.filter(quantite__gt=0).order_by("date_fin").first()
-
-            if not next_lot:
-                exp_level = "ok"
-                exp_label = "Aucune date de péremption"
-            else:
-                days_left = (next_lot.date_fin - today).days
-
-                if days_left < 0:
-                    exp_level = "danger"
-                    exp_label = "Produit expiré"
-                elif days_left == 0:
-                    exp_level = "danger"
-                    exp_label = "Expire aujourd’hui"
-                elif days_left <= p.nbr_days_alert:
-                    exp_level = "near"
-                    exp_label = f"Expire dans {days_left} jour(s)"
-                else:
-                    exp_level = "ok"
-                    exp_label = f"Expire dans {days_left} jour(s)"
-
-        items.append({
-            "id": p.id,
-            "nom": p.nom,
-            "reference": p.reference,
-            "barcode": p.barcode,
-            "famille": p.famille,
-            "stock_total": stock,
-            "nbr_qnt_alert": p.nbr_qnt_alert,
-            "nbr_days_alert": p.nbr_days_alert,
-            "stock_level": stock_level,
-            "stock_label": stock_label,
-            "exp_level": exp_level,
-            "exp_label": exp_label,
-        })
-    familles = Famille.objects.all().order_by("nom")
-
-    return render(
+    return await astream_page(
         request,
         "products.html",
         {
             "active_page": active_page,
-            "products": items,   # ⚠️ items وليس queryset
             "form": form,
-            "familles": familles,
+            "familles": await _alist(Famille.objects.all().order_by("nom")),
             "selected_famille_id": selected_famille_id,
-        }
+        },
+        [("products_rows.html", rows)],
     )
 
 
@@ -252,7 +324,9 @@ def product_edit(request, product_id):
         form = ProductForm(request.POST, instance=product)
         if form.is_valid():
             form.save()
-            bump_data_version()
+            if "nbr_days_alert" in form.changed_data:
+                refresh_expiry(produit_ids=[product.id])
+            bump_data_version(catalog=bool({"reference", "barcode", "nom"} & set(form.changed_data)))
             messages.success(request, "Produit modifie avec succes.")
             return redirect("products")
     else:
@@ -272,7 +346,51 @@ def product_edit(request, product_id):
 
 
 
-def lots(request):
+def product_thresholds(request):
+    active_page = "products"
+    affected_count = None
+
+    if request.method == "POST":
+        form = BulkThresholdForm(request.POST)
+        if form.is_valid():
+            changes = form.changes()
+            # Un seul UPDATE et une seule montee de version pour tout le lot.
+            updated = form.target_queryset().update(**changes, modifie_le=timezone.now())
+            if updated:
+                if "nbr_days_alert" in changes:
+                    refresh_expiry(produit_ids=form.target_queryset().values("id"))
+                bump_data_version()
+            messages.success(request, f"Seuils modifies pour {updated} produit(s).")
+            return redirect("products")
+    elif request.GET:
+        form = BulkThresholdForm(request.GET)
+        if form.is_valid():
+            affected_count = form.target_queryset().count()
+    else:
+        form = BulkThresholdForm()
+
+    return render(
+        request,
+        "product_thresholds.html",
+        {
+            "active_page": active_page,
+            "form": form,
+            "affected_count": affected_count,
+        },
+    )
+
+
+def _lots_post(request):
+    form = LotForm(request.POST)
+    if form.is_valid():
+        lot = form.save()
+        refresh_expiry(lot_ids=[lot.id])
+        bump_data_version()
+        return redirect("lots"), None
+    return None, form
+
+
+async def lots(request):
     active_page = "lots"
 
     # -------------------------
@@ -287,38 +405,53 @@ def lots(request):
     # Form handling (POST / GET)
     # -------------------------
     if request.method == "POST":
-        form = LotForm(request.POST)
-        if form.is_valid():
-            form.save()
-            bump_data_version()
-            return redirect("lots")
+        response, form = await sync_to_async(_lots_post)(request)
+        if response is not None:
+            return response
     else:
-        form = LotForm(initial=initial)
+        # Lot() lit le site par defaut en base : construit hors de la boucle.
+        form = await sync_to_async(LotForm)(initial=initial)
 
     # -------------------------
-    # Lots FEFO + expiration logic
+    # Lots FEFO, archives (?archive=1) et produits du lookup JS
     # -------------------------
     lots_qs = (
         Lot.objects
-        .select_related("produit", "produit__famille")
+        .select_related("produit", "produit__famille", "site", "expiration")
         .order_by("date_fin")  # FEFO
     )
+    include_archive = request.GET.get("archive") == "1"
+    archives_qs = (
+        LotArchive.objects
+        .select_related("produit", "produit__famille", "site")
+        .order_by("date_fin")
+    )
+    lots_list, archives, lookup_rows = await asyncio.gather(
+        _alist(lots_qs),
+        _alist(archives_qs) if include_archive else asyncio.sleep(0, result=[]),
+        _alist(Produit.objects.values("id", "nom", "reference", "barcode")),
+    )
 
     today = date.today()
     items = []
 
-    for lot in lots_qs:
-        days_left = (lot.date_fin - today).days
-        alert_days = lot.produit.nbr_days_alert
+    for lot in lots_list:
+        expiration = getattr(lot, "expiration", None)
+        if expiration is not None and expiration.jour == today:
+            bucket, days_left = expiration.bucket, expiration.days_left
+        else:
+            # Lot cree hors de l'application, ou table pas encore recalculee
+            # aujourd'hui : calcul direct.
+            bucket, days_left = classify(lot.date_fin, lot.produit.nbr_days_alert, today)
 
         # Expiration status
-        if days_left < 0:
+        if bucket == LotExpiration.BUCKET_EXPIRE:
             level = "danger"
             label = "Expiré"
-        elif days_left == 0:
+        elif bucket == LotExpiration.BUCKET_AUJOURDHUI:
             level = "danger"
             label = "Il expire aujourd'hui"
-        elif days_left <= alert_days:
+        elif bucket == LotExpiration.BUCKET_PROCHE:
             level = "near"
             label = f"Il reste {days_left} jour(s)"
         else:
@@ -327,6 +460,7 @@ def lots(request):
 
         items.append({
             "produit": lot.produit,
+            "site": lot.site.nom,
             "date_entree": lot.date_entree,
             "date_fin": lot.date_fin,
             "quantite": lot.quantite,
@@ -334,31 +468,121 @@ def lots(request):
             "label": label,
         })
 
+    for archive in archives:
+        items.append({
+            "produit": archive.produit,
+            "site": archive.site.nom,
+            "date_entree": archive.date_entree,
+            "date_fin": archive.date_fin,
+            "quantite": archive.quantite,
+            "level": "archived",
+            "label": f"Archivé ({archive.get_motif_display().lower()})",
+        })
+
     # -------------------------
     # Lookup JS (barcode / preview)
     # -------------------------
     product_lookup_map = [
         {
-            "id": p.id,
-            "nom": p.nom or "",
-            "reference": p.reference,
-            "barcode": p.barcode,
+            "id": row["id"],
+            "nom": row["nom"] or "",
+            "reference": row["reference"],
+            "barcode": row["barcode"],
         }
-        for p in Produit.objects.all()
+        for row in lookup_rows
     ]
 
-    return render(
+    return await _arender(
         request,
         "lots.html",
         {
             "active_page": active_page,
             "form": form,
             "lots": items,              # ⚠️ items, pas queryset brut
+            "include_archive": include_archive,
             "product_lookup_map": product_lookup_map,
         }
     )
 
 
+SITE_SESSION_KEY = "site_id"
+
+
+def _station_site_id(request):
+    """Site de la station (dernier site choisi dans la session), sinon le site par defaut."""
+    # Sans session (RequestFactory de bench_fefo_preview) : site par defaut.
+    site_id = getattr(request, "session", {}).get(SITE_SESSION_KEY)
+    if site_id and Site.objects.filter(pk=site_id).exists():
+        return site_id
+    return default_site_id()
+
+
+def _form_site(request, form):
+    """Site choisi dans le formulaire (retenu pour la station), sinon celui de la station."""
+    site = form.cleaned_data.get("site")
+    if site is None:
+        return Site.objects.get(pk=_station_site_id(request))
+    if request.session.get(SITE_SESSION_KEY) != site.pk:
+        request.session[SITE_SESSION_KEY] = site.pk
+    return site
+
+
+def lots_delivery(request):
+    active_page = "lots"
+    errors = []
+
+    if request.method == "POST" and request.content_type == "application/json":
+        try:
+            payload = json.loads(request.body or b"{}")
+            lines = payload.get("lignes") or []
+            date_entree = payload.get("date_entree")
+            default_date_entree = date.fromisoformat(date_entree) if date_entree else None
+            site_id = int(payload["site"]) if payload.get("site") else None
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({"created": 0, "errors": ["JSON invalide."]}, status=400)
+        if site_id is not None and not Site.objects.filter(pk=site_id).exists():
+            return JsonResponse({"created": 0, "errors": [f"Site {site_id} introuvable."]}, status=400)
+        if not isinstance(lines, list):
+            return JsonResponse({"created": 0, "errors": ["Le champ lignes doit etre une liste."]}, status=400)
+        errors = [
+            f"Ligne {number}: objet attendu."
+            for number, line in enumerate(lines, start=1)
+            if not isinstance(line, dict)
+        ]
+        if errors:
+            return JsonResponse({"created": 0, "errors": errors}, status=400)
+
+        lots, errors = build_delivery(lines, default_date_entree, site_id)
+        if errors:
+            return JsonResponse({"created": 0, "errors": errors}, status=400)
+        return JsonResponse({"created": create_delivery(lots), "errors": []})
+
+    if request.method == "POST":
+        form = DeliveryForm(request.POST)
+        if form.is_valid():
+            lots, errors = build_delivery(
+                parse_delivery_text(form.cleaned_data["lignes"]),
+                form.cleaned_data["date_entree"],
+                _form_site(request, form).pk,
+            )
+            if not errors:
+                created = create_delivery(lots)
+                messages.success(request, f"Livraison enregistree: {created} lot(s).")
+                return redirect("lots")
+    else:
+        form = DeliveryForm(initial={"site": _station_site_id(request)})
+
+    return render(
+        request,
+        "lots_delivery.html",
+        {
+            "active_page": active_page,
+            "form": form,
+            "errors": errors,
+        },
+    )
+
+
 def movements(request):
     active_page = "movements"
     today = date.today()
@@ -368,58 +592,44 @@ def movements(request):
         if form.is_valid():
             code = form.cleaned_data["code"]
             quantite_demandee = form.cleaned_data["quantite"]
+            site = _form_site(request, form)
 
-            produit = (
-                Produit.objects
-                .filter(Q(reference__iexact=code) | Q(barcode__iexact=code))
-                .first()
-            )
+            produit = resolve_produit(code)
 
             if not produit:
-                messages.error(request, "Produit non disponible.")
+                suggestions = suggest_codes(code, limit=3)
+                if suggestions:
+                    proches = ", ".join(f"{s['reference']} ({s['barcode']})" for s in suggestions)
+                    messages.error(request, f"Produit non disponible. Codes proches : {proches}.")
+                else:
+                    messages.error(request, "Produit non disponible.")
                 return redirect("movements")
 
-            with transaction.atomic():
-                lots = list(
-                    Lot.objects
-                    .select_for_update()
-                    .filter(produit=produit, quantite__gt=0, date_fin__gte=today)
-                    .order_by("date_fin")
-                )
-
-                stock_disponible = sum(lot.quantite for lot in lots)
-                if stock_disponible < quantite_demandee:
-                    messages.error(request, "Produit non disponible (quantite insuffisante).")
-                    return redirect("movements")
-
-                reste = quantite_demandee
-                for lot in lots:
-                    if reste == 0:
-                        break
-                    preleve = min(lot.quantite, reste)
-                    lot.quantite -= preleve
-                    lot.save(update_fields=["quantite"])
-                    reste -= preleve
-
-                Sort.objects.create(produit=produit, quantite=quantite_demandee)
-                bump_data_version()
-                messages.success(
-                    request,
-                    f"Sortie enregistree: {produit.reference} (-{quantite_demandee})."
-                )
+            # FEFO limite aux lots du site : seuls ces lots sont verrouilles.
+            sortie = allocate_exit(produit, quantite_demandee, site.pk, today)
+            if sortie is None:
+                messages.error(request, f"Produit non disponible sur le site {site.nom} (quantite insuffisante).")
                 return redirect("movements")
+            messages.success(
+                request,
+                f"Sortie enregistree: {produit.reference} (-{quantite_demandee}, {site.nom})."
+            )
+            return redirect("movements")
+        site_id = _station_site_id(request)
     else:
-        form = MovementForm(initial={"quantite": 1})
+        site_id = _station_site_id(request)
+        form = MovementForm(initial={"quantite": 1, "site": site_id})
 
     fefo_lots = (
         Lot.objects
         .select_related("produit")
-        .filter(quantite__gt=0, date_fin__gte=today)
+        .filter(site_id=site_id, quantite__gt=0, date_fin__gte=today)
         .order_by("date_fin")
     )[:10]
     sort_history = (
         Sort.objects
         .select_related("produit")
+        .filter(site_id=site_id)
         .order_by("-date_sortie", "-id")
     )[:10]
 
@@ -434,32 +644,225 @@ def movements(request):
         },
     )
 
-def alerts(request):
-    active_page = "alerts"
+def code_suggestions(request):
+    code = (request.GET.get("code") or "").strip()
+    try:
+        limit = min(MAX_SUGGESTIONS, max(1, int(request.GET.get("k") or DEFAULT_SUGGESTIONS)))
+    except ValueError:
+        limit = DEFAULT_SUGGESTIONS
+    if not code:
+        return JsonResponse({"error": "Parametre code requis."}, status=400)
+
+    ref = lookup_code(code)
+    return JsonResponse(
+        {
+            "code": code,
+            "found": ref is not None,
+            "suggestions": [] if ref is not None else suggest_codes(code, limit),
+        }
+    )
+
+
+def fefo_preview(request):
+    code = (request.GET.get("code") or "").strip()
+    try:
+        quantite = max(1, int(request.GET.get("quantite") or 1))
+    except ValueError:
+        quantite = 1
+
+    try:
+        site_id = int(request.GET.get("site") or _station_site_id(request))
+    except ValueError:
+        return JsonResponse({"error": "Parametre site invalide."}, status=400)
+
+    ref = lookup_code(code)
+    if ref is None:
+        return JsonResponse({"found": False, "code": code})
+
+    # Les deux requetes ne lisent que l'index (site, produit, date_fin).
     today = date.today()
+    lots_qs = available_lots(ref.id, site_id, today)
+    stock_disponible = lots_qs.aggregate(total=Sum("quantite"))["total"] or 0
+    next_lots = [
+        {
+            "id": lot_id,
+            "date_entree": date_entree.isoformat(),
+            "date_fin": date_fin.isoformat(),
+            "days_left": (date_fin - today).days,
+            "quantite": lot_quantite,
+        }
+        for lot_id, date_entree, date_fin, lot_quantite in (
+            lots_qs
+            .order_by("date_fin", "id")
+            .values_list("id", "date_entree", "date_fin", "quantite")[:FEFO_PREVIEW_MAX_LOTS]
+        )
+    ]
 
-    if request.method == "POST":
-        action = request.POST.get("action", "")
-        if action == "delete_expired_lot":
-            lot_id = request.POST.get("lot_id")
-            lot = Lot.objects.select_related("produit").filter(id=lot_id).first()
+    return JsonResponse(
+        {
+            "found": True,
+            "code": code,
+            "produit": {
+                "id": ref.id,
+                "nom": ref.nom or "",
+                "reference": ref.reference,
+                "barcode": ref.barcode,
+            },
+            "site": site_id,
+            "quantite": quantite,
+            "stock_disponible": stock_disponible,
+            "suffisant": stock_disponible >= quantite,
+            "lots": next_lots,
+        }
+    )
 
-            if not lot:
-                messages.error(request, "Lot introuvable.")
-                return redirect("alerts")
 
-            if lot.date_fin >= today:
-                messages.warning(request, "Seuls les lots expires peuvent etre supprimes.")
-                return redirect("alerts")
+def stock_at_date(request):
+    try:
+        day = date.fromisoformat(request.GET.get("date") or "")
+    except ValueError:
+        return JsonResponse({"error": "Parametre date invalide (AAAA-MM-JJ)."}, status=400)
 
-            ref = lot.produit.reference
-            lot.delete()
-            bump_data_version()
-            messages.success(request, f"Lot expire supprime pour le produit {ref}.")
+    code = (request.GET.get("code") or "").strip()
+    try:
+        if code:
+            ref = lookup_code(code)
+            if ref is None:
+                return JsonResponse({"error": f"Produit '{code}' introuvable."}, status=404)
+            stock = {ref.id: stock_at(day, produit_id=ref.id)}
+        else:
+            stock = stock_at(day)
+    except ValueError as exc:
+        return JsonResponse({"error": str(exc)}, status=400)
+
+    references = dict(Produit.objects.filter(id__in=stock.keys()).values_list("id", "reference"))
+    return JsonResponse(
+        {
+            "date": day.isoformat(),
+            "produits": [
+                {"id": pid, "reference": references.get(pid, ""), "quantite": qty}
+                for pid, qty in sorted(stock.items())
+            ],
+        }
+    )
+
+
+def _alerts_post(request):
+    today = date.today()
+    action = request.POST.get("action", "")
+    if action == "ack_digest":
+        outbox_ids = [v for v in request.POST.getlist("outbox_ids") if v.isdigit()]
+        count = AlerteOutbox.objects.filter(id__in=outbox_ids, acquitte_le__isnull=True).update(
+            acquitte_le=timezone.now()
+        )
+        messages.success(request, f"{count} alerte(s) acquittee(s).")
+        return redirect(request.get_full_path())
+
+    if action == "delete_expired_lot":
+        lot_id = request.POST.get("lot_id") or ""
+        lot = Lot.objects.select_related("produit").filter(id=lot_id).first() if lot_id.isdigit() else None
+
+        if not lot:
+            messages.error(request, "Lot introuvable.")
             return redirect("alerts")
 
+        if lot.date_fin >= today:
+            messages.warning(request, "Seuls les lots expires peuvent etre supprimes.")
+            return redirect("alerts")
+
+        ref = lot.produit.reference
+        with write_atomic():
+            record_lot_removal(Lot.objects.filter(pk=lot.pk), archived=False)
+            lot.delete()
+        bump_data_version()
+        messages.success(request, f"Lot expire supprime pour le produit {ref}.")
+        return redirect("alerts")
+
+    if action == "purge_expired":
+        scope = request.POST.get("scope", "selection")
+        lot_ids = None
+        famille_id = None
+        before = None
+
+        if scope == "selection":
+            lot_ids = [v for v in request.POST.getlist("lot_ids") if v.isdigit()]
+            if not lot_ids:
+                messages.warning(request, "Aucun lot expire selectionne.")
+                return redirect("alerts")
+        elif scope == "famille":
+            famille_id = (request.POST.get("famille_id") or "").strip()
+            if not famille_id.isdigit():
+                messages.warning(request, "Choisissez une famille.")
+                return redirect("alerts")
+        elif scope == "before":
+            try:
+                before = date.fromisoformat(request.POST.get("before") or "")
+            except ValueError:
+                messages.warning(request, "Date invalide.")
+                return redirect("alerts")
+
+        count, quantite = purge_expired_lots(
+            lot_ids=lot_ids,
+            famille_id=famille_id,
+            before=before,
+            archive=request.POST.get("archive") == "1",
+        )
+        if count:
+            messages.success(
+                request,
+                f"{count} lot(s) expire(s) retire(s), quantite perdue: {quantite}.",
+            )
+        else:
+            messages.info(request, "Aucun lot expire ne correspond a ce filtre.")
+        return redirect("alerts")
+
+    return None
+
+
+def _alert_sort(sort_by, prefix, date_field):
+    """Cle de tri SQL des lignes d'alerte, commune aux produits et aux lots."""
+    if sort_by in {"name", "barcode"}:
+        field = "nom" if sort_by == "name" else "barcode"
+        return Lower(Coalesce(f"{prefix}{field}", Value("")))
+    if sort_by in {"date", "days"}:
+        # Jours restants et date de fin donnent le meme ordre.
+        return F(date_field)
+    return F(f"{prefix}id")
+
+
+def _merge_key(alert_sort, produit_id):
+    # Meme ordre qu'en SQL : dates absentes (pas de lot) en dernier.
+    return (alert_sort is None, alert_sort, produit_id)
+
+
+async def _stock_alert_rows(stock_qs, today):
+    async for values in avalues_list(stock_qs, ALERT_PRODUCT_FIELDS + ("alert_sort",)):
+        produit_id, nom, reference, barcode, famille_nom, stock_total, nbr_qnt_alert = values[:7]
+        level, label = stock_state(stock_total, nbr_qnt_alert)
+        row = AlertRow.for_stock(
+            (produit_id, nom, reference, barcode, famille_nom), stock_total, level, label, values[7:10], today
+        )
+        yield _merge_key(values.alert_sort, produit_id), row
+
+
+async def _expiry_alert_rows(expiry_qs):
+    async for values in avalues_list(expiry_qs, ALERT_EXPIRATION_FIELDS + ("alert_sort",)):
+        row = AlertRow.for_expiration((values.produit_id, *values[7:11]), None, values[:7])
+        yield _merge_key(values.alert_sort, values.produit_id), row
+
+
+async def alerts(request):
+    active_page = "alerts"
+    today = date.today()
+
+    if request.method == "POST":
+        response = await sync_to_async(_alerts_post)(request)
+        if response is not None:
+            return response
+
     query = (request.GET.get("q") or "").strip()
     famille_filter = (request.GET.get("famille") or "").strip()
+    site_filter = (request.GET.get("site") or "").strip()
     alert_kind = (request.GET.get("kind") or "all").strip().lower()
     sort_by = (request.GET.get("sort") or "").strip().lower()
     valid_kinds = {"all", "stock", "expiry"}
@@ -469,175 +872,434 @@ def alerts(request):
     if sort_by not in valid_sorts:
         sort_by = ""
 
-    produits_qs = (
-        Produit.objects
-        .select_related("famille")
-        .annotate(stock_total=Sum("lots__quantite"))
-    )
+    # Site : stock, prochain lot et lots en alerte limites aux lots du site.
+    site_id = int(site_filter) if site_filter.isdigit() else None
+    if site_filter and site_id is None:
+        site_filter = ""
 
+    # Produits filtres en SQL ; le stock (du site) vient de sous-requetes.
+    await aexpiry_state()
+    produits_qs = with_stock_status(Produit.objects.all(), days_left=False, site_id=site_id)
+    if site_id is not None:
+        produits_qs = carried_at(produits_qs, site_id)
     if query:
-        query_lower = query.lower()
-        produits_qs = [
-            p for p in produits_qs
-            if (
-                query_lower in (p.nom or "").lower()
-                or query_lower in (p.reference or "").lower()
-                or query_lower in (p.barcode or "").lower()
-            )
-        ]
-    else:
-        produits_qs = list(produits_qs)
-
-    if famille_filter:
-        produits_qs = [p for p in produits_qs if str(p.famille_id) == famille_filter]
-
-    critical_alerts = []
-    warning_alerts = []
-
-    for p in produits_qs:
-        stock_total = p.stock_total or 0
-
-        if alert_kind in {"all", "stock"}:
-            stock_label = None
-            stock_level = None
-            if stock_total <= 0:
-                stock_level = "danger"
-                stock_label = "Rupture de stock"
-            elif stock_total <= p.nbr_qnt_alert:
-                stock_level = "near"
-                stock_label = "Seuil de stock atteint"
-
-            if stock_level:
-                next_lot = p.lots.filter(quantite__gt=0).order_by("date_fin").first()
-                if next_lot:
-                    stock_days_left = (next_lot.date_fin - today).days
-                    stock_lot_quantite = next_lot.quantite
-                    stock_date_entree = next_lot.date_entree
-                    stock_date_fin = next_lot.date_fin
-                else:
-                    stock_days_left = "-"
-                    stock_lot_quantite = "-"
-                    stock_date_entree = "-"
-                    stock_date_fin = "-"
-
-                row = {
-                    "type": "stock",
-                    "type_label": "Alerte stock",
-                    "status_label": stock_label,
-                    "status_level": stock_level,
-                    "lot_id": None,
-                    "produit_id": p.id,
-                    "produit_nom": p.nom,
-                    "reference": p.reference,
-                    "barcode": p.barcode,
-                    "famille": p.famille.nom,
-                    "stock_total": stock_total,
-                    "lot_quantite": stock_lot_quantite,
-                    "date_entree": stock_date_entree,
-                    "date_fin": stock_date_fin,
-                    "days_left": stock_days_left,
-                    "min_qte": p.nbr_qnt_alert,
-                    "min_jour": p.nbr_days_alert,
-                }
-                if stock_level == "danger":
-                    critical_alerts.append(row)
-                else:
-                    warning_alerts.append(row)
-
-        if alert_kind in {"all", "expiry"} and stock_total > 0:
-            product_lots = list(
-                p.lots.filter(quantite__gt=0).order_by("date_fin")
-            )
-            for lot in product_lots:
-                days_left = (lot.date_fin - today).days
-
-                if days_left < 0:
-                    level = "danger"
-                    label = "Expire"
-                elif days_left == 0:
-                    level = "danger"
-                    label = "Expire aujourd'hui"
-                elif days_left <= p.nbr_days_alert:
-                    level = "near"
-                    label = "Proche expiration"
-                else:
-                    continue
-
-                row = {
-                    "type": "expiry",
-                    "type_label": "Alerte expiration",
-                    "status_label": label,
-                    "status_level": level,
-                    "lot_id": lot.id,
-                    "produit_id": p.id,
-                    "produit_nom": p.nom,
-                    "reference": p.reference,
-                    "barcode": p.barcode,
-                    "famille": p.famille.nom,
-                    "stock_total": stock_total,
-                    "lot_quantite": lot.quantite,
-                    "date_entree": lot.date_entree,
-                    "date_fin": lot.date_fin,
-                    "days_left": days_left,
-                    "min_qte": p.nbr_qnt_alert,
-                    "min_jour": p.nbr_days_alert,
-                }
-
-                if level == "danger":
-                    critical_alerts.append(row)
-                else:
-                    warning_alerts.append(row)
-
-    if sort_by == "name":
-        critical_alerts.sort(key=lambda item: (item.get("produit_nom") or "").lower())
-        warning_alerts.sort(key=lambda item: (item.get("produit_nom") or "").lower())
-    elif sort_by == "barcode":
-        critical_alerts.sort(key=lambda item: (item.get("barcode") or "").lower())
-        warning_alerts.sort(key=lambda item: (item.get("barcode") or "").lower())
-    elif sort_by == "date":
-        critical_alerts.sort(
-            key=lambda item: (
-                item.get("date_fin") == "-",
-                item.get("date_fin") if item.get("date_fin") != "-" else date.max,
-            )
+        produits_qs = produits_qs.filter(
+            Q(nom__icontains=query) | Q(reference__icontains=query) | Q(barcode__icontains=query)
         )
-        warning_alerts.sort(
-            key=lambda item: (
-                item.get("date_fin") == "-",
-                item.get("date_fin") if item.get("date_fin") != "-" else date.max,
-            )
+    if famille_filter:
+        produits_qs = produits_qs.filter(famille_id=famille_filter) if famille_filter.isdigit() else produits_qs.none()
+
+    # Chaque tableau fusionne deux flux tries dans le meme ordre : alertes
+    # stock (un produit et son prochain lot non vide) et lots en alerte lus
+    # dans LotExpiration. Aucune liste complete n'est gardee en memoire.
+    stock_qs = expiry_qs = None
+    if alert_kind in {"all", "stock"}:
+        next_lot = Lot.objects.filter(produit=OuterRef("pk"), quantite__gt=0).order_by("date_fin")
+        if site_id is not None:
+            next_lot = next_lot.filter(site_id=site_id)
+        stock_qs = produits_qs.annotate(
+            next_quantite=Subquery(next_lot.values("quantite")[:1]),
+            next_date_entree=Subquery(next_lot.values("date_entree")[:1]),
+            next_date_fin=Subquery(next_lot.values("date_fin")[:1]),
         )
-    elif sort_by == "days":
-        critical_alerts.sort(
-            key=lambda item: (
-                not isinstance(item.get("days_left"), int),
-                item.get("days_left") if isinstance(item.get("days_left"), int) else 999999,
-            )
+        stock_qs = stock_qs.annotate(alert_sort=_alert_sort(sort_by, "", "next_date_fin")).order_by("alert_sort", "id")
+    if alert_kind in {"all", "expiry"}:
+        expiry_qs = current_expirations().filter(
+            lot__quantite__gt=0, produit__in=produits_qs.filter(stock_total__gt=0).values("pk"),
         )
-        warning_alerts.sort(
-            key=lambda item: (
-                not isinstance(item.get("days_left"), int),
-                item.get("days_left") if isinstance(item.get("days_left"), int) else 999999,
-            )
+        if site_id is not None:
+            expiry_qs = expiry_qs.filter(lot__site_id=site_id)
+        expiry_qs = expiry_qs.annotate(alert_sort=_alert_sort(sort_by, "produit__", "date_fin")).order_by(
+            "alert_sort", "produit_id", "date_fin", "lot_id"
         )
 
-    familles = Famille.objects.all().order_by("nom")
+    def section(stock_filter, buckets):
+        streams = []
+        if stock_qs is not None:
+            streams.append(_stock_alert_rows(stock_qs.filter(stock_filter), today))
+        if expiry_qs is not None:
+            streams.append(_expiry_alert_rows(expiry_qs.filter(bucket_jour__in=buckets)))
+        return amerge(*streams)
+
+    critical_alerts = section(Q(stock_total__lte=0), DANGER_BUCKETS)
+    warning_alerts = section(
+        Q(stock_total__gt=0, stock_total__lte=F("nbr_qnt_alert")), (LotExpiration.BUCKET_PROCHE,)
+    )
+
+    # Outbox du digest (alert_digest) : alertes nouvelles non acquittees.
+    digest_qs = AlerteOutbox.objects.filter(acquitte_le__isnull=True)
+    if site_id is not None:
+        digest_qs = digest_qs.filter(Q(site_id=site_id) | Q(site__isnull=True))
+    digest_alerts, digest_total = await asyncio.gather(
+        _alist(digest_qs.select_related("produit", "site").order_by("-cree_le", "-id")[:DIGEST_PAGE]),
+        digest_qs.acount(),
+    )
+
     context = {
         "active_page": active_page,
-        "critical_alerts": critical_alerts,
-        "warning_alerts": warning_alerts,
-        "familles": familles,
+        "digest_alerts": digest_alerts,
+        "digest_total": digest_total,
+        "familles": await _alist(Famille.objects.all().order_by("nom")),
+        "sites": await _alist(Site.objects.order_by("nom")),
         "query": query,
         "famille_filter": famille_filter,
+        "site_filter": site_filter,
         "kind_filter": alert_kind,
         "sort_filter": sort_by,
     }
-    return render(request, "alerts.html", context)
+    return await astream_page(
+        request,
+        "alerts.html",
+        context,
+        [("alerts_critical_rows.html", critical_alerts), ("alerts_warning_rows.html", warning_alerts)],
+    )
+
+def consommation(request):
+    active_page = "consommation"
+    group_by = (request.GET.get("group") or "produit").strip().lower()
+    famille_filter = (request.GET.get("famille") or "").strip()
+    if group_by not in {"produit", "famille", "mois"}:
+        group_by = "produit"
+
+    start = end = None
+    try:
+        if request.GET.get("start"):
+            start = date.fromisoformat(request.GET["start"])
+        if request.GET.get("end"):
+            end = date.fromisoformat(request.GET["end"])
+    except ValueError:
+        messages.warning(request, "Date invalide, filtre ignore.")
+        start = end = None
+    if famille_filter and not famille_filter.isdigit():
+        messages.warning(request, "Famille invalide, filtre ignore.")
+        famille_filter = ""
+
+    # Toutes les agregations lisent le cumul journalier, jamais Sort.
+    rollup_qs = ConsommationJournaliere.objects.all()
+    if start:
+        rollup_qs = rollup_qs.filter(jour__gte=start)
+    if end:
+        rollup_qs = rollup_qs.filter(jour__lte=end)
+    if famille_filter:
+        rollup_qs = rollup_qs.filter(famille_id=famille_filter)
+
+    if group_by == "famille":
+        rows = (
+            rollup_qs
+            .values("famille__nom")
+            .annotate(total=Sum("quantite"), sorties=Sum("nb_sorties"), produits=Count("produit", distinct=True))
+            .order_by("-total")
+        )
+        items = [
+            {
+                "label": row["famille__nom"] or "-",
+                "detail": f"{row['produits']} produit(s)",
+                "total": row["total"],
+                "sorties": row["sorties"],
+            }
+            for row in rows
+        ]
+    elif group_by == "mois":
+        rows = (
+            rollup_qs
+            .annotate(mois=TruncMonth("jour"))
+            .values("mois")
+            .annotate(total=Sum("quantite"), sorties=Sum("nb_sorties"), produits=Count("produit", distinct=True))
+            .order_by("-mois")
+        )
+        items = [
+            {
+                "label": row["mois"].strftime("%Y-%m"),
+                "detail": f"{row['produits']} produit(s)",
+                "total": row["total"],
+                "sorties": row["sorties"],
+            }
+            for row in rows
+        ]
+    else:
+        rows = (
+            rollup_qs
+            .values("produit__reference", "produit__nom")
+            .annotate(total=Sum("quantite"), sorties=Sum("nb_sorties"))
+            .order_by("-total")
+        )
+        items = [
+            {
+                "label": row["produit__reference"],
+                "detail": row["produit__nom"] or "-",
+                "total": row["total"],
+                "sorties": row["sorties"],
+            }
+            for row in rows
+        ]
+
+    familles = Famille.objects.all().order_by("nom")
+    return render(
+        request,
+        "consommation.html",
+        {
+            "active_page": active_page,
+            "items": items,
+            "familles": familles,
+            "group_filter": group_by,
+            "famille_filter": famille_filter,
+            "start": start.isoformat() if start else "",
+            "end": end.isoformat() if end else "",
+        },
+    )
+
+
+def reorders(request):
+    active_page = "reorders"
+    famille_filter = (request.GET.get("famille") or "").strip()
+    try:
+        lead_time = max(0, int(request.GET.get("lead") or DEFAULT_LEAD_TIME_DAYS))
+        window = max(1, int(request.GET.get("window") or DEFAULT_WINDOW_DAYS))
+    except ValueError:
+        lead_time, window = DEFAULT_LEAD_TIME_DAYS, DEFAULT_WINDOW_DAYS
+    try:
+        famille_id = int(famille_filter) if famille_filter else None
+    except ValueError:
+        messages.warning(request, "Famille invalide, filtre ignore.")
+        famille_filter, famille_id = "", None
+
+    rows = suggest_reorders(lead_time_days=lead_time, window_days=window, famille_id=famille_id)
+
+    if request.GET.get("export") == "csv":
+        response = HttpResponse(content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="commandes-{date.today().isoformat()}.csv"'
+        writer = csv.writer(response, delimiter=";")
+        writer.writerow([
+            "Famille", "Reference", "Produit", "Code-barres", "Stock valide",
+            "Seuil", "Consommation/jour", "Quantite a commander",
+        ])
+        for row in rows.iterator(chunk_size=2000):
+            writer.writerow([
+                row["famille__nom"],
+                row["reference"],
+                row["nom"] or "",
+                row["barcode"],
+                row["stock_valide"],
+                row["nbr_qnt_alert"],
+                f"{row['taux_jour']:.2f}",
+                int(row["besoin"]),
+            ])
+        return response
+
+    familles = Famille.objects.all().order_by("nom")
+    return render(
+        request,
+        "reorders.html",
+        {
+            "active_page": active_page,
+            "groups": group_by_famille(rows),
+            "familles": familles,
+            "famille_filter": famille_filter,
+            "lead_time": lead_time,
+            "window": window,
+        },
+    )
+
+
+RECALL_MAX_ROWS = 1000
+
+
+def recall(request):
+    active_page = "recall"
+    lot_filter = (request.GET.get("lot") or "").strip()
+    code = (request.GET.get("code") or "").strip()
+    date_min = (request.GET.get("du") or "").strip()
+    date_max = (request.GET.get("au") or "").strip()
+
+    allocations = None
+    produit = None
+    if lot_filter.isdigit():
+        allocations = SortieLot.objects.filter(lot_id=int(lot_filter))
+    elif code:
+        produit = lookup_code(code)
+        if produit is None:
+            messages.error(request, f"Produit '{code}' introuvable.")
+        else:
+            # Index (produit, date_fin) : lots du produit expirant dans la fenetre.
+            allocations = SortieLot.objects.filter(produit_id=produit.id)
+            try:
+                if date_min:
+                    allocations = allocations.filter(date_fin__gte=date.fromisoformat(date_min))
+                if date_max:
+                    allocations = allocations.filter(date_fin__lte=date.fromisoformat(date_max))
+            except ValueError:
+                messages.error(request, "Dates invalides (AAAA-MM-JJ).")
+                allocations = None
+
+    totals = {"nb_sorties": 0, "quantite": 0, "nb_lots": 0, "nb_lignes": 0}
+    rows = []
+    if allocations is not None:
+        totals = allocations.aggregate(
+            nb_sorties=Count("sortie_id", distinct=True),
+            quantite=Sum("quantite"),
+            nb_lots=Count("lot_id", distinct=True),
+            nb_lignes=Count("id"),
+        )
+        rows = allocations.order_by("date_sortie", "sortie_id").values(
+            "sortie_id", "lot_id", "produit__reference", "date_fin", "date_sortie", "quantite"
+        )
+
+        if request.GET.get("export") == "csv":
+            response = HttpResponse(content_type="text/csv; charset=utf-8")
+            response["Content-Disposition"] = f'attachment; filename="rappel-{date.today().isoformat()}.csv"'
+            writer = csv.writer(response, delimiter=";")
+            writer.writerow(["Date sortie", "Sortie", "Lot", "Reference", "Peremption", "Quantite"])
+            for row in rows.iterator(chunk_size=2000):
+                writer.writerow([
+                    row["date_sortie"].isoformat(),
+                    row["sortie_id"],
+                    row["lot_id"],
+                    row["produit__reference"],
+                    row["date_fin"].isoformat(),
+                    row["quantite"],
+                ])
+            return response
+
+        rows = rows[:RECALL_MAX_ROWS]
+
+    return render(
+        request,
+        "recall.html",
+        {
+            "active_page": active_page,
+            "rows": rows,
+            "totals": totals,
+            "searched": allocations is not None,
+            "produit": produit,
+            "lot_filter": lot_filter,
+            "code": code,
+            "date_min": date_min,
+            "date_max": date_max,
+            "max_rows": RECALL_MAX_ROWS,
+            "query_string": request.GET.urlencode(),
+        },
+    )
+
+
+INVENTAIRE_MAX_ROWS = 500
+
+
+def inventaires(request):
+    active_page = "inventaires"
+
+    if request.method == "POST":
+        nom = (request.POST.get("nom") or "").strip() or f"Inventaire du {date.today().isoformat()}"
+        session = InventaireSession.objects.create(nom=nom[:100])
+        return redirect("inventaire_detail", session_id=session.id)
+
+    sessions = InventaireSession.objects.annotate(nb_comptages=Count("comptages"))
+    return render(
+        request,
+        "inventaires.html",
+        {
+            "active_page": active_page,
+            "sessions": sessions,
+        },
+    )
+
+
+def inventaire_detail(request, session_id):
+    active_page = "inventaires"
+    session = InventaireSession.objects.filter(id=session_id).first()
+    if not session:
+        messages.error(request, "Inventaire introuvable.")
+        return redirect("inventaires")
+
+    if request.method == "POST":
+        action = request.POST.get("action", "")
+        if session.statut != InventaireSession.STATUT_OUVERT:
+            messages.warning(request, "Cet inventaire est deja applique.")
+            return redirect("inventaire_detail", session_id=session.id)
+
+        if action in {"upload", "scan"}:
+            if action == "scan":
+                lines = [{
+                    "ligne": 1,
+                    "code": (request.POST.get("code") or "").strip(),
+                    "quantite": request.POST.get("quantite") or "1",
+                    "lot_id": "",
+                }]
+            else:
+                lines = parse_count_text(request.POST.get("lignes"))
+            count, errors = add_counts(session, lines, cumulative=action == "scan")
+            for error in errors[:20]:
+                messages.error(request, error)
+            if count:
+                messages.success(request, f"{count} comptage(s) enregistre(s).")
+            return redirect("inventaire_detail", session_id=session.id)
+
+        if action == "apply":
+            summary = apply_session(session)
+            messages.success(
+                request,
+                f"Inventaire applique: {summary['ecarts']} ecart(s), {summary['lots_modifies']} lot(s) ajuste(s).",
+            )
+            if summary["non_appliques"]:
+                messages.warning(
+                    request,
+                    "Ecart non applique pour: " + ", ".join(summary["non_appliques"][:20]),
+                )
+            return redirect("inventaire_detail", session_id=session.id)
+
+    rows_qs = reconciliation(session)
+    if session.statut == InventaireSession.STATUT_APPLIQUE:
+        ecarts_qs = rows_qs.exclude(ecart=0).exclude(ecart=None)
+    else:
+        ecarts_qs = rows_qs.exclude(difference=0)
+    stats = rows_qs.aggregate(total=Count("id"))
+    ecarts_count = ecarts_qs.count()
+    ecarts = list(
+        ecarts_qs
+        .select_related("produit")
+        .order_by("produit__reference")[:INVENTAIRE_MAX_ROWS]
+    )
+
+    return render(
+        request,
+        "inventaire_detail.html",
+        {
+            "active_page": active_page,
+            "session": session,
+            "comptages_count": stats["total"],
+            "ecarts_count": ecarts_count,
+            "ecarts": ecarts,
+            "max_rows": INVENTAIRE_MAX_ROWS,
+        },
+    )
+
 
 def historique(request):
     active_page="historique"
     return render(request, "historique.html",{"active_page":active_page})
 
+def sites(request):
+    active_page = "sites"
+    form = SiteForm()
+
+    if request.method == "POST":
+        form = SiteForm(request.POST)
+        if form.is_valid():
+            site = form.save()
+            bump_data_version()
+            messages.success(request, f"Site '{site.nom}' ajoute.")
+            return redirect("sites")
+
+    return render(
+        request,
+        "sites.html",
+        {
+            "active_page": active_page,
+            "form": form,
+            "sites": site_summaries(),
+        },
+    )
+
+
 def famille(request):
     active_page = "famille"
     form = FamilleForm()
@@ -662,11 +1324,10 @@ def famille(request):
                 return redirect("famille")
 
             if delete_mode == "with_products":
-                deleted_products = fam.produits.count()
-                fam.produits.all().delete()
                 fam_name = fam.nom
-                fam.delete()
-                bump_data_version()
+                counts = delete_famille(fam.id)
+                deleted_products = counts.get("core.Produit", 0)
+                bump_data_version(catalog=True)
                 messages.success(
                     request,
                     f"Famille '{fam_name}' supprimee avec {deleted_products} produit(s).",
@@ -683,7 +1344,8 @@ def famille(request):
                 return redirect("famille")
 
             moved_count = fam.produits.count()
-            fam.produits.update(famille=fallback_famille)
+            fam.produits.update(famille=fallback_famille, modifie_le=timezone.now())
+            reassign_famille(fam.id, fallback_famille.id)
             fam_name = fam.nom
             fam.delete()
             bump_data_version()
@@ -713,7 +1375,7 @@ def famille(request):
 
             old_name = fam.nom
             fam.nom = new_name
-            fam.save(update_fields=["nom"])
+            fam.save(update_fields=["nom", "modifie_le"])
             bump_data_version()
             messages.success(request, f"Famille modifiee: '{old_name}' -> '{new_name}'.")
             return redirect("famille")
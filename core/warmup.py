@@ -0,0 +1,94 @@
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.urls import get_resolver
+from django.utils import timezone
+
+from .expiry import expiry_state
+from .fuzzy import get_fuzzy_index
+from .horizon import cached_expiry_horizon
+from .stock_status import critical_products, site_summaries, status_counters
+from .views import DASHBOARD_CRITICAL_PAGE
+
+
+# Prechauffage d'un processus avant ses premieres requetes.
+#
+# Sous gunicorn --preload (start.sh), le master importe l'application puis
+# appelle warm_process() avant de forker (hook when_ready de
+# gunicorn.conf.py) : imports, templates compiles (chargeur cached), index
+# des codes du resolver et index fuzzy sont construits une fois et herites
+# par chaque worker ; compteurs et resumes par site vont dans le cache
+# partage (CACHES), lu par tous les workers.
+# La commande warmup lance les memes etapes hors serveur pour les mesurer.
+
+HORIZON_DEFAULT = "week"
+
+
+def _template_names():
+    names = []
+    for directory in settings.TEMPLATES[0]["DIRS"]:
+        root = Path(directory)
+        names.extend(
+            path.relative_to(root).as_posix()
+            for path in sorted(root.rglob("*"))
+            if path.is_file() and path.suffix in {".html", ".txt"}
+        )
+    return names
+
+
+def _warm_urls():
+    # Charge l'URLconf et remplit les tables de reverse().
+    resolver = get_resolver()
+    resolver.reverse_dict
+    return len(resolver.url_patterns)
+
+
+def _warm_templates():
+    names = _template_names()
+    for name in names:
+        get_template(name)
+    return len(names)
+
+
+def _warm_code_index():
+    codes, _ = get_fuzzy_index()
+    return len(codes)
+
+
+def _warm_status():
+    critical_products(limit=DASHBOARD_CRITICAL_PAGE)
+    return status_counters()["total"]
+
+
+def _warm_horizon():
+    return len(cached_expiry_horizon(HORIZON_DEFAULT)["periodes"])
+
+
+def warm_process(today=None):
+    """Prechauffe le processus courant ; retourne [(etape, ms, resultat)].
+
+    Les connexions a la base sont fermees a la fin : un master gunicorn ne
+    doit pas en transmettre a ses workers.
+    """
+    today = today or timezone.now().date()
+    steps = [
+        ("urls", _warm_urls),
+        ("templates", _warm_templates),
+        ("expiry", lambda: expiry_state(today) or "a jour"),
+        ("code_index", _warm_code_index),
+        ("status", _warm_status),
+        ("sites", lambda: len(site_summaries(today))),
+        ("horizon", _warm_horizon),
+    ]
+    timings = []
+    try:
+        for name, step in steps:
+            start = time.perf_counter()
+            result = step()
+            timings.append((name, (time.perf_counter() - start) * 1000.0, result))
+    finally:
+        connections.close_all()
+    return timings
@@ -0,0 +1,32 @@
+# Lu automatiquement par gunicorn depuis la racine du projet.
+import gc
+import os
+
+
+def when_ready(server):
+    # Avec --preload (start.sh), l'application est deja importee dans le
+    # master : on la prechauffe avant de forker les workers, qui heritent des
+    # templates compiles, de l'index des codes et des caches locaux.
+    if not server.cfg.preload_app:
+        return
+    from core.warmup import warm_process
+
+    timings = warm_process()
+    server.log.info(
+        "Warmup: %s",
+        ", ".join(f"{name} {elapsed:.0f}ms" for name, elapsed, _ in timings),
+    )
+    # Objets du master hors du ramasse-miettes : les pages restent partagees
+    # (copy-on-write) au lieu d'etre recopiees par chaque worker.
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    # Retire les gauges "live" d'un worker arrete des metriques agregees.
+    if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        return
+    try:
+        from prometheus_client import multiprocess
+    except ImportError:
+        return
+    multiprocess.mark_process_dead(worker.pid)
@@ -1,4 +1,13 @@
 #!/usr/bin/env bash
 
 python manage.py migrate
-gunicorn config.wsgi:application --bind 0.0.0.0:$PORT
+# Metriques partagees entre workers : repertoire vide a chaque demarrage.
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/lab-stock-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR" && mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+# --preload : l'application est importee et prechauffee (core/warmup.py) une
+# fois dans le master avant le fork. PRELOAD=0 revient au demarrage a froid.
+PRELOAD_ARGS=()
+if [ "${PRELOAD:-1}" != "0" ]; then
+  PRELOAD_ARGS=(--preload)
+fi
+gunicorn config.asgi:application -k uvicorn_worker.UvicornWorker "${PRELOAD_ARGS[@]}" --bind 0.0.0.0:$PORT
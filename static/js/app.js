@@ -70,10 +70,25 @@ function installBarcodeFlow() {
 
   if (!barcodeInput || !table) return;
 
+  const previewBox = document.getElementById("fefo-preview");
   const productEl = document.getElementById("preview-product");
+  const stockEl = document.getElementById("preview-stock");
   const entryEl = document.getElementById("preview-entry");
   const expEl = document.getElementById("preview-exp");
+  const qtyInput = document.getElementById("id_quantite");
+  const siteInput = document.getElementById("id_site");
+  const previewUrl = previewBox ? previewBox.dataset.url : "";
+  const suggestionsBox = document.getElementById("code-suggestions");
+  const suggestionList = suggestionsBox ? suggestionsBox.querySelector("[data-suggestion-list]") : null;
 
+  const showPreview = (product, stock, entry, exp) => {
+    productEl.textContent = product;
+    if (stockEl) stockEl.textContent = stock;
+    entryEl.textContent = entry;
+    expEl.textContent = exp;
+  };
+
+  // Fallback sans endpoint : lecture des lignes FEFO affichees.
   const rows = Array.from(table.querySelectorAll("tbody tr"));
   const pickFefo = (value) => {
     const normalized = value.trim().toLowerCase();
@@ -91,22 +106,104 @@ function installBarcodeFlow() {
     return candidates[0];
   };
 
-  const updatePreview = () => {
+  const updateLocalPreview = () => {
     const fefo = pickFefo(barcodeInput.value.trim());
     if (!fefo) {
-      productEl.textContent = "Non trouvé";
-      entryEl.textContent = "-";
-      expEl.textContent = "-";
+      showPreview("Non trouvé", "-", "-", "-");
       return;
     }
+    showPreview(fefo.dataset.product, fefo.dataset.qty || "-", fefo.dataset.entry || "-", fefo.dataset.exp);
+  };
 
-    productEl.textContent = fefo.dataset.product;
-    entryEl.textContent = fefo.dataset.entry || "-";
-    expEl.textContent = fefo.dataset.exp;
+  // Code inconnu : produits aux codes les plus proches, un clic remplit le champ.
+  const hideSuggestions = () => {
+    if (!suggestionsBox) return;
+    suggestionsBox.classList.add("d-none");
+    suggestionList.replaceChildren();
+  };
+
+  const showSuggestions = (code, signal) => {
+    if (!suggestionsBox) return;
+    fetch(`${suggestionsBox.dataset.url}?${new URLSearchParams({ code })}`, {
+      signal,
+      headers: { Accept: "application/json" },
+    })
+      .then((response) => (response.ok ? response.json() : Promise.reject(response.status)))
+      .then((data) => {
+        suggestionList.replaceChildren();
+        data.suggestions.forEach((item) => {
+          const button = document.createElement("button");
+          button.type = "button";
+          button.className = "btn btn-sm btn-outline-primary";
+          button.textContent = `${item.reference} · ${item.barcode}`;
+          button.title = item.nom;
+          button.addEventListener("click", () => {
+            barcodeInput.value = item[item.champ];
+            hideSuggestions();
+            schedulePreview();
+            barcodeInput.focus();
+          });
+          suggestionList.appendChild(button);
+        });
+        suggestionsBox.classList.toggle("d-none", data.suggestions.length === 0);
+      })
+      .catch(() => {});
+  };
+
+  // Preview serveur : debounce + annulation des requetes obsoletes.
+  let debounceTimer = null;
+  let controller = null;
+
+  const fetchPreview = () => {
+    const code = barcodeInput.value.trim();
+    if (controller) controller.abort();
+    hideSuggestions();
+    if (!code) {
+      showPreview("-", "-", "-", "-");
+      return;
+    }
+
+    controller = new AbortController();
+    const params = new URLSearchParams({ code, quantite: (qtyInput && qtyInput.value) || "1" });
+    if (siteInput && siteInput.value) params.set("site", siteInput.value);
+    fetch(`${previewUrl}?${params}`, { signal: controller.signal, headers: { Accept: "application/json" } })
+      .then((response) => (response.ok ? response.json() : Promise.reject(response.status)))
+      .then((data) => {
+        if (!data.found) {
+          showPreview("Non trouvé", "-", "-", "-");
+          showSuggestions(code, controller.signal);
+          return;
+        }
+        const product = data.produit.nom || data.produit.reference;
+        const next = data.lots[0];
+        if (!next) {
+          showPreview(product, "0 (aucun lot valide)", "-", "-");
+          return;
+        }
+        const stock = data.suffisant
+          ? String(data.stock_disponible)
+          : `${data.stock_disponible} (insuffisant)`;
+        showPreview(product, stock, next.date_entree, next.date_fin);
+      })
+      .catch((error) => {
+        if (error && error.name === "AbortError") return;
+        updateLocalPreview();
+      });
+  };
+
+  const schedulePreview = () => {
+    if (!previewUrl) {
+      updateLocalPreview();
+      return;
+    }
+    clearTimeout(debounceTimer);
+    debounceTimer = setTimeout(fetchPreview, 150);
   };
 
   barcodeInput.focus();
-  barcodeInput.addEventListener("input", updatePreview);
+  barcodeInput.addEventListener("input", schedulePreview);
+  if (qtyInput) qtyInput.addEventListener("input", schedulePreview);
+  if (siteInput) siteInput.addEventListener("change", schedulePreview);
 }
 
 function installLotProductLookup() {
@@ -158,9 +255,36 @@ function installLotsAlertFilter() {
   });
 }
 
+function installLoadMore() {
+  document.querySelectorAll("[data-more-url]").forEach((button) => {
+    const target = document.getElementById(button.dataset.moreTarget);
+    if (!target) return;
+
+    button.addEventListener("click", () => {
+      button.disabled = true;
+      const params = new URLSearchParams({ offset: button.dataset.moreOffset });
+      fetch(`${button.dataset.moreUrl}?${params}`, { headers: { Accept: "application/json" } })
+        .then((response) => (response.ok ? response.json() : Promise.reject(response.status)))
+        .then((data) => {
+          target.insertAdjacentHTML("beforeend", data.html);
+          if (data.next === null) {
+            button.remove();
+            return;
+          }
+          button.dataset.moreOffset = data.next;
+          button.disabled = false;
+        })
+        .catch(() => {
+          button.disabled = false;
+        });
+    });
+  });
+}
+
 installTableSearch();
 installTableFilter();
 installTableSort();
 installBarcodeFlow();
 installLotProductLookup();
 installLotsAlertFilter();
+installLoadMore();